@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for the trades and fees from the REST API
+
+import unittest
+from unittest import TestCase
+
+from modules.ApiHistory import ApiHistory
+from modules.Feeer import Feeer
+
+
+class ApiHistoryTest(TestCase):
+
+    # Two identical trades in the same second, only the IDs tell their fees apart
+    TRANSACTIONS = [
+        {'id': '5a0f6c6e-1', 'market': 'BTC-PLN', 'time': '1546723534000', 'amount': '0.5', 'rate': '1000',
+         'initializedBy': 'Sell', 'wasTaker': True, 'userAction': 'Sell', 'offerId': 'o-1', 'commissionValue': None},
+        {'id': '5a0f6c6e-2', 'market': 'BTC-PLN', 'time': '1546723534000', 'amount': '0.5', 'rate': '1000',
+         'initializedBy': 'Sell', 'wasTaker': True, 'userAction': 'Sell', 'offerId': 'o-2', 'commissionValue': None},
+        {'id': '5a0f6c6e-0', 'market': 'BTC-PLN', 'time': '1546723200000', 'amount': '1', 'rate': '1000',
+         'initializedBy': 'Buy', 'wasTaker': False, 'userAction': 'Buy', 'offerId': 'o-0', 'commissionValue': None},
+    ]
+    BALANCE_HISTORY = [
+        {'historyId': 'h-3', 'detailId': '5a0f6c6e-2', 'time': 1546723534000, 'type': 'TRANSACTION_COMMISSION_OUTCOME',
+         'value': -2.0, 'balance': {'currency': 'PLN'}, 'fundsAfter': {'total': 100.0}},
+        {'historyId': 'h-2', 'detailId': '5a0f6c6e-2', 'time': 1546723534000, 'type': 'TRANSACTION_SETTLEMENT',
+         'value': 500.0, 'balance': {'currency': 'PLN'}, 'fundsAfter': {'total': 102.0}},
+        {'historyId': 'h-1', 'detailId': '5a0f6c6e-1', 'time': 1546723534000, 'type': 'TRANSACTION_COMMISSION_OUTCOME',
+         'value': -1.0, 'balance': {'currency': 'PLN'}, 'fundsAfter': {'total': 102.0}},
+        {'historyId': 'h-0', 'detailId': '5a0f6c6e-0', 'time': 1546723200000, 'type': 'TRANSACTION_COMMISSION_OUTCOME',
+         'value': -1e-05, 'balance': {'currency': 'BTC'}, 'fundsAfter': {'total': 0.99999}},
+    ]
+
+    def test_to_lol(self):
+        transactions = ApiHistory.transactions_to_lol(self.TRANSACTIONS)
+        self.assertEqual(transactions[0][-1], 'ID')
+        self.assertEqual(transactions[1], ['BTC - PLN', '05-01-2019 22:25:34', 'Sprzedaż', 'Taker', '1000', '0.50000000',
+                                           '500.00', '5a0f6c6e-1'])
+        self.assertEqual(transactions[3][2:4], ['Kupno', 'Maker'])
+
+        fees = ApiHistory.fees_to_lol(self.BALANCE_HISTORY)
+        self.assertEqual(len(fees), 4)
+        self.assertEqual(fees[3], ['05-01-2019 22:20:00', 'Pobranie prowizji za transakcję: BTC', '0.00001',
+                                   '0.99999', '5a0f6c6e-0'])
+
+    def test_fees_joined_on_trade_ids(self):
+        rows = Feeer.include_fees(ApiHistory.transactions_to_lol(self.TRANSACTIONS),
+                                  ApiHistory.fees_to_lol(self.BALANCE_HISTORY))
+        self.assertEqual([(row[-2], row[-1]) for row in rows[1:]],
+                         [('5a0f6c6e-1', '1.0'), ('5a0f6c6e-2', '2.0'), ('5a0f6c6e-0', '0.01')])
+
+    def test_trade_without_commission(self):
+        # A maker trade with a 0% fee has no commission operation
+        balance_history = [item for item in self.BALANCE_HISTORY if item['historyId'] != 'h-1']
+        rows = Feeer.include_fees(ApiHistory.transactions_to_lol(self.TRANSACTIONS),
+                                  ApiHistory.fees_to_lol(balance_history))
+        self.assertEqual([(row[-2], row[-1]) for row in rows[1:]],
+                         [('5a0f6c6e-1', '0'), ('5a0f6c6e-2', '2.0'), ('5a0f6c6e-0', '0.01')])
+
+
+if __name__ == '__main__':
+    unittest.main()
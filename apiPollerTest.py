@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for the API poller
+
+import os
+import random
+import tempfile
+import unittest
+from unittest import TestCase
+
+from modules.ApiPoller import ApiPoller
+
+
+class FakeApi:
+    """
+    Operations in the order of time, pages of the newest ones, on a fake clock. IDs increase by default.
+    """
+
+    def __init__(self, make_id=str):
+        self.now = 0.0
+        self.make_id = make_id
+        self.operations = []
+        # time -> number of operations that appear then
+        self.bursts = {}
+
+    def add_operations(self, count):
+        for _ in range(0, count):
+            self.operations.append({'id': self.make_id(len(self.operations) + 1), 'time': int(self.now)})
+
+    def sleep(self, seconds):
+        for time in sorted(self.bursts):
+            if self.now < time <= self.now + seconds:
+                self.add_operations(self.bursts[time])
+        self.now += seconds
+
+    def fetch(self, currency, limit, before_id):
+        operations = self.operations[::-1]
+        if before_id is not None:
+            operations = operations[[o['id'] for o in operations].index(before_id) + 1:]
+        return operations[:limit]
+
+
+class ApiPollerTest(TestCase):
+
+    def test_no_gaps_and_adaptive_interval(self):
+        api = FakeApi()
+        api.add_operations(25)
+        # A burst much larger than a page, then quiet
+        api.bursts = {30.0: 37, 35.0: 3}
+        received = []
+        with tempfile.TemporaryDirectory() as tmp:
+            state_path = os.path.join(tmp, 'state.json')
+            poller = ApiPoller(api.fetch, ['PLN'], state_path, lambda currency, ops: received.extend(ops), limit=10,
+                               min_interval=5.0, max_interval=80.0, timefunc=lambda: api.now, delayfunc=api.sleep)
+            poller.run(polls=8)
+
+            self.assertEqual([o['id'] for o in received], [str(i) for i in range(1, 26 + 40)])
+            # Halved after the burst, doubled while quiet
+            self.assertEqual(poller.state['PLN']['interval'], 80.0)
+
+            restarted = ApiPoller(api.fetch, ['PLN'], state_path, None)
+            self.assertEqual(restarted.state['PLN']['newest_id'], '65')
+
+    def test_ids_not_in_order(self):
+        # Like UUIDs: neither numbers nor growing
+        ids = ['{:08x}'.format(random.Random(n).getrandbits(32)) for n in range(0, 100)]
+        api = FakeApi(make_id=lambda n: ids[n])
+        api.add_operations(25)
+        api.bursts = {30.0: 37, 35.0: 3}
+        received = []
+        with tempfile.TemporaryDirectory() as tmp:
+            state_path = os.path.join(tmp, 'state.json')
+            poller = ApiPoller(api.fetch, ['PLN'], state_path, lambda currency, ops: received.extend(ops), limit=10,
+                               min_interval=5.0, max_interval=80.0, timefunc=lambda: api.now, delayfunc=api.sleep)
+            poller.run(polls=4)
+
+            # More operations while stopped
+            api.add_operations(12)
+            restarted = ApiPoller(api.fetch, ['PLN'], state_path, lambda currency, ops: received.extend(ops),
+                                  limit=10, timefunc=lambda: api.now, delayfunc=api.sleep)
+            restarted.run(polls=1)
+
+        self.assertEqual(received, api.operations)
+
+    def test_fetch_fails_once(self):
+        api = FakeApi()
+        api.add_operations(25)
+        api.bursts = {30.0: 7}
+        failures = [ConnectionError('timed out')]
+
+        def fetch(currency, limit, before_id):
+            # The second page of the first poll
+            if before_id is not None and failures:
+                raise failures.pop()
+            return api.fetch(currency, limit, before_id)
+
+        received = []
+        with tempfile.TemporaryDirectory() as tmp:
+            state_path = os.path.join(tmp, 'state.json')
+            poller = ApiPoller(fetch, ['PLN'], state_path, lambda currency, ops: received.extend(ops), limit=10,
+                               min_interval=5.0, max_interval=80.0, timefunc=lambda: api.now, delayfunc=api.sleep)
+            with self.assertLogs('bitbay_tax_calculator', 'WARNING') as logs:
+                poller.run(polls=4)
+
+            self.assertIn('"PLN": fetch failed ("ConnectionError: timed out"), next poll in "10.0" s', logs.output[0])
+            self.assertEqual(received, api.operations)
+            self.assertEqual(len(received), 32)
+
+
+if __name__ == '__main__':
+    unittest.main()
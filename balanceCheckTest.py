@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for the balance check of the histories
+
+import unittest
+from unittest import TestCase
+
+from modules.BalanceCheck import BalanceCheck
+from modules.HistoryGenerator import HistoryGenerator
+from modules.ExportMerger import ExportMerger
+
+
+class BalanceCheckTest(TestCase):
+
+    def test_consistent_histories(self):
+        for seed in range(0, 10):
+            case = HistoryGenerator(seed).generate(15)
+            for reverse in (False, True):
+                self.assertEqual(BalanceCheck.check(*HistoryGenerator.render(dict(case, reversed=reverse))), [])
+
+    def test_missing_block(self):
+        case = HistoryGenerator(4).generate(30)
+        # A block of whole bursts not pasted, in both histories
+        dates = sorted(set(fees_row[0] for tran_row, fees_row in case['entries']), key=ExportMerger.get_sort_key)
+        missing = set(dates[10:13])
+        case['entries'] = [entry for entry in case['entries'] if entry[1][0] not in missing]
+        transactions_data, fees_data = HistoryGenerator.render(dict(case, reversed=False))
+
+        # First row after the gap
+        after = next(i for i in range(1, len(transactions_data))
+                     if ExportMerger.get_sort_key(transactions_data[i][1]) > ExportMerger.get_sort_key(dates[12]))
+
+        divergences = BalanceCheck.check(transactions_data, fees_data)
+        self.assertTrue(divergences)
+        for divergence in divergences:
+            self.assertEqual(divergence['kind'], 'balance')
+            (tran_first, tran_last), (fees_first, fees_last) = divergence['rows']
+            # The gap is within the range reported
+            self.assertLess(tran_first, after)
+            self.assertGreaterEqual(tran_last, after)
+
+    def test_missing_and_duplicated_fees(self):
+        transactions_data, fees_data = HistoryGenerator.render(HistoryGenerator(5).generate(10))
+        self.assertEqual(BalanceCheck.check(transactions_data, fees_data[:3] + fees_data[4:])[0]['kind'], 'count')
+
+        duplicated = BalanceCheck.check(transactions_data[:4] + transactions_data[3:], fees_data[:4] + fees_data[3:])
+        self.assertIn('duplicate', [divergence['kind'] for divergence in duplicated])
+        self.assertTrue(BalanceCheck.format(duplicated[0]).startswith('transactions lines'))
+
+    def test_missing_last_group(self):
+        for reverse in (False, True):
+            transactions_data, fees_data = HistoryGenerator.render(dict(HistoryGenerator(6).generate(10),
+                                                                        reversed=reverse))
+            # The last group of one of the histories not pasted
+            last_date = transactions_data[-1][1]
+            cut_transactions = [row for row in transactions_data if row[1] != last_date]
+            cut_fees = [row for row in fees_data if row[0] != last_date]
+
+            for divergences in (BalanceCheck.check(cut_transactions, fees_data),
+                                BalanceCheck.check(transactions_data, cut_fees)):
+                self.assertEqual(divergences[-1]['kind'], 'count')
+                self.assertTrue(BalanceCheck.format(divergences[-1]).startswith('transactions lines'))
+            self.assertEqual(BalanceCheck.check(cut_transactions, fees_data)[-1]['expected'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
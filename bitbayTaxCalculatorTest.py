@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for the watch mode of the calculator
+
+import argparse
+import csv
+import os
+import tempfile
+import unittest
+from unittest import TestCase, mock
+
+import bitbay_tax_calculator
+from modules.HistoryGenerator import HistoryGenerator
+from modules.Oracle import Oracle, reference_engine
+
+
+class StopWatching(Exception):
+    pass
+
+
+class FakeWatcher:
+    """
+    Runs the given steps instead of waiting for the files, each one returns the paths it changed
+    """
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self.paths = []
+
+    def __call__(self, paths, debounce, poll_interval):
+        self.paths = paths
+        return self
+
+    def refresh(self, path):
+        pass
+
+    def wait_for_changes(self):
+        if not self.steps:
+            raise StopWatching()
+        return self.steps.pop(0)()
+
+
+class BitbayTaxCalculatorTest(TestCase):
+
+    @staticmethod
+    def write_csv(path, data):
+        with open(path, 'w', newline='', encoding="utf-8") as csvfile:
+            csv.writer(csvfile, delimiter=';').writerows(data)
+
+    def test_watch(self):
+        transactions_data, fees_data = HistoryGenerator.render(HistoryGenerator(4).generate(10))
+        with tempfile.TemporaryDirectory() as tmp:
+            transactions_path = os.path.join(tmp, 'transactions.csv')
+            fees_path = os.path.join(tmp, 'fees.csv')
+            output = bitbay_tax_calculator.get_output_path(transactions_path)
+            ap = argparse.ArgumentParser()
+            bitbay_tax_calculator.add_arguments(ap)
+            args = ap.parse_args([transactions_path, fees_path, '--watch'])
+
+            def write_transactions():
+                self.write_csv(transactions_path, transactions_data)
+                return {transactions_path}
+
+            def write_fees_cut():
+                # A paste in progress, no output until it is complete
+                self.write_csv(fees_path, fees_data[:1] + [row[:2] for row in fees_data[1:]])
+                return {fees_path}
+
+            def write_fees():
+                self.assertFalse(os.path.exists(output))
+                self.write_csv(fees_path, fees_data)
+                return {fees_path}
+
+            # Only the transactions at first, the fees are not there yet
+            watcher = FakeWatcher([write_transactions, write_fees_cut, write_fees])
+            with mock.patch('modules.FileWatcher.FileWatcher', watcher), self.assertRaises(StopWatching):
+                bitbay_tax_calculator.watch(args, output)
+
+            self.assertEqual(watcher.paths[:2], [transactions_path, fees_path])
+            expected = Oracle.run(reference_engine, transactions_data, fees_data)
+            # Followed by the notes
+            self.assertEqual(bitbay_tax_calculator.read_csv(output)[:len(expected)], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
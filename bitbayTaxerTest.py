@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for the start-up cost of the single entry point
+
+import os
+import subprocess
+import sys
+import unittest
+from unittest import TestCase
+
+from bitbay_taxer import COMMANDS
+from startup_benchmark import HEAVY_MODULES
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class BitbayTaxerTest(TestCase):
+
+    def get_imported(self, argv):
+        code = ('import sys, bitbay_taxer; bitbay_taxer.get_arg_parser({!r}); '
+                'print(" ".join(sys.modules))').format(argv)
+        output = subprocess.run([sys.executable, '-c', code], cwd=HERE, stdout=subprocess.PIPE, check=True)
+        return output.stdout.decode().split()
+
+    def test_no_subcommand_imported_for_help(self):
+        imported = self.get_imported([])
+        command_modules = [module for module, logger, help in COMMANDS.values()]
+        self.assertEqual([m for m in imported if m.startswith('modules') or m in command_modules], [])
+
+    def test_no_heavy_imports(self):
+        for command in COMMANDS:
+            imported = self.get_imported([command])
+            self.assertEqual([m for m in HEAVY_MODULES if m in imported], [], command)
+            other_modules = [module for c, (module, logger, help) in COMMANDS.items() if c != command]
+            self.assertEqual([m for m in other_modules if m in imported], [], command)
+
+
+if __name__ == '__main__':
+    unittest.main()
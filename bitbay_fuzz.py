@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+import argparse
+import os
+import sys
+
+import logging
+
+from modules.Oracle import Oracle
+from modules.HistoryGenerator import HistoryGenerator
+from modules.HistoryConverter import HistoryConverter
+from modules.Logger import setup_log
+
+log = logging.getLogger('bitbay_tax_calculator')
+
+DESCRIPTION = ('Program compares an alternative engine with the reference calculations on random histories, '
+               'cell by cell. Exits with 1 and a minimal reproducer when they differ.')
+
+
+def add_arguments(ap):
+    ap.add_argument('--engine', choices=sorted(Oracle.ENGINES), action='append',
+                    help='Engine to check, all by default. Can be repeated.')
+    ap.add_argument('--cases', type=int, default=200, help='Random histories per engine')
+    ap.add_argument('--seed', type=int, default=0, help='Seed of the random histories')
+    ap.add_argument('--bursts', type=int, default=20, help='Maximum number of orders in a history')
+    ap.add_argument('--save-dir', help='Save the minimal failing histories as CSV files here')
+    ap.add_argument('-v', '--verbose', help='Print more messages', action='store_true')
+    ap.add_argument('--logfile', help='Logfile for all the messages')
+
+
+def main(args):
+    failed = False
+    for name in args.engine or sorted(Oracle.ENGINES):
+        log.info('Check engine "{}" on "{}" histories'.format(name, args.cases))
+        result = Oracle.fuzz(Oracle.ENGINES[name], args.cases, args.seed, args.bursts)
+        if result is None:
+            log.info('Engine "{}": OK'.format(name))
+            continue
+
+        failed = True
+        case, differences = result
+        log.error('Engine "{}" differs on a history of "{}" entries:'.format(name, len(case['entries'])))
+        for difference in differences:
+            log.error('  {}'.format(difference))
+
+        transactions_data, fees_data = HistoryGenerator.render(case)
+        if args.save_dir:
+            os.makedirs(args.save_dir, exist_ok=True)
+            for history_type, data in (('transactions', transactions_data), ('fees', fees_data)):
+                path = os.path.join(args.save_dir, '{}_{}_history.csv'.format(name, history_type))
+                HistoryConverter.write_csv(path, data)
+                log.error('Reproducer saved as: "{}"'.format(path))
+        else:
+            for row in transactions_data + [[]] + fees_data:
+                print(';'.join(row))
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(ap)
+    args = ap.parse_args()
+    setup_log('bitbay_tax_calculator', args.verbose, args.logfile)
+    main(args)
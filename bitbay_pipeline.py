@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+import argparse
+
+import logging
+
+import hashlib
+
+from modules.HistoryConverter import HistoryConverter
+from modules.TaxIndex import TaxIndex
+from modules.StageCache import StageCache
+from modules.Logger import setup_log
+
+log = logging.getLogger('bitbay_tax_calculator')
+
+DESCRIPTION = ('Program runs the whole chain in memory: "copy-paste" .txt conversion, fees, FIFO gains, PCC '
+               'and optionally the Google Sheets upload. Files are written only when asked for.')
+
+
+def add_arguments(ap):
+    ap.add_argument('transactions', help='Transactions history, a "copy-paste" .txt file, a bitbay CSV file '
+                                         'or a directory of CSV files')
+    ap.add_argument('fees', help='Fees history, a "copy-paste" .txt file, a bitbay CSV file or a directory '
+                                 'of CSV files')
+    ap.add_argument('--rates-dir', help='Directory with NBP exchange rates tables, see bitbay_tax_calculator.py')
+    ap.add_argument('--prices', nargs=2, action='append', metavar=('CURRENCY', 'FILE'),
+                    help='PLN price history of a crypto currency, see bitbay_tax_calculator.py')
+    ap.add_argument('--save-intermediate', help='Save the converted CSV files next to the .txt files',
+                    action='store_true')
+    ap.add_argument('--save-output', help='Save the _tax.csv file (and its index) next to the transactions file',
+                    action='store_true')
+    ap.add_argument('--cache-dir', help='Cache the output of every stage here, unchanged stages are skipped on the '
+                                        'next run')
+    ap.add_argument('--cache-size', type=int, default=512, help='MB of the cache, least recently used entries '
+                                                                'are evicted above it')
+    ap.add_argument('--upload', nargs=2, metavar=('CLIENTSECRET', 'SHEET_ID'),
+                    help='Upload the results into Google Sheets, see bitbay_gsheets_uploader.py')
+    ap.add_argument('-v', '--verbose', help='Print more messages', action='store_true')
+    ap.add_argument('--logfile', help='Logfile for all the messages')
+
+
+def load(path, history_type, save_intermediate, cache=None):
+    """
+    :param cache: StageCache for the conversion
+    :return: List of lists in the bitbay CSV format, headers first
+    """
+    import bitbay_tax_calculator
+
+    if not path.endswith('.txt'):
+        log.info('Read the {} data from: "{}"'.format(history_type, path))
+        return bitbay_tax_calculator.read_csv(path)
+
+    log.info('Convert the {} data from: "{}"'.format(history_type, path))
+    if cache is None:
+        data = HistoryConverter.convert_file(path, history_type)
+    else:
+        with open(path, 'rb') as txt_file:
+            content_key = hashlib.sha1(txt_file.read()).hexdigest()
+        data = cache.run(StageCache.get_key('convert', [HistoryConverter], history_type, content_key),
+                         lambda: HistoryConverter.convert_file(path, history_type))
+    if save_intermediate:
+        output = HistoryConverter.get_output_path(path)
+        HistoryConverter.write_csv(output, data)
+        log.info('Intermediate CSV saved as: "{}"'.format(output))
+
+    return data
+
+
+def calculate_cached(transactions_data, fees_data, rates, rates_key, cache):
+    """
+    bitbay_tax_calculator.calculate() stage by stage, each of them cached
+    :param rates_key: Text key of the exchange rates and prices
+    """
+    from modules.Feeer import Feeer
+    from modules.Taxer import Taxer
+    from modules.LotPool import LotPool
+    from modules.ParallelFifo import ParallelFifo
+    from modules.PriceIndex import PriceIndex
+    from modules.Money import Money
+    from modules.ExchangeRates import ExchangeRates
+    from modules.Checkpoint import Checkpoint
+
+    # We should have the same number of transactions and fees
+    assert len(transactions_data) == len(fees_data)
+
+    input_key = '|'.join([Checkpoint.hash_rows(transactions_data).hexdigest(),
+                          Checkpoint.hash_rows(fees_data).hexdigest(), rates_key])
+    stages = [
+        ('fees', [Feeer, Taxer, Money, ExchangeRates, PriceIndex],
+         lambda data: Feeer.include_fees(data[0], data[1], rates)),
+        ('fifo', [Taxer, LotPool, ParallelFifo, Money, ExchangeRates, PriceIndex],
+         lambda data: Taxer.calculate_gain_fifo(data, rates)),
+        ('pcc', [Taxer, Money, ExchangeRates, PriceIndex], lambda data: Taxer.calculate_pcc(data, rates)),
+    ]
+    return cache.run_chain(stages, input_key, (transactions_data, fees_data))
+
+
+def main(args):
+    # The other tools, only when running
+    import bitbay_tax_calculator
+
+    cache = StageCache(args.cache_dir, args.cache_size * 1024 * 1024) if args.cache_dir else None
+    transactions_data = load(args.transactions, 'transactions', args.save_intermediate, cache)
+    fees_data = load(args.fees, 'fees', args.save_intermediate, cache)
+
+    rates = bitbay_tax_calculator.load_rates(args.rates_dir, args.prices)
+    if cache is None:
+        transactions_data = bitbay_tax_calculator.calculate(transactions_data, fees_data, rates)
+    else:
+        transactions_data = calculate_cached(transactions_data, fees_data, rates,
+                                             bitbay_tax_calculator.get_rates_key(args.rates_dir, args.prices), cache)
+
+    index = TaxIndex.build(transactions_data)
+    for year in index.get_years():
+        totals = index.query_year(year)
+        log.info('{}: {}'.format(year, ', '.join('{}: {}'.format(c, totals[c]) for c in TaxIndex.COLUMNS)))
+
+    if args.save_output:
+        bitbay_tax_calculator.save_output(transactions_data, bitbay_tax_calculator.get_output_path(args.transactions))
+
+    if args.upload:
+        # Google libraries only when needed
+        import bitbay_gsheets_uploader
+        bitbay_gsheets_uploader.upload(transactions_data + bitbay_tax_calculator.FOOTER, *args.upload)
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(ap)
+    args = ap.parse_args()
+    setup_log('bitbay_tax_calculator', args.verbose, args.logfile)
+    main(args)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+import argparse
+from datetime import datetime
+
+import logging
+
+from modules.LotLedger import LotLedger
+from modules.TaxService import TaxService
+from modules.Taxer import Taxer
+from modules.Money import Amount, Rate
+from modules.FastCsv import FastCsv
+from modules.Logger import setup_log
+
+log = logging.getLogger('bitbay_tax_calculator')
+
+DESCRIPTION = ('Program quotes the FIFO income, cost and gain of a planned SELL against the open BUY lots, '
+               'without adding it to the history')
+
+
+def add_arguments(ap):
+    ap.add_argument('source', help='The _tax.csv output of bitbay_tax_calculator.py, or a YTD state (.json) of '
+                                   'bitbay_ytd.py')
+    ap.add_argument('market', help='e.g. "BTC - PLN"')
+    ap.add_argument('amount', nargs='+', help='Amount to sell, e.g. 0.5. Can be repeated, each one quoted')
+    ap.add_argument('--rate', required=True, help='Rate of the SELL, e.g. 20000')
+    ap.add_argument('--date', help='Date of the SELL (dd-mm-YYYY HH:MM:SS), for the exchange rate of a market not '
+                                   'quoted in PLN. Now by default')
+    ap.add_argument('--rates-dir', help='Directory with NBP exchange rates tables (archive .csv or API .json files), '
+                                        'required for markets not quoted in PLN, the same as for the source')
+    ap.add_argument('--prices', nargs=2, action='append', metavar=('CURRENCY', 'FILE'),
+                    help='PLN price history of a crypto currency (CSV: timestamp;price or OHLC), required for '
+                         'markets quoted in it. Can be repeated.')
+    ap.add_argument('-v', '--verbose', help='Print more messages', action='store_true')
+
+
+def load_ledger(source, rates=None):
+    """
+    :param rates: ExchangeRates for markets not quoted in PLN
+    :return: LotLedger after all the rows of the source
+    """
+    if source.endswith('.json'):
+        from modules.YtdTracker import YtdTracker
+
+        tracker = YtdTracker(source, rates=rates)
+        tracker.load()
+        return tracker.ledger
+
+    # Amounts and rates as int units, parsed in bulk
+    rows = list(FastCsv.iter_rows(source, types={'Kurs': Rate, 'Ilość': Amount}))
+    # Without the footer
+    rows = [row for row in rows if len(row) == len(rows[0])]
+    return LotLedger.from_data(TaxService.chronological(rows), rates)
+
+
+def main(args):
+    rates = None
+    if args.rates_dir or args.prices:
+        # Only needed for markets not quoted in PLN
+        from bitbay_tax_calculator import load_rates
+
+        rates = load_rates(args.rates_dir, args.prices)
+
+    log.debug('Load the open lots from: "{}"'.format(args.source))
+    ledger = load_ledger(args.source, rates)
+    log.info('Open on "{}": "{}"'.format(args.market, ledger.get_open_amount(args.market)))
+
+    date = args.date or datetime.now().strftime('%d-%m-%Y %H:%M:%S')
+    for amount in args.amount:
+        income, cost, matched = ledger.quote_sell(args.market, Amount.parse(amount), Rate.parse(args.rate), date)
+        gains = Taxer.get_gains_results(income, cost, ledger.scale)
+        if matched < Amount.parse(amount).units:
+            log.warning('Only "{}" of "{}" is covered by the open lots'.format(Amount(matched), amount))
+        print('{:<24} Przychód: {}  Koszt: {}  Dochód: {}'.format('{} @ {}'.format(amount, args.rate),
+                                                                  gains['income'], gains['cost'], gains['gain']))
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(ap)
+    args = ap.parse_args()
+    setup_log('bitbay_tax_calculator', args.verbose)
+    main(args)
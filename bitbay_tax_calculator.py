@@ -3,93 +3,295 @@
 
 import argparse
 
-# https://docs.python.org/3/howto/logging-cookbook.html
 import logging
 
-# https://docs.python.org/3/library/csv.html
-import csv
+import os
 
 from modules.Taxer import Taxer
 from modules.Feeer import Feeer
+from modules.TaxIndex import TaxIndex
+from modules.OutputSinks import CsvSink, JsonLinesSink, PerYearCsvSink, SummarySink, TaxIndexSink, write_to_sinks
+from modules.HistoryConverter import HistoryConverter
+from modules.ExchangeRates import ExchangeRates
+from modules.PriceIndex import PriceIndex
+from modules.Checkpoint import Checkpoint
+from modules.OutOfCore import OutOfCore
+from modules.ExportMerger import ExportMerger
+from modules.BalanceCheck import BalanceCheck
+from modules.Incremental import Incremental
+from modules.Logger import setup_log
 
-#
-# Command line call
-ap = argparse.ArgumentParser(description='Program calculates PL TAX on bitbay.net transactions '
-                                         '+ gains in a FIFO way '
-                                         '+ PCC '
-                                         '+ FEEs in PLN')
-ap.add_argument('transactions', help='A CSV file containing transactions in bitbay export format. '
-                                     'Preferably it contains all relevant transactions for a given year.')
-ap.add_argument('fees', help='A CSV file containing fees in a tweaked bitbay export format. '
-                             'Should correspond to the transactions file above.')
-ap.add_argument('-v', '--verbose', help='Print more messages', action='store_true')
-ap.add_argument('--logfile', help='Logfile for all the messages')
-args = ap.parse_args()
-
-#
-# Log
 log = logging.getLogger('bitbay_tax_calculator')
-log.setLevel(logging.DEBUG)
-# Format
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-# Console handler
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG if args.verbose else logging.INFO)
-ch.setFormatter(formatter)
-log.addHandler(ch)
-# Log file handler
-if args.logfile:
-    fh = logging.FileHandler(args.logfile, encoding="utf-8")
-    fh.setLevel(logging.DEBUG)
-    fh.setFormatter(formatter)
-    log.addHandler(fh)
-
-
-def main():
 
-    log.info('Read the transactions data from: "{}"'.format(args.transactions))
-    transactions_data = []
-    with open(args.transactions, newline='', encoding="utf-8") as csvtransactions:
-        cr = csv.reader(csvtransactions, delimiter=';')
-        for row in cr:
-            transactions_data.append(row)
-    log.debug('Number of rows read: "{}"'.format(len(transactions_data)))
+DESCRIPTION = ('Program calculates PL TAX on bitbay.net transactions '
+               '+ gains in a FIFO way '
+               '+ PCC '
+               '+ FEEs in PLN')
 
-    log.info('Read the fees data from: "{}"'.format(args.fees))
-    fees_data = []
-    with open(args.fees, newline='', encoding="utf-8") as csvfees:
-        cr = csv.reader(csvfees, delimiter=';')
-        for row in cr:
-            fees_data.append(row)
-    log.debug('Number of rows read: "{}"'.format(len(fees_data)))
+# Rows after the data in the output
+FOOTER = [
+    [],
+    ['* Prowizje od kupna kryptowaluty pobierane są w danej w kryptowalucie. '
+     'Przeliczanie na PLN odbywa się po kursie odpowiadającym transakcji '
+     'której prowizja dotyczy. Oznacza to natychmiastowe kupno i sprzedaż kryptowaluty '
+     'czyli brak dochodu do opodatkowania podatkiem dochodowym. '
+     'Podatek PCC zawiera prowizje dla trasakcji kupna.'],
+]
+
+
+def add_arguments(ap):
+    ap.add_argument('transactions', help='A CSV file containing transactions in bitbay export format. '
+                                         'Preferably it contains all relevant transactions for a given year. '
+                                         'Or a directory of such (overlapping quarterly) files, merged.')
+    ap.add_argument('fees', help='A CSV file containing fees in a tweaked bitbay export format. '
+                                 'Should correspond to the transactions file above. Or a directory, as above.')
+    ap.add_argument('--rates-dir', help='Directory with NBP exchange rates tables (archive .csv or API .json files), '
+                                        'required for markets not quoted in PLN')
+    ap.add_argument('--prices', nargs=2, action='append', metavar=('CURRENCY', 'FILE'),
+                    help='PLN price history of a crypto currency (CSV: timestamp;price or OHLC), required for '
+                         'markets quoted in it, e.g. --prices BTC btc_pln.csv for ETH - BTC. Can be repeated.')
+    ap.add_argument('--jsonl', help='Save the rows also as JSON Lines (_tax.jsonl)', action='store_true')
+    ap.add_argument('--per-year', help='Save the rows also split into a CSV file per year (_tax_YYYY.csv)',
+                    action='store_true')
+    ap.add_argument('--summary', help='Save totals per year and market (_tax_summary.csv)', action='store_true')
+    ap.add_argument('--workers', type=int, default=0, help='Processes for the parallel FIFO of very large crypto '
+                                                           'currencies, 0 (default) for serial only')
+    ap.add_argument('--parallel-min-rows', type=int, default=100000,
+                    help='Crypto currencies with at least that many rows (of all their markets) use '
+                         'the parallel FIFO (with --workers)')
+    ap.add_argument('--resume', help='Continue a failed run from its checkpoint (_tax_checkpoint.json), reusing '
+                                     'the matched fee groups and FIFO rows that did not change', action='store_true')
+    ap.add_argument('--checkpoint-interval', type=float, default=30.0,
+                    help='Seconds between checkpoints of a run, 0 for every finished group/row')
+    ap.add_argument('--incremental', help='Recalculate only from the first changed row on, the rows before it are '
+                                          'taken from the previous _tax.csv (state in _tax_incremental.json, '
+                                          'serial only)', action='store_true')
+    ap.add_argument('--snapshot-rows', type=int, default=1000,
+                    help='Rows between the FIFO snapshots of --incremental')
+    ap.add_argument('--memory-budget', type=int, help='Out-of-core mode for histories larger than RAM: MB of memory '
+                                                      'to use, the rest is spilled to disk (no --resume/--workers)')
+    ap.add_argument('--spill-dir', help='Directory for the out-of-core temporary files, system default otherwise')
+    ap.add_argument('--check-balances', help='Before the calculations, replay the balances of all currencies and '
+                                             'stop at rows where they differ from "Saldo po" of the fees (missing '
+                                             'or duplicated rows, but also deposits and withdrawals)',
+                    action='store_true')
+    ap.add_argument('--watch', help='Keep running and recalculate whenever the CSV files, or the "copy-paste" .txt '
+                                   'files next to them, change', action='store_true')
+    ap.add_argument('--debounce', type=float, default=2.0, help='Seconds to wait for further changes in watch mode')
+    ap.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between checks in watch mode, '
+                                                                     'when inotify is not available')
+    ap.add_argument('-v', '--verbose', help='Print more messages', action='store_true')
+    ap.add_argument('--logfile', help='Logfile for all the messages')
+
+
+def read_csv(path):
+    """
+    :param path: A CSV file, or a directory of CSV exports merged by ExportMerger
+    """
+    data = list(ExportMerger.iter_rows(path))
+    log.debug('Number of rows read: "{}"'.format(len(data)))
 
+    return data
+
+
+def get_output_path(transactions):
+    """
+    :param transactions: Path of the transactions CSV file or directory
+    :return: Path of the _tax.csv output
+    """
+    if os.path.isdir(transactions):
+        return transactions.rstrip(os.sep) + '_tax.csv'
+    return transactions[:-4] + '_tax.csv'
+
+
+def calculate(transactions_data, fees_data, rates=None, checkpoint=None, workers=0, parallel_min_rows=100000):
+    """
+    :param rates: ExchangeRates for markets not quoted in PLN
+    :param checkpoint: Checkpoint for the progress of the fees and FIFO stages
+    :param workers: Processes for the parallel FIFO of crypto currencies with at least parallel_min_rows rows
+    """
     # We should have the same number of transactions and fees
     assert len(transactions_data) == len(fees_data)
 
     log.info('Include fees in transaction data')
-    transactions_data = Feeer.include_fees(transactions_data, fees_data)
+    transactions_data = Feeer.include_fees(transactions_data, fees_data, rates, checkpoint)
 
     log.info('Include the gain tax FIFO calculations')
-    transactions_data = Taxer.calculate_gain_fifo(transactions_data)
+    transactions_data = Taxer.calculate_gain_fifo(transactions_data, rates, checkpoint, workers, parallel_min_rows)
 
     log.info('Include the PCC tax calculations')
-    transactions_data = Taxer.calculate_pcc(transactions_data)
+    transactions_data = Taxer.calculate_pcc(transactions_data, rates)
+
+    return transactions_data
+
+
+def check_balances(transactions_data, fees_data):
+    """
+    :raise ValueError: With the number of divergences, each of them logged with its rows
+    """
+    log.info('Check the balances')
+    divergences = BalanceCheck.check(transactions_data, fees_data)
+    for divergence in divergences:
+        log.error(BalanceCheck.format(divergence))
+    if divergences:
+        raise ValueError('Balances differ in "{}" places, see the rows above'.format(len(divergences)))
+
+
+def get_sinks(output, jsonl=False, per_year=False, summary=False):
+    """
+    :param output: Path of the _tax.csv output, the other outputs are named after it
+    :return: List of OutputSink, the CSV and its index always
+    """
+    # Prefix sums for fast date range and per market summaries, see bitbay_tax_query.py
+    sinks = [CsvSink(output, FOOTER), TaxIndexSink(TaxIndex.get_path_for(output))]
+    if jsonl:
+        sinks.append(JsonLinesSink(output[:-4] + '.jsonl'))
+    if per_year:
+        sinks.append(PerYearCsvSink(output[:-4]))
+    if summary:
+        sinks.append(SummarySink(output[:-4] + '_summary.csv'))
+    return sinks
+
+
+def save_output(transactions_data, output, sinks=None):
+    """
+    All the outputs in a single pass over the data
+    :param sinks: List of OutputSink, get_sinks(output) by default
+    """
+    write_to_sinks(transactions_data, sinks if sinks is not None else get_sinks(output))
+    log.info('Done.')
+
+
+def watch(args, output, rates=None):
+    """
+    Stages: .txt -> .csv conversion (per file), reading CSV (per file), fees + FIFO + PCC (both files).
+    Only the stages downstream of a changed file are run again.
+    """
+    # Only needed here (ctypes, select...)
+    from modules.FileWatcher import FileWatcher
+
+    csv_paths = {'transactions': os.path.abspath(args.transactions), 'fees': os.path.abspath(args.fees)}
+    txt_paths = {history_type: path[:-4] + '.txt' for history_type, path in csv_paths.items()}
+
+    watcher = FileWatcher(list(csv_paths.values()) + list(txt_paths.values()), args.debounce, args.poll_interval)
+    log.info('Watching for changes in: {}'.format(watcher.paths))
+
+    # Parsed CSV data, re-read only when the file changes
+    parsed = {}
+    changed = set(csv_paths.values())
+    while True:
+        try:
+            for history_type in csv_paths:
+                if txt_paths[history_type] in changed and os.path.exists(txt_paths[history_type]):
+                    log.info('Convert: "{}"'.format(txt_paths[history_type]))
+                    data = HistoryConverter.convert_file(txt_paths[history_type], history_type)
+                    HistoryConverter.write_csv(csv_paths[history_type], data)
+                    watcher.refresh(csv_paths[history_type])
+                    changed.add(csv_paths[history_type])
+
+                if csv_paths[history_type] in changed:
+                    log.info('Read the {} data from: "{}"'.format(history_type, csv_paths[history_type]))
+                    parsed[history_type] = read_csv(csv_paths[history_type])
+
+            if len(parsed) < len(csv_paths):
+                log.info('Waiting for both histories, missing: {}'.format(
+                    sorted(history_type for history_type in csv_paths if history_type not in parsed)))
+            elif any(path in changed for path in csv_paths.values()):
+                # Calculations change the data in progress
+                transactions_data = calculate([list(row) for row in parsed['transactions']],
+                                              [list(row) for row in parsed['fees']], rates)
+                save_output(transactions_data, output, get_sinks(output, args.jsonl, args.per_year, args.summary))
+        except (AssertionError, ValueError, KeyError, IndexError, OSError) as e:
+            # Likely a paste in progress or in need of a manual cleanup, keep watching
+            log.error('Calculation failed, waiting for further changes: {!r}'.format(e))
+
+        changed = watcher.wait_for_changes()
+
+
+def load_rates(rates_dir, prices=None):
+    """
+    :param prices: List of (currency, price history file)
+    :return: ExchangeRates or None
+    """
+    if not rates_dir and not prices:
+        return None
+
+    rates = ExchangeRates()
+    if rates_dir:
+        log.info('Read the NBP exchange rates from: "{}"'.format(rates_dir))
+        rates = ExchangeRates.load_dir(rates_dir)
+    for currency, path in prices or []:
+        log.info('Read the {} prices from: "{}"'.format(currency, path))
+        rates.prices[currency] = PriceIndex.load(path)
+    return rates
+
+
+def get_rates_key(rates_dir, prices=None):
+    """
+    :param prices: List of (currency, price history file)
+    :return: Key of the content of the exchange rates and price files, the same wherever they are
+    """
+    paths = ExchangeRates.get_table_paths(rates_dir) if rates_dir else []
+    paths += [path for currency, path in prices or []]
+    return '{}|{}'.format([currency for currency, path in prices or []], Checkpoint.hash_files(paths).hexdigest())
+
+
+def main(args):
+    output = get_output_path(args.transactions)
+    rates = load_rates(args.rates_dir, args.prices)
+
+    if args.watch:
+        # The .txt files get converted too, see HistoryConverter
+        setup_log('bitbay_history_converter', args.verbose, args.logfile)
+        watch(args, output, rates)
+        return
+
+    if args.memory_budget:
+        OutOfCore.calculate(args.transactions, args.fees, get_sinks(output, args.jsonl, args.per_year, args.summary),
+                            args.memory_budget * 1024 * 1024, rates, args.spill_dir)
+        log.info('Done.')
+        return
+
+    log.info('Read the transactions data from: "{}"'.format(args.transactions))
+    transactions_data = read_csv(args.transactions)
+
+    log.info('Read the fees data from: "{}"'.format(args.fees))
+    fees_data = read_csv(args.fees)
+
+    if args.check_balances:
+        check_balances(transactions_data, fees_data)
+
+    if args.incremental:
+        # We should have the same number of transactions and fees
+        assert len(transactions_data) == len(fees_data)
+        incremental = Incremental(Incremental.get_path_for(output), get_rates_key(args.rates_dir, args.prices),
+                                  args.snapshot_rows)
+        transactions_data = incremental.calculate(transactions_data, fees_data, rates, output)
+        save_output(transactions_data, output, get_sinks(output, args.jsonl, args.per_year, args.summary))
+        incremental.save(output)
+        return
+
+    checkpoint = Checkpoint(Checkpoint.get_path_for(output), args.checkpoint_interval,
+                            repr((get_rates_key(args.rates_dir, args.prices), args.workers, args.parallel_min_rows)))
+    if args.resume:
+        checkpoint.resume()
 
-    # Save as CSV
-    output = args.transactions[:-4] + '_tax.csv'
-    with open(output, 'w', newline='', encoding="utf-8") as csvoutput:
-        csvwriter = csv.writer(csvoutput, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-        for row in transactions_data:
-            csvwriter.writerow(row)
-        csvwriter.writerow([])
-        csvwriter.writerow(['* Prowizje od kupna kryptowaluty pobierane są w danej w kryptowalucie. '
-                            'Przeliczanie na PLN odbywa się po kursie odpowiadającym transakcji '
-                            'której prowizja dotyczy. Oznacza to natychmiastowe kupno i sprzedaż kryptowaluty '
-                            'czyli brak dochodu do opodatkowania podatkiem dochodowym. '
-                            'Podatek PCC zawiera prowizje dla trasakcji kupna.'])
+    try:
+        transactions_data = calculate(transactions_data, fees_data, rates, checkpoint, args.workers,
+                                      args.parallel_min_rows)
+    except Exception:
+        checkpoint.save()
+        log.error('Calculation failed, after fixing the data continue with --resume, checkpoint saved as: "{}"'
+                  .format(checkpoint.path))
+        raise
 
-    log.info('Done. CSV saved as: "{}"'.format(output))
+    save_output(transactions_data, output, get_sinks(output, args.jsonl, args.per_year, args.summary))
+    checkpoint.remove()
 
 
 if __name__ == '__main__':
-    main()
+    ap = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(ap)
+    args = ap.parse_args()
+    setup_log('bitbay_tax_calculator', args.verbose, args.logfile)
+    main(args)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+import argparse
+
+import logging
+
+from modules.TaxIndex import TaxIndex
+from modules.Logger import setup_log
+
+log = logging.getLogger('bitbay_tax_calculator')
+
+DESCRIPTION = ('Program prints tax totals (PIT-38 + PCC) for any period and market, '
+               'based on the index saved by bitbay_tax_calculator.py')
+
+
+def add_arguments(ap):
+    ap.add_argument('index', help='A JSON index file saved next to the _tax.csv file, e.g. '
+                                  'transactions_history_tax_index.json')
+    ap.add_argument('--market', help='e.g. "BTC - PLN", all markets by default')
+    ap.add_argument('--year', type=int, help='Totals for a single tax year')
+    ap.add_argument('--from', dest='date_from', help='Period start (inclusive), e.g. 2019-07-01')
+    ap.add_argument('--to', dest='date_to', help='Period end (exclusive), e.g. 2019-10-01')
+    ap.add_argument('--markets', help='List indexed markets and exit', action='store_true')
+    ap.add_argument('-v', '--verbose', help='Print more messages', action='store_true')
+
+
+def print_totals(label, totals):
+    print('{:<24} {}'.format(label, '  '.join('{}: {}'.format(column, totals[column])
+                                              for column in TaxIndex.COLUMNS)))
+
+
+def main(args):
+    log.debug('Load the index from: "{}"'.format(args.index))
+    index = TaxIndex.load(args.index)
+
+    if args.markets:
+        for market in index.get_markets():
+            print(market)
+        return
+
+    label = args.market or 'Wszystkie rynki'
+    if args.year:
+        print_totals('{} {}'.format(label, args.year), index.query_year(args.year, args.market))
+    elif args.date_from or args.date_to:
+        period = '{} - {}'.format(args.date_from or '', args.date_to or '')
+        print_totals('{} {}'.format(label, period), index.query(args.market, args.date_from, args.date_to))
+    else:
+        # Yearly PIT-38 overview
+        for year in index.get_years():
+            print_totals('{} {}'.format(label, year), index.query_year(year, args.market))
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(ap)
+    args = ap.parse_args()
+    setup_log('bitbay_tax_calculator', args.verbose)
+    main(args)
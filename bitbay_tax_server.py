@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+import argparse
+
+import logging
+
+# https://docs.python.org/3/library/http.server.html
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+import json
+import time
+
+from modules.TaxService import TaxService
+from modules.Logger import setup_log
+
+log = logging.getLogger('bitbay_tax_calculator')
+
+DESCRIPTION = ('Local HTTP/JSON service calculating PL TAX on bitbay.net transactions. '
+               'Keeps parsed histories and lot ledgers warm in memory, accepts appended '
+               'transactions as deltas and exposes metrics for Prometheus.')
+
+# Endpoints of an account, anything else is counted as 'unknown' so URLs can't add labels to the metrics
+ACCOUNT_ENDPOINTS = ('totals', 'quote', 'rows', 'transactions', 'reload')
+
+
+def add_arguments(ap):
+    ap.add_argument('--account', nargs=3, action='append', required=True,
+                    metavar=('NAME', 'TRANSACTIONS', 'FEES'),
+                    help='Account name with its transactions and fees CSV files, can be repeated')
+    ap.add_argument('--rates-dir', help='Directory with NBP exchange rates tables (archive .csv or API .json files), '
+                                        'required for markets not quoted in PLN')
+    ap.add_argument('--prices', nargs=2, action='append', metavar=('CURRENCY', 'FILE'),
+                    help='PLN price history of a crypto currency (CSV: timestamp;price or OHLC), required for '
+                         'markets quoted in it. Can be repeated.')
+    ap.add_argument('--host', default='127.0.0.1', help='Address to listen on, local only by default')
+    ap.add_argument('--port', type=int, default=8038, help='Port to listen on')
+    ap.add_argument('-v', '--verbose', help='Print more messages', action='store_true')
+    ap.add_argument('--logfile', help='Logfile for all the messages')
+
+
+service = TaxService()
+
+
+class TaxRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /metrics
+    GET  /accounts
+    GET  /accounts/<name>/totals[?year=2019&market=BTC - PLN]
+    GET  /accounts/<name>/rows
+    GET  /accounts/<name>/quote?market=BTC - PLN&amount=0.5&rate=20000[&date=08-01-2019 10:00:00]
+    POST /accounts/<name>/transactions   {"transactions": [[...], ...], "fees": [[...], ...]}
+    POST /accounts/<name>/reload
+    """
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def handle_request(self, method):
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        parts = [unquote(p) for p in url.path.strip('/').split('/')]
+        endpoint = 'unknown'
+        try:
+            if method == 'GET' and parts == ['metrics']:
+                endpoint = 'metrics'
+                self.send_text(200, service.metrics.render(), 'text/plain; version=0.0.4')
+                return
+            if method == 'GET' and parts == ['accounts']:
+                endpoint = 'accounts'
+                self.send_json(200, sorted(service.accounts))
+                return
+            if len(parts) != 3 or parts[0] != 'accounts' or parts[1] not in service.accounts:
+                self.send_json(404, {'error': 'Not found'})
+                return
+
+            name, endpoint = parts[1], parts[2] if parts[2] in ACCOUNT_ENDPOINTS else 'unknown'
+            query = parse_qs(url.query)
+            if method == 'GET' and endpoint == 'totals':
+                year = int(query['year'][0]) if 'year' in query else None
+                market = query['market'][0] if 'market' in query else None
+                self.send_json(200, service.get_totals(name, year, market))
+            elif method == 'GET' and endpoint == 'quote':
+                self.send_json(200, service.quote(name, query['market'][0], query['amount'][0], query['rate'][0],
+                                                  query['date'][0] if 'date' in query else None))
+            elif method == 'GET' and endpoint == 'rows':
+                self.send_json(200, service.get_rows(name))
+            elif method == 'POST' and endpoint == 'transactions':
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+                appended = service.append(name, body.get('transactions', []), body.get('fees', []))
+                self.send_json(200, {'appended': appended, 'totals': service.get_totals(name)})
+            elif method == 'POST' and endpoint == 'reload':
+                service.reload(name)
+                self.send_json(200, service.get_totals(name))
+            else:
+                self.send_json(404, {'error': 'Not found'})
+        except (AssertionError, ValueError, KeyError, IndexError) as e:
+            log.error('Request "{}" failed: {!r}'.format(self.path, e))
+            self.send_json(400, {'error': repr(e)})
+        finally:
+            service.metrics.observe(endpoint, time.perf_counter() - start)
+
+    def send_json(self, status, content):
+        self.send_text(status, json.dumps(content, ensure_ascii=False), 'application/json; charset=utf-8')
+
+    def send_text(self, status, text, content_type):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *log_args):
+        log.debug('{} - {}'.format(self.address_string(), format % log_args))
+
+
+def main(args):
+    if args.rates_dir or args.prices:
+        # Only needed for markets not quoted in PLN
+        from bitbay_tax_calculator import load_rates
+
+        service.rates = load_rates(args.rates_dir, args.prices)
+
+    for name, transactions, fees in args.account:
+        service.add_account(name, transactions, fees)
+        # Warm up
+        service.get_totals(name)
+
+    server = ThreadingHTTPServer((args.host, args.port), TaxRequestHandler)
+    log.info('Serving on http://{}:{}'.format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(ap)
+    args = ap.parse_args()
+    setup_log('bitbay_tax_calculator', args.verbose, args.logfile)
+    main(args)
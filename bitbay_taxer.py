@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+# Single entry point (bitbay-taxer) for all the tools. Only the module of the chosen subcommand is imported,
+# so that start-up doesn't pay for dependencies of the others. Keep imports here to the standard minimum,
+# startup_benchmark.py keeps an eye on it.
+
+import argparse
+import importlib
+import sys
+
+# subcommand -> (module, logger name or None, help)
+COMMANDS = {
+    'convert': ('bitbay_history_converter_txt_2_csv', 'bitbay_history_converter',
+                'Convert a "copy-paste" .txt history from bitbay.net into CSV'),
+    'calculate': ('bitbay_tax_calculator', 'bitbay_tax_calculator',
+                  'Calculate PL TAX (FIFO gains, PCC, fees in PLN) from the CSV histories'),
+    'pipeline': ('bitbay_pipeline', 'bitbay_tax_calculator',
+                 'Convert, calculate and upload in one process, without intermediate files'),
+    'upload': ('bitbay_gsheets_uploader', None,
+               'Upload the calculator output into Google Sheets'),
+    'fetch': ('bitbay_update_via_api_experiment', 'bitbay_tax_calculator',
+              'Fetch the fees history via bitbay API (experiment)'),
+    'query': ('bitbay_tax_query', 'bitbay_tax_calculator',
+              'Print tax totals for any period and market from the index'),
+    'serve': ('bitbay_tax_server', 'bitbay_tax_calculator',
+              'Serve the calculations over local HTTP/JSON'),
+    'ytd': ('bitbay_ytd', 'bitbay_tax_calculator',
+            'Keep year-to-date tax totals up to date, one appended trade at a time'),
+    'quote': ('bitbay_quote', 'bitbay_tax_calculator',
+              'Quote the FIFO gain of a planned SELL against the open lots'),
+    'fuzz': ('bitbay_fuzz', 'bitbay_tax_calculator',
+             'Check alternative engines against the reference calculations on random histories'),
+}
+
+
+def get_arg_parser(argv):
+    """
+    :param argv: Command line arguments, used to load arguments of the chosen subcommand only
+    :return: Tuple (parser, module of the chosen subcommand or None)
+    """
+    ap = argparse.ArgumentParser(prog='bitbay-taxer', description='Tools for Polish TAX calculations involved in '
+                                                                  'trading of crypto assets on bitbay.net')
+    subparsers = ap.add_subparsers(dest='command', metavar='command')
+
+    chosen_module = None
+    for command, (module_name, logger_name, command_help) in COMMANDS.items():
+        if argv and argv[0] == command:
+            chosen_module = importlib.import_module(module_name)
+            sub_ap = subparsers.add_parser(command, help=command_help, description=chosen_module.DESCRIPTION)
+            chosen_module.add_arguments(sub_ap)
+        else:
+            subparsers.add_parser(command, help=command_help)
+
+    return ap, chosen_module
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    ap, module = get_arg_parser(argv)
+    args = ap.parse_args(argv)
+    if module is None:
+        ap.print_help()
+        return 1
+
+    logger_name = COMMANDS[args.command][1]
+    if logger_name:
+        from modules.Logger import setup_log
+        setup_log(logger_name, getattr(args, 'verbose', False), getattr(args, 'logfile', None))
+
+    module.main(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,7 +6,10 @@
 # more than 200 transactions between updates, therefore this tool will miss some and the user will still have to
 # manually copy and paste full history from the web interface...
 
-# Yet it is still a valid example of using the API
+# Yet it is still a valid example of using the API. With --poll it keeps running instead, polling often enough
+# (and paging back over gaps) not to miss anything, see ApiPoller.
+# With --transactions-output both histories come from the REST API instead, with the trade IDs on both sides, so
+# fees are joined with their trades on them (see ApiHistory).
 
 
 import argparse
@@ -15,41 +18,42 @@ import logging
 
 from time import time
 from urllib.parse import urlencode
-from urllib.request import Request, urlopen
 from time import sleep
 import hmac
 import hashlib
 import json
-import pandas
 import csv
+import os
 
-#
-# Command line call
-ap = argparse.ArgumentParser(description='')
-ap.add_argument('-v', '--verbose', help='print more messages', action='store_true')
-ap.add_argument('--logfile', help='Logfile for all the messages')
-args = ap.parse_args()
+from modules.ApiPoller import ApiPoller
+from modules.ApiHistory import ApiHistory
+from modules.Logger import setup_log
 
-#
-# Log
 log = logging.getLogger('bitbay_tax_calculator')
-log.setLevel(logging.DEBUG)
-# Format
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-# Console handler
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG if args.verbose else logging.INFO)
-ch.setFormatter(formatter)
-log.addHandler(ch)
-# Log file handler
-if args.logfile:
-    fh = logging.FileHandler(args.logfile)
-    fh.setLevel(logging.DEBUG)
-    fh.setFormatter(formatter)
-    log.addHandler(fh)
+
+DESCRIPTION = 'Program fetches the fees history via bitbay API (experiment)'
+
+CURRENCIES = 'PLN BTC BCC ETH XRP'.split()
+# Page limit of the history call
+LIMIT = 200
+
+
+def add_arguments(ap):
+    ap.add_argument('--output', default='fees_history_api.csv', help='CSV file for the fees history')
+    ap.add_argument('--transactions-output', help='Fetch the trades too (CSV file for them) and their fees from the '
+                                                  'REST API, both with the trade IDs')
+    ap.add_argument('--poll', help='Keep polling and appending new fees to the output, the state is kept in '
+                                   '_poll_state.json next to it', action='store_true')
+    ap.add_argument('--min-interval', type=float, default=10.0, help='Shortest time between polls (seconds)')
+    ap.add_argument('--max-interval', type=float, default=3600.0, help='Longest time between polls (seconds)')
+    ap.add_argument('-v', '--verbose', help='print more messages', action='store_true')
+    ap.add_argument('--logfile', help='Logfile for all the messages')
 
 
 def bitbay_api_call(method, params={}):
+    # Slow to import, only needed here
+    from urllib.request import Request, urlopen
+
     url = 'https://bitbay.net/API/Trading/tradingApi.php'
 
     key = b''
@@ -71,6 +75,63 @@ def bitbay_api_call(method, params={}):
     return ret
 
 
+def rest_api_call(path, query):
+    """
+    :param path: e.g. '/trading/history/transactions'
+    :param query: Dictionary, sent as JSON
+    :return: Decoded JSON response
+    """
+    # Slow to import, only needed here
+    from urllib.request import Request, urlopen
+    import uuid
+
+    key = ''
+    secret = b''
+
+    timestamp = str(int(time()))
+    url = 'https://api.bitbay.net/rest' + path + '?' + urlencode({'query': json.dumps(query)})
+    headers = {'API-Key': key,
+               'API-Hash': hmac.new(secret, (key + timestamp).encode('utf8'), hashlib.sha512).hexdigest(),
+               'operation-id': str(uuid.uuid4()),
+               'Request-Timestamp': timestamp,
+               'Content-Type': 'application/json'
+               }
+
+    response = json.loads(urlopen(Request(url, headers=headers)).read().decode())
+    if response.get('status') != 'Ok':
+        raise ValueError('API call "{}" failed: {}'.format(path, response.get('errors')))
+    return response
+
+
+def get_all_items(path, query):
+    """
+    :return: All the items of a paged history, following nextPageCursor
+    """
+    items = []
+    cursor = 'start'
+    while True:
+        response = rest_api_call(path, dict(query, nextPageCursor=cursor))
+        items.extend(response['items'])
+        log.debug('Got "{}" items of "{}"'.format(len(items), path))
+        if not response['items'] or response.get('nextPageCursor') in (None, cursor):
+            return items
+        cursor = response['nextPageCursor']
+        sleep(1)
+
+
+def fetch_trades_with_fees(transactions_output, fees_output):
+    """
+    Both CSV files with the trade IDs, see ApiHistory
+    """
+    transactions = get_all_items('/trading/history/transactions', {'limit': LIMIT})
+    fees = get_all_items('/balances/BITBAY/history', {'limit': LIMIT, 'types': [ApiHistory.FEE_TYPE]})
+    for path, data_lol in ((transactions_output, ApiHistory.transactions_to_lol(transactions)),
+                           (fees_output, ApiHistory.fees_to_lol(fees))):
+        with open(path, 'w', newline='', encoding="utf-8") as csvoutput:
+            csv.writer(csvoutput, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL).writerows(data_lol)
+        log.info('Saved "{}" rows as: "{}"'.format(len(data_lol) - 1, path))
+
+
 def get_operations_history_data_via_api(currs):
     """
     :param currs: A list containing interesting currencies
@@ -97,7 +158,45 @@ def get_operations_history_data_via_api(currs):
     return all_data
 
 
+def fetch_history_page(currency, limit, before_id=None):
+    """
+    :param before_id: Only operations older than this one (cursor for the older pages)
+    :return: Operations, newest first
+    """
+    params = {'currency': currency, 'limit': limit}
+    if before_id is not None:
+        params['fromId'] = before_id
+    json_obj = json.loads(bitbay_api_call('history', params))
+    # Stable, operations of the same time keep the order of the API
+    return sorted(json_obj, key=ApiPoller.get_time, reverse=True)
+
+
+def poll(output, min_interval, max_interval):
+    """
+    Append new fees to the output as they come, forever
+    """
+    def append_fees(currency, operations):
+        fee_data = [row for row in operations if row['operation_type'] == '-fee']
+        if not fee_data:
+            return
+        fee_data_lol = operations_data_dict_to_lol(fee_data)
+        new_file = not os.path.exists(output)
+        with open(output, 'a', newline='', encoding="utf-8") as csvoutput:
+            csvwriter = csv.writer(csvoutput, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            csvwriter.writerows(fee_data_lol if new_file else fee_data_lol[1:])
+        log.info('Appended "{}" {} fees to: "{}"'.format(len(fee_data), currency, output))
+
+    poller = ApiPoller(fetch_history_page, CURRENCIES, output[:-4] + '_poll_state.json', append_fees, LIMIT,
+                       min_interval, max_interval)
+    poller.run()
+
+
 def operations_data_dict_to_lol(data_dict):
+    """
+    :param data_dict: Operations as returned by the API
+    :return: List of lists with headers, as in the fees CSV. Without IDs: the ID of a fee operation is not the ID
+     of its trade, so there is nothing to join on (see --transactions-output)
+    """
 
     headers_order = ['time', 'operation_type', 'amount', 'balance_after']
     headers_map = {
@@ -105,12 +204,12 @@ def operations_data_dict_to_lol(data_dict):
         "operation_type": "Rodzaj",
         "amount": "Wartość",
         "balance_after": "Saldo po",
-        # "comment": "",
         # "id": "",
+        # "comment": "",
         #"currency": "btc",
     }
 
-    data_lol = []
+    data_lol = [[headers_map[col] for col in headers_order]]
 
     for row_d in data_dict:
         row_l = []
@@ -121,9 +220,16 @@ def operations_data_dict_to_lol(data_dict):
     return data_lol
 
 
-def main():
+def main(args):
+    if args.transactions_output:
+        fetch_trades_with_fees(args.transactions_output, args.output)
+        return
+
+    if args.poll:
+        poll(args.output, args.min_interval, args.max_interval)
+        return
 
-    currs = 'PLN BTC BCC ETH XRP'.split()
+    currs = CURRENCIES
     log.debug('We are interested in: {}'.format(currs))
 
     log.debug('Getting the operations history data via API')
@@ -131,15 +237,19 @@ def main():
 
     # Fee data only
     fee_data = [row for row in operations_data_api if row ['operation_type'] == '-fee']
-    fee_data_sorted = sorted(fee_data, key=lambda o: o['id'])
+    fee_data_sorted = sorted(fee_data, key=ApiPoller.get_time)
 
     fee_data_lol = operations_data_dict_to_lol(fee_data_sorted)
 
-    with open('/home/k4m1/test.csv', 'w', newline='') as csvoutput:
+    with open(args.output, 'w', newline='', encoding="utf-8") as csvoutput:
         csvwriter = csv.writer(csvoutput, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
         for row in fee_data_lol:
             csvwriter.writerow(row)
 
 
 if __name__ == '__main__':
-    main()
+    ap = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(ap)
+    args = ap.parse_args()
+    setup_log('bitbay_tax_calculator', args.verbose, args.logfile)
+    main(args)
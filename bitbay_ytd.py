@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+import argparse
+
+import logging
+
+from modules.YtdTracker import YtdTracker
+from modules.TaxIndex import TaxIndex
+from modules.Logger import setup_log
+
+log = logging.getLogger('bitbay_tax_calculator')
+
+DESCRIPTION = ('Program keeps year-to-date tax totals (PIT-38 + PCC) up to date, one appended trade at a time, '
+               'without recalculating the whole history')
+
+
+def add_arguments(ap):
+    ap.add_argument('state', help='A JSON file with the state, e.g. transactions_history_tax_ytd.json')
+    ap.add_argument('--init', nargs=2, metavar=('TRANSACTIONS', 'FEES'),
+                    help='Start (again) from a full calculation of the CSV histories')
+    ap.add_argument('--add', nargs=2, action='append', metavar=('TRANSACTION', 'FEE'),
+                    help='Append a trade: its transactions and fees rows in the bitbay CSV format (";" separated), '
+                         'e.g. "BTC - PLN;05-01-2019 22:25:34;Sprzedaż;Taker;14440.01;0.36920290;5331.29" '
+                         '"05-01-2019 22:25:34;Pobranie prowizji za transakcję: PLN;21.86;8204.41". Can be repeated.')
+    ap.add_argument('--rates-dir', help='Directory with NBP exchange rates tables (archive .csv or API .json files), '
+                                        'required for markets not quoted in PLN, the same for every run')
+    ap.add_argument('--prices', nargs=2, action='append', metavar=('CURRENCY', 'FILE'),
+                    help='PLN price history of a crypto currency (CSV: timestamp;price or OHLC), required for '
+                         'markets quoted in it. Can be repeated.')
+    ap.add_argument('--year', type=int, help='Totals for this tax year, the year of the last trade by default')
+    ap.add_argument('-v', '--verbose', help='Print more messages', action='store_true')
+    ap.add_argument('--logfile', help='Logfile for all the messages')
+
+
+def main(args):
+    rates = None
+    if args.rates_dir or args.prices:
+        # Only needed for markets not quoted in PLN
+        from bitbay_tax_calculator import load_rates
+
+        rates = load_rates(args.rates_dir, args.prices)
+
+    if args.init:
+        # The full calculation, only when needed
+        import bitbay_tax_calculator
+
+        transactions_data = bitbay_tax_calculator.read_csv(args.init[0])
+        fees_data = bitbay_tax_calculator.read_csv(args.init[1])
+        rows = bitbay_tax_calculator.calculate(transactions_data, fees_data, rates)
+        tracker = YtdTracker.from_rows(args.state, rows, rates=rates)
+        log.info('Started from "{}" trades: "{}"'.format(tracker.trades, args.state))
+    else:
+        tracker = YtdTracker(args.state, rates=rates)
+        if not tracker.load():
+            log.info('New YTD state: "{}"'.format(args.state))
+
+    for transaction, fee in args.add or []:
+        row = tracker.add(transaction.split(';'), fee.split(';'))
+        log.info('Added: {}'.format(';'.join(row)))
+
+    totals = tracker.get_totals(args.year)
+    print('{:<24} {}'.format('YTD {}'.format(args.year or (tracker.last_date or '')[6:10]),
+                             '  '.join('{}: {}'.format(column, totals[column]) for column in TaxIndex.COLUMNS)))
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(ap)
+    args = ap.parse_args()
+    setup_log('bitbay_tax_calculator', args.verbose, args.logfile)
+    main(args)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for resuming calculations from checkpoints
+
+import copy
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from modules.Checkpoint import Checkpoint
+from modules.ExchangeRates import ExchangeRates
+from modules.Feeer import Feeer
+from modules.Taxer import Taxer
+
+
+class CheckpointTest(TestCase):
+
+    data_lol = [
+        ['Rynek', 'Data operacji', 'Rodzaj', 'Typ', 'Kurs', 'Ilość', 'Wartość', 'Prowizja'],
+        ['BTC - PLN', '01-01-2019 10:00:00', 'Kupno', 'Taker', '1000', '1', '1000', '1'],
+        ['BTC - PLN', '02-01-2019 10:00:00', 'Kupno', 'Taker', '2000', '1', '2000', '2'],
+        ['BTC - PLN', '03-01-2019 10:00:00', 'Sprzedaż', 'Taker', '3000', '0.5', '1500', '1'],
+        ['BTC - PLN', '04-01-2019 10:00:00', 'Sprzedaż', 'Taker', '3000', '1', '3000', '1'],
+        ['BTC - EUR', '05-01-2019 10:00:00', 'Sprzedaż', 'Taker', '3000', '0.5', '1500', '1'],
+    ]
+
+    def test_resume_fifo_after_fixed_row(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'history_tax_checkpoint.json')
+
+            # The last row fails (no rates for EUR)
+            checkpoint = Checkpoint(path, interval=0)
+            with self.assertRaises(ValueError):
+                Taxer.calculate_gain_fifo(copy.deepcopy(self.data_lol), ExchangeRates(), checkpoint)
+            self.assertEqual(checkpoint.get('fifo')['rows_done'], 4)
+
+            fixed = copy.deepcopy(self.data_lol)
+            fixed[5][0] = 'BTC - PLN'
+            expected = Taxer.calculate_gain_fifo(copy.deepcopy(fixed))
+
+            checkpoint = Checkpoint(path, interval=0)
+            self.assertTrue(checkpoint.resume())
+            with self.assertLogs('bitbay_tax_calculator', 'INFO') as logs:
+                resumed = Taxer.calculate_gain_fifo(fixed, None, checkpoint)
+            self.assertIn('FIFO resumed after "4" rows', ' '.join(logs.output))
+            self.assertEqual(resumed, expected)
+
+    def test_resume_twice(self):
+        data = [self.data_lol[0]] + [
+            ['BTC - PLN', '{:02d}-01-2019 10:00:00'.format(day), kind, 'Taker', '1000', '1', '1000', '1']
+            for day, kind in zip(range(1, 11), ['Kupno', 'Sprzedaż'] * 5)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'history_tax_checkpoint.json')
+            failing = copy.deepcopy(data)
+            failing[4][0] = 'BTC - EUR'
+            failing[8][0] = 'BTC - EUR'
+
+            # SELLs fail: the 4th row, then (resumed) the 8th one
+            with self.assertRaises(ValueError):
+                Taxer.calculate_gain_fifo(copy.deepcopy(failing), ExchangeRates(), Checkpoint(path, interval=0))
+            failing[4][0] = 'BTC - PLN'
+            checkpoint = Checkpoint(path, interval=0)
+            checkpoint.resume()
+            with self.assertRaises(ValueError):
+                Taxer.calculate_gain_fifo(copy.deepcopy(failing), ExchangeRates(), checkpoint)
+            self.assertEqual(checkpoint.get('fifo')['rows_done'], 7)
+
+            failing[8][0] = 'BTC - PLN'
+            checkpoint = Checkpoint(path, interval=0)
+            checkpoint.resume()
+            self.assertEqual(len(checkpoint.get_journal('fifo')), 7)
+            with self.assertLogs('bitbay_tax_calculator', 'INFO') as logs:
+                resumed = Taxer.calculate_gain_fifo(copy.deepcopy(failing), None, checkpoint)
+            self.assertIn('FIFO resumed after "7" rows', ' '.join(logs.output))
+            self.assertEqual(resumed, Taxer.calculate_gain_fifo(copy.deepcopy(data)))
+
+    def test_changed_buy_is_not_resumed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'history_tax_checkpoint.json')
+            Taxer.calculate_gain_fifo(copy.deepcopy(self.data_lol[:5]), None, Checkpoint(path, interval=0))
+
+            changed = copy.deepcopy(self.data_lol[:5])
+            changed[2][4] = '2500'
+            checkpoint = Checkpoint(path, interval=0)
+            checkpoint.resume()
+            resumed = Taxer.calculate_gain_fifo(copy.deepcopy(changed), None, checkpoint)
+            self.assertEqual(resumed, Taxer.calculate_gain_fifo(changed))
+
+    def test_fee_groups_reused(self):
+        transactions = [
+            ['Rynek', 'Data operacji', 'Rodzaj', 'Typ', 'Kurs', 'Ilość', 'Wartość'],
+            ['BTC - PLN', '01-01-2019 10:00:00', 'Sprzedaż', 'Taker', '1000', '1', '1000'],
+            ['BTC - PLN', '01-01-2019 10:00:00', 'Sprzedaż', 'Taker', '1000', '2', '2000'],
+            ['BTC - PLN', '02-01-2019 10:00:00', 'Sprzedaż', 'Taker', '1000', '1', '1000'],
+        ]
+        fees = [
+            ['Data operacji', 'Rodzaj', 'Wartość', 'Saldo po'],
+            ['01-01-2019 10:00:00', 'Pobranie prowizji za transakcję', '-8.00', '0'],
+            ['01-01-2019 10:00:00', 'Pobranie prowizji za transakcję', '-4.00', '0'],
+            ['02-01-2019 10:00:00', 'Pobranie prowizji za transakcję', '-4.00', '0'],
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoint = Checkpoint(os.path.join(tmp, 'history_tax_checkpoint.json'), interval=0)
+            expected = Feeer.include_fees(copy.deepcopy(transactions), copy.deepcopy(fees), None, checkpoint)
+
+            checkpoint = Checkpoint(checkpoint.path, interval=0)
+            checkpoint.resume()
+            self.assertEqual(len(checkpoint.get_journal('fee_groups')), 2)
+            resumed = Feeer.include_fees(copy.deepcopy(transactions), copy.deepcopy(fees), None, checkpoint)
+            self.assertEqual(resumed, expected)
+
+    def test_fee_groups_saved_before_sanity_check(self):
+        transactions = [
+            ['Rynek', 'Data operacji', 'Rodzaj', 'Typ', 'Kurs', 'Ilość', 'Wartość'],
+            ['BTC - PLN', '01-01-2019 10:00:00', 'Sprzedaż', 'Taker', '1000', '1', '1000'],
+            ['BTC - PLN', '01-01-2019 10:00:00', 'Sprzedaż', 'Taker', '1000', '2', '2000'],
+            ['BTC - PLN', '02-01-2019 10:00:00', 'Sprzedaż', 'Taker', '1000', '1', '1000'],
+        ]
+        # The fee of the last group is missing
+        fees = [
+            ['Data operacji', 'Rodzaj', 'Wartość', 'Saldo po'],
+            ['01-01-2019 10:00:00', 'Pobranie prowizji za transakcję', '-8.00', '0'],
+            ['01-01-2019 10:00:00', 'Pobranie prowizji za transakcję', '-4.00', '0'],
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoint = Checkpoint(os.path.join(tmp, 'history_tax_checkpoint.json'), interval=3600)
+            with self.assertRaises(AssertionError):
+                Feeer.include_fees(copy.deepcopy(transactions), copy.deepcopy(fees), None, checkpoint)
+
+            checkpoint = Checkpoint(checkpoint.path)
+            self.assertTrue(checkpoint.resume())
+            self.assertEqual([positions for group_hash, positions in checkpoint.get_journal('fee_groups')], [[0, 1]])
+
+    def test_saves_append_to_journal(self):
+        data = [self.data_lol[0]] + [
+            ['BTC - PLN', '{:02d}-01-2019 10:00:00'.format(day), kind, 'Taker', '1000', '1', '1000', '1']
+            for day, kind in zip(range(1, 21), ['Kupno', 'Sprzedaż'] * 10)]
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoint = Checkpoint(os.path.join(tmp, 'history_tax_checkpoint.json'), interval=0)
+            written = []
+            save = checkpoint.save
+            checkpoint.save = lambda: (written.append(sum(len(rows) for rows in checkpoint.pending.values())), save())
+            Taxer.calculate_gain_fifo(copy.deepcopy(data), None, checkpoint)
+
+            # A row at a time, not all the rows done so far
+            self.assertEqual(written, [1] * 20)
+            with open(checkpoint.get_journal_path('fifo'), encoding="utf-8") as journal_file:
+                self.assertEqual(len(journal_file.readlines()), 20)
+
+            checkpoint.remove()
+            self.assertEqual(os.listdir(tmp), [])
+
+    def test_hash_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for name in ('a.csv', 'b.csv'):
+                paths.append(os.path.join(tmp, name))
+                with open(paths[-1], 'w', encoding="utf-8") as rates_file:
+                    rates_file.write('20190102;4.3\n')
+            key = Checkpoint.hash_files(paths).hexdigest()
+            self.assertNotEqual(key, Checkpoint.hash_files(paths[:1]).hexdigest())
+
+            # The same path, another content
+            with open(paths[1], 'w', encoding="utf-8") as rates_file:
+                rates_file.write('20190102;4.4\n')
+            self.assertNotEqual(key, Checkpoint.hash_files(paths).hexdigest())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for the NBP exchange rates
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from modules.ExchangeRates import ExchangeRates
+from modules.Money import Rate
+from modules.Taxer import Taxer
+
+
+class ExchangeRatesTest(TestCase):
+
+    archive_csv = ('data;1USD;1EUR;100HUF;nr tabeli;pełny numer tabeli\n'
+                   ';dolar amerykański;euro;forint (Węgry);;\n'
+                   '20190102;3,7619;4,3000;1,3388;1;001/A/NBP/2019\n'
+                   '20190103;3,7870;4,2934;1,3343;2;002/A/NBP/2019\n'
+                   '20190104;3,7709;4,2966;1,3359;3;003/A/NBP/2019\n'
+                   'Źródło: NBP\n')
+
+    api_json = {'table': 'A', 'code': 'EUR',
+                'rates': [{'no': '004/A/NBP/2019', 'effectiveDate': '2019-01-07', 'mid': 4.2909}]}
+
+    def get_rates(self, tmp):
+        with open(os.path.join(tmp, 'archiwum_tab_a_2019.csv'), 'w', encoding='cp1250') as f:
+            f.write(self.archive_csv)
+        with open(os.path.join(tmp, 'eur.json'), 'w', encoding='utf-8') as f:
+            f.write(json.dumps(self.api_json))
+        return ExchangeRates.load_dir(tmp)
+
+    def test_last_business_day_before(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            rates = self.get_rates(tmp)
+            # Same day table is not yet the one
+            self.assertEqual(rates.get_rate('EUR', '03-01-2019 12:00:00'), Rate.parse('4.3000'))
+            # Over the weekend, from Friday
+            self.assertEqual(rates.get_rate('EUR', '07-01-2019 09:00:00'), Rate.parse('4.2966'))
+            self.assertEqual(rates.get_rate('EUR', '08-01-2019 09:00:00'), Rate.parse('4.2909'))
+            self.assertEqual(rates.get_rate('HUF', '04-01-2019 09:00:00'), Rate.parse('0.013343'))
+            self.assertEqual(rates.get_rate('PLN', '04-01-2019 09:00:00'), Rate.parse('1'))
+            with self.assertRaises(ValueError):
+                rates.get_rate('EUR', '02-01-2019 12:00:00')
+            with self.assertRaises(ValueError):
+                rates.get_rate('CHF', '04-01-2019 12:00:00')
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            rates = self.get_rates(tmp)
+            self.assertTrue(os.path.exists(os.path.join(tmp, ExchangeRates.CACHE_FILE)))
+            cached = ExchangeRates.load_dir(tmp)
+            self.assertEqual(cached.get_currencies(), ['EUR', 'HUF', 'USD'])
+            self.assertEqual(cached.get_rate('USD', '04-01-2019 12:00:00'),
+                             rates.get_rate('USD', '04-01-2019 12:00:00'))
+
+    def test_get_gains_for_row_converted(self):
+        data_lol = [
+            ['Rynek', 'Data operacji', 'Rodzaj', 'Typ', 'Kurs', 'Ilość', 'Wartość'],
+            ['BTC - EUR', '03-01-2019 10:00:00', 'Kupno', 'some type', '1000', '1', '1000'],
+            ['BTC - EUR', '08-01-2019 10:00:00', 'Sprzedaż', 'some type', '2000', '0.5', '1000'],
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            rates = self.get_rates(tmp)
+        gains = Taxer.get_gains_for_row(data_lol[2], data_lol, rates)
+        self.assertEqual(gains, {'income': '4290.90', 'cost': '2150.00', 'gain': '2140.90'})
+
+    def test_calculate_gain_fifo_across_markets(self):
+        data_lol = [
+            ['Rynek', 'Data operacji', 'Rodzaj', 'Typ', 'Kurs', 'Ilość', 'Wartość'],
+            ['BTC - EUR', '03-01-2019 10:00:00', 'Kupno', 'some type', '1000', '1', '1000'],
+            ['BTC - PLN', '08-01-2019 10:00:00', 'Kupno', 'some type', '5000', '1', '5000'],
+            ['BTC - PLN', '08-01-2019 10:00:01', 'Sprzedaż', 'some type', '6000', '1.5', '9000'],
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            rates = self.get_rates(tmp)
+        # BTC bought for EUR (at 4.3000 PLN) is sold for PLN first
+        for workers in (0, 2):
+            data = Taxer.calculate_gain_fifo([list(row) for row in data_lol], rates, workers=workers,
+                                             parallel_min_rows=0)
+            self.assertEqual(data[3][-3:], ['9000.00', '6800.00', '2200.00'], workers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for merging overlapping CSV exports
+
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from modules.ExportMerger import ExportMerger
+from modules.HistoryConverter import HistoryConverter
+from modules.HistoryGenerator import HistoryGenerator
+
+
+class ExportMergerTest(TestCase):
+
+    def test_overlapping_files(self):
+        transactions_data, fees_data = HistoryGenerator.render(dict(HistoryGenerator(3).generate(40), reversed=True))
+        headers = transactions_data[0]
+        rows = transactions_data[1:]
+        # Two identical fills within a second, as bitbay lists them
+        rows.insert(5, list(rows[5]))
+        third = len(rows) // 3
+        with tempfile.TemporaryDirectory() as tmp:
+            # Overlapping parts, one of them older first
+            HistoryConverter.write_csv(os.path.join(tmp, 'q1.csv'), [headers] + rows[:2 * third])
+            HistoryConverter.write_csv(os.path.join(tmp, 'q2.csv'), [headers] + rows[third:][::-1])
+            HistoryConverter.write_csv(os.path.join(tmp, 'q3.csv'), [headers] + rows[third:third + 10])
+            ExportMerger.BLOCK_SIZE = 100
+            try:
+                merged = list(ExportMerger.iter_rows(tmp))
+            finally:
+                ExportMerger.BLOCK_SIZE = 64 * 1024
+
+        self.assertEqual(merged[0], headers)
+        dates = [ExportMerger.get_sort_key(row[1]) for row in merged[1:]]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+        self.assertEqual(sorted(merged[1:]), sorted(rows))
+
+    def test_different_headers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            HistoryConverter.write_csv(os.path.join(tmp, 'a.csv'), [HistoryConverter.HEADERS['transactions']])
+            HistoryConverter.write_csv(os.path.join(tmp, 'b.csv'), [HistoryConverter.HEADERS['fees']])
+            with self.assertRaises(ValueError):
+                list(ExportMerger.iter_rows(tmp))
+
+
+if __name__ == '__main__':
+    unittest.main()
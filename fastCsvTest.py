@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for the bulk reader of the bitbay CSV dialect
+
+import csv
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from modules.FastCsv import FastCsv
+from modules.Money import Money, Amount, Rate
+
+
+class FastCsvTest(TestCase):
+
+    def read_both(self, content, **kwargs):
+        """
+        :return: Tuple (csv.reader rows, FastCsv rows for tiny and default buffers)
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'history.csv')
+            with open(path, 'w', newline='', encoding="utf-8") as csvfile:
+                csvfile.write(content)
+            with open(path, newline='', encoding="utf-8-sig") as csvfile:
+                expected = list(csv.reader(csvfile, delimiter=';'))
+            return expected, [list(FastCsv.iter_rows(path, buffer_size=size, **kwargs)) for size in (3, 7, 1000)]
+
+    def test_same_rows_as_csv_reader(self):
+        for content in ['a;b\n1;2\n', '﻿a;b\r\n1;2\r\n\r\n', 'a;b\n1;2;3\n4\n\nfooter', 'a;b\n1;"x;y"\n3;4\n',
+                        'a;b\n1;"multi\nline"\n', '', 'a;b\n;\n;\n']:
+            expected, actual = self.read_both(content)
+            for rows in actual:
+                self.assertEqual(rows, expected, content)
+
+    def test_typed_rows(self):
+        content = 'Kurs;Ilość;Wartość\n14440.01000000;0.06777000;978.60\n1;-0.5;-12.1\n\nfooter\n'
+        expected, actual = self.read_both(content, expected_headers=['Kurs', 'Ilość', 'Wartość'],
+                                          types={'Kurs': Rate, 'Ilość': Amount, 'Wartość': Money})
+        for rows in actual:
+            self.assertEqual(rows[1], [1444001000000, 6777000, 97860])
+            self.assertEqual(rows[2], [100000000, -50000000, -1210])
+            self.assertEqual(rows[3:], [[], ['footer']])
+            self.assertEqual(Amount.of(rows[1][1]), Amount.parse('0.06777'))
+
+    def test_fewer_decimal_places(self):
+        # Rates in PLN with 2 decimal places, the same in a column or mixed
+        self.assertEqual(FastCsv.parse_units(['14440.01', '-0.10', '7.00'], Rate), [1444001000000, -10000000, 700000000])
+        self.assertEqual(FastCsv.parse_units(['3', '-4'], Money), [300, -400])
+        self.assertEqual(FastCsv.parse_units(['1', '-0.5', '12.10000001'], Amount), [100000000, -50000000, 1210000001])
+        # More than the scale, rounded by parse()
+        self.assertEqual(FastCsv.parse_units(['1.005', '1.00'], Money), [Money.parse('1.005').units, 100])
+
+    def test_unexpected_headers(self):
+        with self.assertRaises(ValueError):
+            self.read_both('a;c\n1;2\n', expected_headers=['a', 'b'])
+
+    def test_invalid_values(self):
+        for value in ['1_0.00000000', '1.2.3', 'x']:
+            with self.assertRaises(ValueError):
+                FastCsv.parse_units([value], Amount)
+
+
+if __name__ == '__main__':
+    unittest.main()
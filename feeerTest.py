@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for matching fees with transactions
+
+import unittest
+from unittest import TestCase
+
+from modules.Feeer import Feeer
+
+
+class FeeerTest(TestCase):
+
+    def test_include_fees_heuristic(self):
+        transactions_data = [
+            ['Rynek', 'Data operacji', 'Rodzaj', 'Typ', 'Kurs', 'Ilość', 'Wartość'],
+            ['BTC - PLN', '05-01-2019 22:25:34', 'Sprzedaż', 'Taker', '1000.00', '0.5', '500.00'],
+            ['BTC - PLN', '05-01-2019 22:25:34', 'Sprzedaż', 'Taker', '1000.00', '0.1', '100.00'],
+        ]
+        fees_data = [
+            ['Data operacji', 'Rodzaj', 'Wartość', 'Saldo po'],
+            ['05-01-2019 22:25:34', 'Pobranie prowizji za transakcję: PLN', '0.20', '100.00'],
+            ['05-01-2019 22:25:34', 'Pobranie prowizji za transakcję: PLN', '1.00', '99.80'],
+        ]
+
+        rows = Feeer.include_fees(transactions_data, fees_data)
+        self.assertEqual([row[-1] for row in rows], ['Prowizja', '1.00', '0.20'])
+
+    def test_include_fees_joined_on_ids(self):
+        # The same values, so the heuristic alone would fail on its assertions
+        transactions_data = [
+            ['Rynek', 'Data operacji', 'Rodzaj', 'Typ', 'Kurs', 'Ilość', 'Wartość', 'ID'],
+            ['BTC - PLN', '05-01-2019 22:25:34', 'Sprzedaż', 'Taker', '1000.00', '0.5', '500.00', 'a'],
+            ['BTC - PLN', '05-01-2019 22:25:34', 'Sprzedaż', 'Taker', '1000.00', '0.5', '500.00', 'b'],
+            ['BTC - PLN', '05-01-2019 22:20:00', 'Kupno', 'Taker', '1000.00', '1', '1000.00', ''],
+        ]
+        fees_data = [
+            ['Data operacji', 'Rodzaj', 'Wartość', 'Saldo po', 'ID'],
+            ['05-01-2019 22:25:34', 'Pobranie prowizji za transakcję: PLN', '2.00', '100.00', 'b'],
+            ['05-01-2019 22:25:34', 'Pobranie prowizji za transakcję: PLN', '1.00', '102.00', 'a'],
+            ['05-01-2019 22:20:00', 'Pobranie prowizji za transakcję: BTC', '0.001', '1.00', ''],
+        ]
+
+        rows = Feeer.include_fees(transactions_data, fees_data)
+        self.assertEqual([row[-1] for row in rows], ['Prowizja', '1.00', '2.00', '1.00'])
+
+    def test_duplicate_ids(self):
+        fees_data = [
+            ['Data operacji', 'Rodzaj', 'Wartość', 'Saldo po', 'ID'],
+            ['05-01-2019 22:25:34', 'Pobranie prowizji za transakcję: PLN', '2.00', '100.00', 'a'],
+            ['05-01-2019 22:25:34', 'Pobranie prowizji za transakcję: PLN', '1.00', '102.00', 'a'],
+        ]
+        with self.assertRaises(ValueError):
+            Feeer.index_entries_by_id(fees_data[1:], Feeer.get_col_indexes(fees_data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for the start-up of the Google Sheets helper, without the Google libraries
+
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from modules.GSheetsUploaderHelper import GSheetsUploaderHelper
+
+
+class FakeCredentials:
+
+    def __init__(self, expiry, refresh_token='refresh', valid=True):
+        self.expiry = expiry
+        self.refresh_token = refresh_token
+        self.valid = valid
+
+
+class GSheetsUploaderHelperTest(TestCase):
+
+    def test_needs_refresh_before_expiry(self):
+        now = datetime(2019, 1, 1, 12)
+        self.assertFalse(GSheetsUploaderHelper.needs_refresh(FakeCredentials(now + timedelta(hours=1)), now))
+        self.assertTrue(GSheetsUploaderHelper.needs_refresh(FakeCredentials(now + timedelta(minutes=1)), now))
+        self.assertFalse(GSheetsUploaderHelper.needs_refresh(FakeCredentials(now, refresh_token=None), now))
+        self.assertTrue(GSheetsUploaderHelper.needs_refresh(FakeCredentials(None, valid=False), now))
+
+    def test_service_reused(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            token_path = os.path.join(tmp, 'token.pickle')
+            service = object()
+            far = datetime.utcnow() + timedelta(days=1)
+            GSheetsUploaderHelper.services[('secret.json', token_path)] = (FakeCredentials(far), service)
+            try:
+                first = GSheetsUploaderHelper('secret.json', 'sheet1', token_path)
+                second = GSheetsUploaderHelper('secret.json', 'sheet2', token_path)
+            finally:
+                del GSheetsUploaderHelper.services[('secret.json', token_path)]
+            self.assertIs(first.SERVICE, service)
+            self.assertIs(second.SERVICE, service)
+            self.assertGreaterEqual(first.startup_seconds, 0)
+            self.assertEqual(second.discovery_path, os.path.join(tmp, 'sheets_v4_discovery.json'))
+
+    def test_discovery_document_cached(self):
+        fetched = []
+
+        def fetch(url):
+            fetched.append(url)
+            return '{"name": "sheets"}'
+
+        with tempfile.TemporaryDirectory() as tmp:
+            token_path = os.path.join(tmp, 'token.pickle')
+            GSheetsUploaderHelper.services[('secret.json', token_path)] = (FakeCredentials(None), None)
+            try:
+                helper = GSheetsUploaderHelper('secret.json', 'sheet', token_path)
+            finally:
+                del GSheetsUploaderHelper.services[('secret.json', token_path)]
+            self.assertEqual(helper.load_discovery_document(fetch), '{"name": "sheets"}')
+            self.assertEqual(helper.load_discovery_document(fetch), '{"name": "sheets"}')
+            self.assertEqual(len(fetched), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
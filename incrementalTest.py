@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for recalculating only from the first changed row
+
+import copy
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from modules.Incremental import Incremental
+from modules.HistoryGenerator import HistoryGenerator
+from modules.Oracle import Oracle, reference_engine
+from modules.OutputSinks import CsvSink, write_to_sinks
+
+
+class IncrementalTest(TestCase):
+
+    def run_incremental(self, incremental, transactions_data, fees_data, output):
+        data = incremental.calculate(copy.deepcopy(transactions_data), copy.deepcopy(fees_data), output=output)
+        write_to_sinks(data, [CsvSink(output)])
+        incremental.save(output)
+        return Incremental.read_output(output)
+
+    def test_amended_old_row(self):
+        case = HistoryGenerator(3).generate(40)
+        case['reversed'] = True
+        transactions_data, fees_data = HistoryGenerator.render(case)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'transactions_history_tax.csv')
+            incremental = Incremental(Incremental.get_path_for(output), snapshot_every=5)
+            self.assertEqual(self.run_incremental(incremental, transactions_data, fees_data, output),
+                             Oracle.run(reference_engine, transactions_data, fees_data))
+
+            # A fixed rate of an old BUY (younger first: about two thirds in), the SELLs after it change
+            position = max(i for i in range(1, len(transactions_data) // 3) if transactions_data[i][2] == 'Kupno')
+            transactions_data[position][4] = '1.00000000'
+            with self.assertLogs('bitbay_tax_calculator', 'INFO') as logs:
+                actual = self.run_incremental(incremental, transactions_data, fees_data, output)
+            self.assertEqual(actual, Oracle.run(reference_engine, transactions_data, fees_data))
+            self.assertTrue(any('rows reused' in line for line in logs.output))
+
+    def test_changed_output_not_reused(self):
+        case = HistoryGenerator(5).generate(10)
+        transactions_data, fees_data = HistoryGenerator.render(case)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'transactions_history_tax.csv')
+            incremental = Incremental(Incremental.get_path_for(output), snapshot_every=1)
+            self.run_incremental(incremental, transactions_data, fees_data, output)
+            with open(output, 'a', encoding="utf-8") as output_file:
+                output_file.write('edited\n')
+            self.assertIsNone(incremental.load(output))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for the open lots ledger
+
+import unittest
+from unittest import TestCase
+
+from modules.LotLedger import LotLedger
+from modules.Taxer import Taxer
+from modules.Money import Amount, Rate
+from modules.ExchangeRates import ExchangeRates
+
+
+class LotLedgerTest(TestCase):
+
+    data_lol = [
+        ['Rynek', 'Data operacji', 'Rodzaj', 'Typ', 'Kurs', 'Ilość', 'Wartość'],
+        ['BTC-PLN', '01-01-2019 10:00:00', 'Kupno', 'some type', '1000', '0.5', '500'],
+        ['ETH-PLN', '01-01-2019 10:00:01', 'Kupno', 'some type', '100', '2', '200'],
+        ['BTC-PLN', '01-01-2019 10:00:02', 'Sprzedaż', 'some type', '3000', '0.5', '1500'],
+        ['BTC-PLN', '01-01-2019 10:00:03', 'Kupno', 'some type', '2000', '1', '2000'],
+        ['BTC-PLN', '01-01-2019 10:00:04', 'Sprzedaż', 'some type', '3000', '0.25', '750'],
+        ['ETH-PLN', '01-01-2019 10:00:05', 'Sprzedaż', 'some type', '50', '3', '150'],
+    ]
+
+    def test_same_as_calculate_gain_fifo(self):
+        expected = Taxer.calculate_gain_fifo([list(row) for row in self.data_lol])
+
+        ledger = LotLedger()
+        results = []
+        for row in self.data_lol[1:]:
+            if row[2] == 'Kupno':
+                ledger.add_buy(row[0], Amount.parse(row[5]), Rate.parse(row[4]))
+        for row in self.data_lol[1:]:
+            if row[2] == 'Sprzedaż':
+                gains = Taxer.get_gains_results(*ledger.sell(row[0], Amount.parse(row[5]), Rate.parse(row[4])))
+                results.append([gains['income'], gains['cost'], gains['gain']])
+
+        self.assertEqual(results, [row[-3:] for row in expected[1:] if row[2] == 'Sprzedaż'])
+        self.assertEqual(ledger.shortfall, {'ETH': Amount.parse('1').units})
+        self.assertEqual(ledger.get_open_amount('BTC-PLN'), Amount.parse('0.75'))
+
+    def test_from_data(self):
+        ledger = LotLedger.from_data(self.data_lol)
+        self.assertEqual(ledger.get_open_amount('BTC-PLN'), Amount.parse('0.75'))
+        self.assertEqual(ledger.get_open_amount('ETH-PLN'), Amount(0))
+
+    def test_quote_sell_same_as_sell(self):
+        ledger = LotLedger.from_data(self.data_lol)
+        for amount in ['0.1', '0.25', '0.3', '0.75', '2']:
+            quote = ledger.quote_sell('BTC-PLN', Amount.parse(amount), Rate.parse('4000'))
+            # Quotes don't change the lots
+            self.assertEqual(ledger.get_open_amount('BTC-PLN'), Amount.parse('0.75'))
+
+            ledger_copy = LotLedger.from_data(self.data_lol)
+            self.assertEqual(quote[:2], ledger_copy.sell('BTC-PLN', Amount.parse(amount), Rate.parse('4000')))
+            self.assertEqual(quote[2], min(Amount.parse(amount).units, Amount.parse('0.75').units))
+
+        # Prefix sums kept up to date
+        ledger.sell('BTC-PLN', Amount.parse('0.5'), Rate.parse('4000'))
+        ledger.add_buy('BTC-PLN', Amount.parse('1'), Rate.parse('5000'))
+        self.assertEqual(ledger.quote_sell('BTC-PLN', Amount.parse('0.5'), Rate.parse('4000')),
+                         (Amount.parse('0.5').units * Rate.parse('4000').units,
+                          Amount.parse('0.25').units * Rate.parse('2000').units +
+                          Amount.parse('0.25').units * Rate.parse('5000').units,
+                          Amount.parse('0.5').units))
+
+    def test_lots_of_all_markets(self):
+        # 1 EUR = 4.3 PLN on every day
+        rates = ExchangeRates({'EUR': ([20190102], [Rate.parse('4.3').units])})
+        ledger = LotLedger(rates)
+        ledger.add_buy('BTC - EUR', Amount.parse('0.5'), Rate.parse('1000'), '03-01-2019 10:00:00')
+        ledger.add_buy('BTC - PLN', Amount.parse('1'), Rate.parse('2000'), '03-01-2019 10:00:01')
+        self.assertEqual(ledger.get_open_amount('BTC - PLN'), Amount.parse('1.5'))
+        income, cost = ledger.sell('BTC - PLN', Amount.parse('1'), Rate.parse('3000'), '03-01-2019 10:00:02')
+        self.assertEqual(Taxer.get_gains_results(income, cost, ledger.scale),
+                         {'income': '3000.00', 'cost': '3150.00', 'gain': '-150.00'})
+
+    def test_not_converted(self):
+        ledger = LotLedger()
+        with self.assertRaises(ValueError):
+            ledger.add_buy('BTC - EUR', Amount.parse('0.5'), Rate.parse('1000'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+from datetime import datetime
+from decimal import Decimal
+
+try:
+    # Python 3.9+, local time of the machine otherwise
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+
+from modules.HistoryConverter import HistoryConverter
+from modules.NativeExport import NativeExport
+from modules.Money import Money, Amount, Rate, PRODUCT_SCALE
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+
+class ApiHistory:
+    """
+    Trades and their fees from the REST API (v1_01) in the bitbay CSV format, with an 'ID' column on both sides:
+     the ID of the trade, and for a fee the ID of the trade it was charged for ('detailId' of the balance
+     operation). Feeer.include_fees() then joins them on it instead of guessing.
+    """
+
+    FEE_TYPE = 'TRANSACTION_COMMISSION_OUTCOME'
+    KINDS = {'buy': 'Kupno', 'sell': 'Sprzedaż'}
+    # Dates of the web exports are in the local time of the exchange
+    TIMEZONE = 'Europe/Warsaw'
+
+    @staticmethod
+    def get_date(timestamp_ms):
+        """
+        :param timestamp_ms: Milliseconds since the epoch, as a number or text
+        :return: 'dd-mm-YYYY HH:MM:SS'
+        """
+        timezone = ZoneInfo(ApiHistory.TIMEZONE) if ZoneInfo is not None else None
+        return datetime.fromtimestamp(int(timestamp_ms) / 1000, timezone).strftime(NativeExport.DATE_FORMAT)
+
+    @staticmethod
+    def get_number(value):
+        """
+        :param value: Number as given by the API, text or float (e.g. 1e-05)
+        :return: Text with a decimal point, without an exponent
+        """
+        return format(Decimal(str(value)), 'f')
+
+    @staticmethod
+    def transactions_to_lol(items):
+        """
+        :param items: Items of the trading history (/trading/history/transactions), e.g. {'id': '...',
+         'market': 'BTC-PLN', 'time': '1546723534000', 'amount': '0.3692029', 'rate': '14440.01',
+         'userAction': 'Sell', 'wasTaker': True, ...}
+        :return: List of lists in the transactions CSV format with an 'ID' column, headers first
+        """
+        data_lol = [HistoryConverter.HEADERS['transactions'] + ['ID']]
+        for item in items:
+            amount = Amount.parse(ApiHistory.get_number(item['amount']))
+            rate = Rate.parse(ApiHistory.get_number(item['rate']))
+            data_lol.append([NativeExport.get_market(item['market']),
+                             ApiHistory.get_date(item['time']),
+                             ApiHistory.KINDS[item['userAction'].lower()],
+                             'Taker' if item['wasTaker'] else 'Maker',
+                             ApiHistory.get_number(item['rate']),
+                             str(amount),
+                             str(Money.from_units(amount.units * rate.units, PRODUCT_SCALE)),
+                             str(item['id'])])
+        return data_lol
+
+    @staticmethod
+    def fees_to_lol(items):
+        """
+        :param items: Items of the balance history (/balances/BITBAY/history), e.g. {'historyId': '...',
+         'detailId': '...', 'time': 1546723534000, 'type': 'TRANSACTION_COMMISSION_OUTCOME', 'value': -8.2,
+         'balance': {'currency': 'PLN', ...}, 'fundsAfter': {'total': 9155.01, ...}, ...}. Other types are skipped
+        :return: List of lists in the fees CSV format with an 'ID' column (of the trade), headers first
+        """
+        data_lol = [HistoryConverter.HEADERS['fees'] + ['ID']]
+        for item in items:
+            if item['type'] != ApiHistory.FEE_TYPE:
+                continue
+            data_lol.append([ApiHistory.get_date(item['time']),
+                             '{}: {}'.format(NativeExport.FEE_KIND, item['balance']['currency']),
+                             ApiHistory.get_number(item['value']).lstrip('-'),
+                             ApiHistory.get_number(item['fundsAfter']['total']),
+                             str(item['detailId'])])
+        return data_lol
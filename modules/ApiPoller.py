@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+import json
+import os
+# https://docs.python.org/3/library/sched.html
+import sched
+import time
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+
+class ApiPoller:
+    """
+    Keeps a local operations history complete with as few API calls as possible.
+    The API returns only a page (200) of the newest operations, so more operations between two calls are lost.
+    Every currency is polled on its own schedule:
+     * IDs of the newest operations seen are remembered (persisted), operations after them are new. IDs are
+       only compared for equality, they don't need to be numbers nor to grow, the order is the operation time
+     * a page full of new operations means there may be more: older pages are fetched (cursor: the oldest ID
+       of the last page) until a known operation shows up, so the gap is filled
+     * new operations near the page limit halve the interval, none (or a failed fetch) double it (within the
+       limits)
+    API calls are at least call_interval seconds apart.
+    """
+
+    # Share of the page limit that counts as near the limit
+    HIGH_WATER = 0.5
+    # IDs of the newest operations remembered per currency, in pages
+    SEEN_PAGES = 2
+
+    def __init__(self, fetch, currencies, state_path, on_operations, limit=200, min_interval=10.0,
+                 max_interval=3600.0, call_interval=1.0, timefunc=time.monotonic, delayfunc=time.sleep):
+        """
+        :param fetch: function(currency, limit, before_id) -> list of operations (dicts with 'id' and 'time'),
+         newest first, only the ones older than before_id when it's not None
+        :param on_operations: function(currency, operations), new operations oldest first
+        :param state_path: JSON file with the newest operation and interval per currency
+        """
+        self.fetch = fetch
+        self.currencies = currencies
+        self.state_path = state_path
+        self.on_operations = on_operations
+        self.limit = limit
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.call_interval = call_interval
+        self.timefunc = timefunc
+        self.delayfunc = delayfunc
+        self.scheduler = sched.scheduler(timefunc, delayfunc)
+        self.last_call = None
+        self.calls = 0
+        self.polls_left = None
+        # currency -> {'newest_id': ID or None, 'seen_ids': [ID, ...] oldest first, 'interval': seconds}
+        self.state = {}
+        self.load_state()
+
+    def load_state(self):
+        if os.path.exists(self.state_path):
+            with open(self.state_path, encoding="utf-8") as state_file:
+                self.state = json.load(state_file)
+        for currency in self.currencies:
+            state = self.state.setdefault(currency, {'newest_id': None, 'interval': self.min_interval})
+            # State saved before the seen IDs
+            state.setdefault('seen_ids', [state['newest_id']] if state['newest_id'] is not None else [])
+
+    def save_state(self):
+        with open(self.state_path + '.tmp', 'w', encoding="utf-8") as state_file:
+            json.dump(self.state, state_file)
+        os.replace(self.state_path + '.tmp', self.state_path)
+
+    @staticmethod
+    def get_time(operation):
+        """
+        :return: Time of the operation for ordering, 'YYYY-MM-DD HH:MM:SS' or a timestamp
+        """
+        return operation['time']
+
+    def run(self, polls=None):
+        """
+        :param polls: Stop after that many polls (all the currencies), forever if None
+        """
+        self.polls_left = polls
+        for currency in self.currencies:
+            self.scheduler.enter(0, 1, self.poll, (currency,))
+        self.scheduler.run()
+
+    def poll(self, currency):
+        state = self.state[currency]
+        bootstrap = not state['seen_ids']
+        try:
+            operations = self.fetch_new(currency, state['seen_ids'])
+        except Exception as e:
+            # Network or API errors shouldn't stop the polling. Nothing is marked as seen, so the next poll
+            # fetches the same operations again
+            state['interval'] = min(self.max_interval, state['interval'] * 2)
+            self.save_state()
+            log.warning('"{}": fetch failed ("{}: {}"), next poll in "{}" s'.format(currency, type(e).__name__, e,
+                                                                                   state['interval']))
+            self.schedule_next(currency)
+            return
+
+        if operations:
+            self.on_operations(currency, operations)
+            state['newest_id'] = operations[-1]['id']
+            state['seen_ids'] = (state['seen_ids'] + [o['id'] for o in operations])[
+                -self.limit * ApiPoller.SEEN_PAGES:]
+
+        # The whole history on the first poll says nothing about the pace
+        if not bootstrap and len(operations) >= self.limit * ApiPoller.HIGH_WATER:
+            state['interval'] = max(self.min_interval, state['interval'] / 2)
+        elif not bootstrap and not operations:
+            state['interval'] = min(self.max_interval, state['interval'] * 2)
+        self.save_state()
+        log.info('"{}": "{}" new operations, next poll in "{}" s'.format(currency, len(operations),
+                                                                       state['interval']))
+        self.schedule_next(currency)
+
+    def schedule_next(self, currency):
+        """
+        Next poll of the currency after its interval, unless that was the last poll
+        """
+        if self.polls_left is not None:
+            self.polls_left -= 1
+            if self.polls_left <= 0:
+                for event in self.scheduler.queue:
+                    self.scheduler.cancel(event)
+                return
+        self.scheduler.enter(self.state[currency]['interval'], 1, self.poll, (currency,))
+
+    def fetch_new(self, currency, seen_ids):
+        """
+        :param seen_ids: IDs of the newest operations seen, empty for the whole history
+        :return: New operations, oldest first (by time, operations of the same time as given by the API)
+        """
+        seen = set(seen_ids)
+        new_operations = []
+        before_id = None
+        while True:
+            page = self.call(currency, before_id)
+            for operation in page:
+                if operation['id'] in seen:
+                    return sorted(new_operations[::-1], key=ApiPoller.get_time)
+                new_operations.append(operation)
+
+            # A full page of new operations, there may be more between it and the newest one seen
+            if len(page) < self.limit:
+                if seen:
+                    log.warning('"{}": none of the operations seen found, history may be incomplete'.format(
+                        currency))
+                return sorted(new_operations[::-1], key=ApiPoller.get_time)
+            before_id = page[-1]['id']
+            log.info('"{}": a page full of new operations ("{}" so far), fetch older ones'.format(
+                currency, len(new_operations)))
+
+    def call(self, currency, before_id):
+        """
+        fetch() no more often than every call_interval
+        """
+        if self.last_call is not None:
+            wait = self.last_call + self.call_interval - self.timefunc()
+            if wait > 0:
+                self.delayfunc(wait)
+        self.last_call = self.timefunc()
+        self.calls += 1
+        return self.fetch(currency, self.limit, before_id)
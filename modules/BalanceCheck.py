@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+from datetime import datetime
+from itertools import zip_longest
+
+from modules.Taxer import Taxer
+from modules.Feeer import Feeer
+from modules.Money import Amount
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+
+class BalanceCheck:
+    """
+    Validation of the histories against the 'Saldo po' (balance after) column of the fees, before any of the
+     calculations. Missing or duplicated paste blocks show up here with their rows, instead of as a failing
+     assert in Feeer.sanity_check_of_groups() much later.
+
+    Both histories are walked once, group by group (the same groups as Feeer), and the balance of every currency
+     is replayed: BUYs add the amount and take the value, SELLs the other way round, fees are taken. At every
+     group with a fee in a currency the replayed balance is compared with the reported one, then synchronised,
+     so a single gap gives a single divergence. Consecutive divergences of a currency are merged into one range.
+
+    Deposits and withdrawals are not in the histories, they show up as divergences too.
+    """
+
+    @staticmethod
+    def check(transactions_data, fees_data):
+        """
+        :param transactions_data: List of lists in the bitbay CSV format, headers first
+        :param fees_data: List of lists in the bitbay CSV format, headers first
+        :return: List of divergences (dictionaries, see format()), empty when all is consistent
+        """
+        tran_col_idx = Taxer.get_col_indexes(transactions_data)
+        fees_col_idx = Feeer.get_col_indexes(fees_data)
+        date_idx = tran_col_idx['Data operacji']
+        younger_first = len(transactions_data) > 2 and \
+            datetime.strptime(transactions_data[1][date_idx], '%d-%m-%Y %H:%M:%S') > \
+            datetime.strptime(transactions_data[-1][date_idx], '%d-%m-%Y %H:%M:%S')
+
+        divergences = []
+        # currency -> [last reported balance units, change units of the groups since, first rows of its group]
+        balances = {}
+        tran_position = 1
+        fees_position = 1
+        # A group missing at the end of either history pairs with an empty one
+        for tran_group, fees_group in zip_longest(Feeer.iter_groups_by_date(transactions_data[1:], tran_col_idx),
+                                                  Feeer.iter_groups_by_date(fees_data[1:], fees_col_idx),
+                                                  fillvalue=[]):
+            rows = ((tran_position, tran_position + len(tran_group) - 1),
+                    (fees_position, fees_position + len(fees_group) - 1))
+            if len(tran_group) != len(fees_group):
+                divergences.append({'kind': 'count', 'rows': rows, 'expected': len(tran_group),
+                                    'reported': len(fees_group)})
+                # Groups after that are not paired any more
+                return divergences
+
+            seen = set()
+            for fees_row in fees_group:
+                if tuple(fees_row) in seen:
+                    divergences.append({'kind': 'duplicate', 'rows': rows, 'expected': '', 'reported': fees_row})
+                seen.add(tuple(fees_row))
+
+            changes, reported = BalanceCheck.get_group_changes(tran_group, fees_group, tran_col_idx, fees_col_idx,
+                                                               younger_first)
+            for currency in set(changes) | set(reported):
+                balance = balances.setdefault(currency, [None, 0, None])
+                if currency not in reported:
+                    balance[1] += changes[currency]
+                    continue
+
+                if balance[0] is not None:
+                    if younger_first:
+                        # The balance reported in the younger group, replayed from this one
+                        expected, actual = reported[currency] + balance[1], balance[0]
+                    else:
+                        expected, actual = balance[0] + balance[1] + changes.get(currency, 0), reported[currency]
+                    if expected != actual:
+                        BalanceCheck.add_divergence(divergences, currency, balance[2], rows, expected, actual)
+                balance[0] = reported[currency]
+                balance[1] = changes.get(currency, 0) if younger_first else 0
+                balance[2] = (rows[0][0], rows[1][0])
+
+            tran_position += len(tran_group)
+            fees_position += len(fees_group)
+
+        return divergences
+
+    @staticmethod
+    def get_group_changes(tran_group, fees_group, tran_col_idx, fees_col_idx, younger_first):
+        """
+        :return: Tuple (currency -> change of the balance in the group, currency -> last balance reported in it),
+         in units of Amount
+        """
+        changes = {}
+        for row in tran_group:
+            base, _, quote = row[tran_col_idx['Rynek']].replace(' ', '').partition('-')
+            amount = Amount.parse(row[tran_col_idx['Ilość']]).units
+            value = Amount.parse(row[tran_col_idx['Wartość']]).units
+            sign = 1 if row[tran_col_idx['Rodzaj']] == 'Kupno' else -1
+            changes[base] = changes.get(base, 0) + sign * amount
+            changes[quote] = changes.get(quote, 0) - sign * value
+
+        reported = {}
+        # The last one in time is the first one when younger first
+        for row in (reversed(fees_group) if younger_first else fees_group):
+            currency = row[fees_col_idx['Rodzaj']].rpartition(':')[2].strip()
+            changes[currency] = changes.get(currency, 0) - Amount.parse(row[fees_col_idx['Wartość']]).units
+            reported[currency] = Amount.parse(row[fees_col_idx['Saldo po']]).units
+
+        return changes, reported
+
+    @staticmethod
+    def add_divergence(divergences, currency, first_rows, rows, expected, reported):
+        """
+        Extends the last divergence of the currency when it ends where this one starts
+        """
+        for divergence in reversed(divergences):
+            if divergence.get('currency') == currency:
+                if divergence['end'] == first_rows:
+                    divergence['rows'] = tuple((a[0], b[1]) for a, b in zip(divergence['rows'], rows))
+                    divergence['end'] = (rows[0][0], rows[1][0])
+                    divergence['reported'] = str(Amount(reported))
+                    return
+                break
+
+        divergences.append({'kind': 'balance', 'currency': currency, 'end': (rows[0][0], rows[1][0]),
+                            'rows': ((first_rows[0], rows[0][1]), (first_rows[1], rows[1][1])),
+                            'expected': str(Amount(expected)), 'reported': str(Amount(reported))})
+
+    @staticmethod
+    def format(divergence):
+        """
+        :return: Divergence as text, rows are numbered as lines of the CSV files (headers are line 1)
+        """
+        (tran_first, tran_last), (fees_first, fees_last) = divergence['rows']
+        where = 'transactions lines {}-{}, fees lines {}-{}'.format(tran_first + 1, tran_last + 1,
+                                                                     fees_first + 1, fees_last + 1)
+        if divergence['kind'] == 'count':
+            return '{}: "{}" transactions, but "{}" fees (missing or extra rows)'.format(
+                where, divergence['expected'], divergence['reported'])
+        if divergence['kind'] == 'duplicate':
+            return '{}: duplicated fees row {}'.format(where, divergence['reported'])
+        return '{}: {} balance replayed as "{}", but reported as "{}"'.format(
+            where, divergence['currency'], divergence['expected'], divergence['reported'])
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+import glob
+import hashlib
+import json
+import os
+import time
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+
+class Checkpoint:
+    """
+    Progress of a calculator run saved to a JSON file, so that a run failing late (e.g. on a sanity check of
+    one group of fees or a bad row near the end) can be resumed after the fix instead of starting from zero.
+
+    Stages store their own state under their name, plus rows appended to a journal of the stage (a JSON line
+     each, written only at saves, so a save costs the rows since the last one and not the whole history):
+     * 'fee_groups': journal of the fees matched by the heuristic, per hash of the group content, see Feeer
+     * 'fifo': rows done, hashes of their content and the fronts of the lot queues, the results in the journal,
+       see Taxer
+    Work is reused only where the hashes of the current input match, so fixed rows are calculated again.
+    """
+
+    VERSION = 2
+
+    def __init__(self, path, interval=30.0, key=''):
+        """
+        :param path: JSON file, see get_path_for()
+        :param interval: Minimum seconds between periodic saves
+        :param key: Anything else the results depend on (e.g. exchange rates), a checkpoint with
+         a different key is not resumed
+        """
+        self.path = path
+        self.interval = interval
+        self.key = key
+        self.state = {}
+        self.last_save = time.monotonic()
+        # stage -> rows for the journal at the next save
+        self.pending = {}
+        # stage -> number of rows in the journal: written by this run, and saved by the previous one
+        self.journaled = {}
+        self.saved_journals = {}
+
+    @staticmethod
+    def get_path_for(tax_csv_path):
+        return tax_csv_path[:-4] + '_checkpoint.json'
+
+    def resume(self):
+        """
+        Load the state of a previous run
+        :return: True if there was anything to resume
+        """
+        if not os.path.exists(self.path):
+            log.info('No checkpoint to resume from: "{}"'.format(self.path))
+            return False
+
+        with open(self.path, encoding="utf-8") as checkpoint_file:
+            saved = json.load(checkpoint_file)
+        if saved.get('version') != Checkpoint.VERSION or saved.get('key') != self.key:
+            log.warning('Checkpoint of a different version or settings is ignored: "{}"'.format(self.path))
+            return False
+
+        self.state = saved['state']
+        self.saved_journals = saved['journals']
+        log.info('Resume from checkpoint: "{}"'.format(self.path))
+        return True
+
+    def get(self, stage, default=None):
+        return self.state.get(stage, default)
+
+    def update(self, stage, value):
+        """
+        :param value: State of the stage, it has to be consistent (finished units of work only)
+        """
+        self.state[stage] = value
+
+    def append(self, stage, rows):
+        """
+        :param rows: Rows of JSON values for the journal of the stage. The first save of a run starts the journal
+         over, so rows reused from a previous run have to be appended again.
+        """
+        self.pending.setdefault(stage, []).extend(rows)
+
+    def get_journal(self, stage):
+        """
+        :return: Rows of the journal of the stage saved by the previous run, see resume()
+        """
+        count = self.saved_journals.get(stage, 0)
+        rows = []
+        if count:
+            with open(self.get_journal_path(stage), encoding="utf-8") as journal_file:
+                for line in journal_file:
+                    if len(rows) == count:
+                        # Appended after the last save
+                        break
+                    rows.append(json.loads(line))
+        return rows
+
+    def get_journal_path(self, stage):
+        return '{}.{}.jsonl'.format(self.path[:-5], stage)
+
+    def is_due(self):
+        """
+        :return: True when the last save is older than the interval
+        """
+        return time.monotonic() - self.last_save >= self.interval
+
+    def save(self):
+        # Journals first, rows after the counts saved with the state are ignored
+        for stage, rows in self.pending.items():
+            with open(self.get_journal_path(stage), 'a' if stage in self.journaled else 'w',
+                      encoding="utf-8") as journal_file:
+                journal_file.write(''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows))
+            self.journaled[stage] = self.journaled.get(stage, 0) + len(rows)
+        self.pending = {}
+
+        # Never leave a half written checkpoint behind
+        with open(self.path + '.tmp', 'w', encoding="utf-8") as checkpoint_file:
+            json.dump({'version': Checkpoint.VERSION, 'key': self.key, 'state': self.state,
+                       'journals': dict(self.saved_journals, **self.journaled)}, checkpoint_file, ensure_ascii=False)
+        os.replace(self.path + '.tmp', self.path)
+        self.last_save = time.monotonic()
+        log.debug('Checkpoint saved as: "{}"'.format(self.path))
+
+    def remove(self):
+        for path in [self.path] + glob.glob(glob.escape(self.path[:-5]) + '.*.jsonl'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def hash_rows(rows, hash_object=None):
+        """
+        :param rows: Rows of text (or of values with text representations)
+        :param hash_object: hashlib object to update, a new one otherwise
+        :return: The hashlib object
+        """
+        hash_object = hash_object if hash_object is not None else hashlib.sha1()
+        for row in rows:
+            hash_object.update(('\x1f'.join(str(cell) for cell in row) + '\x1e').encode('utf-8'))
+        return hash_object
+
+    @staticmethod
+    def hash_files(paths, hash_object=None):
+        """
+        :param paths: Files, in the order they are used
+        :return: hashlib object of their names and content
+        """
+        hash_object = hash_object if hash_object is not None else hashlib.sha1()
+        for path in paths:
+            hash_object.update('{}\x1f{}\x1e'.format(os.path.basename(path), os.path.getsize(path)).encode('utf-8'))
+            with open(path, 'rb') as content_file:
+                for chunk in iter(lambda: content_file.read(1024 * 1024), b''):
+                    hash_object.update(chunk)
+        return hash_object
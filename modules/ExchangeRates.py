@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+# https://docs.python.org/3/library/array.html
+from array import array
+from bisect import bisect_left
+import csv
+import json
+import os
+import re
+
+from modules.Money import Rate
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+
+class ExchangeRates:
+    """
+    NBP average exchange rates (table A), for markets quoted in other currencies than PLN.
+    Income and costs in a foreign currency are converted at the rate of the last business day before
+    the transaction, i.e. the last table published before the day of the transaction.
+
+    Tables are loaded from a local directory with files downloaded from nbp.pl:
+     * archive CSV files, e.g. archiwum_tab_a_2019.csv (https://www.nbp.pl/home.aspx?f=/kursy/arch_a.html)
+     * JSON files of the API, e.g. http://api.nbp.pl/api/exchangerates/rates/a/eur/2019-01-01/2019-12-31/
+       or http://api.nbp.pl/api/exchangerates/tables/a/2019-01-01/2019-03-31/
+
+    Crypto currencies of markets like ETH - BTC are valued with PriceIndex at the time of the transaction instead.
+    """
+
+    CACHE_FILE = '.nbp_rates_cache.json'
+
+    def __init__(self, tables=None, prices=None):
+        """
+        :param tables: Dictionary currency code -> (array of dates as YYYYMMDD ints, array of Rate units),
+         both sorted by date
+        :param prices: Dictionary crypto currency code -> PriceIndex
+        """
+        self.tables = tables if tables is not None else {}
+        self.prices = prices if prices is not None else {}
+        # (currency, YYYYMMDD) -> Rate, there are only a few days per many transactions
+        self.memo = {}
+
+    @staticmethod
+    def get_quote_currency(market):
+        """
+        :param market: e.g. 'BTC - EUR' or 'BTC-PLN'
+        :return: e.g. 'EUR'
+        """
+        return market.rpartition('-')[2].strip()
+
+    @staticmethod
+    def get_base_currency(market):
+        """
+        :param market: e.g. 'BTC - EUR' or 'BTC-PLN'
+        :return: e.g. 'BTC', FIFO lots of all the markets of a currency are shared
+        """
+        return market.partition('-')[0].strip()
+
+    @staticmethod
+    def get_day(date_str):
+        """
+        :param date_str: Date in the bitbay format 'dd-mm-YYYY HH:MM:SS'
+        :return: int YYYYMMDD
+        """
+        return int(date_str[6:10] + date_str[3:5] + date_str[0:2])
+
+    def get_rate(self, currency, date_str):
+        """
+        :param currency: e.g. 'EUR'
+        :param date_str: Date of the transaction in the bitbay format 'dd-mm-YYYY HH:MM:SS'
+        :return: Rate in PLN for 1 unit of currency from the last table before the day of the transaction
+        """
+        if currency == 'PLN':
+            return Rate.parse('1')
+        if currency in self.prices:
+            return self.prices[currency].get_rate(date_str)
+
+        day = ExchangeRates.get_day(date_str)
+        key = (currency, day)
+        if key not in self.memo:
+            if currency not in self.tables:
+                raise ValueError('No NBP exchange rates for: "{}"'.format(currency))
+            dates, units = self.tables[currency]
+            i = bisect_left(dates, day)
+            if i == 0:
+                raise ValueError('No NBP exchange rate for "{}" before: "{}"'.format(currency, date_str))
+            log.debug('Rate of {} for {}: {} from {}'.format(currency, date_str, units[i - 1], dates[i - 1]))
+            self.memo[key] = Rate(units[i - 1])
+
+        return self.memo[key]
+
+    def get_currencies(self):
+        return sorted(set(self.tables) | set(self.prices))
+
+    @staticmethod
+    def get_table_paths(directory):
+        """
+        :return: Paths of the NBP table files in the directory, in the order they are read
+        """
+        return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                      if not name.startswith('.') and name.lower().endswith(('.csv', '.json')))
+
+    @staticmethod
+    def load_dir(directory, use_cache=True):
+        """
+        :param directory: Directory with NBP table files (.csv and .json)
+        :param use_cache: Parsed tables are cached in the directory, valid as long as the files don't change
+        :return: ExchangeRates
+        """
+        paths = ExchangeRates.get_table_paths(directory)
+        signature = [[os.path.basename(path), os.stat(path).st_mtime_ns, os.stat(path).st_size] for path in paths]
+        cache_path = os.path.join(directory, ExchangeRates.CACHE_FILE)
+
+        if use_cache and os.path.exists(cache_path):
+            with open(cache_path, encoding="utf-8") as cache_file:
+                cache = json.load(cache_file)
+            if cache['signature'] == signature:
+                log.debug('NBP exchange rates from the cache: "{}"'.format(cache_path))
+                return ExchangeRates({currency: (array('l', dates), array('q', units))
+                                      for currency, (dates, units) in cache['tables'].items()})
+
+        # currency -> {YYYYMMDD: Rate units}, later files win on duplicates
+        by_day = {}
+        for path in paths:
+            log.debug('Read NBP exchange rates from: "{}"'.format(path))
+            if path.lower().endswith('.json'):
+                ExchangeRates.read_json(path, by_day)
+            else:
+                ExchangeRates.read_archive_csv(path, by_day)
+
+        tables = {}
+        for currency, rates in by_day.items():
+            days = sorted(rates)
+            tables[currency] = (array('l', days), array('q', [rates[day] for day in days]))
+        log.info('NBP exchange rates loaded for: {}'.format(', '.join(sorted(tables))))
+
+        if use_cache:
+            with open(cache_path, 'w', encoding="utf-8") as cache_file:
+                json.dump({'signature': signature,
+                           'tables': {currency: [list(dates), list(units)]
+                                      for currency, (dates, units) in tables.items()}}, cache_file)
+
+        return ExchangeRates(tables)
+
+    @staticmethod
+    def read_archive_csv(path, by_day):
+        """
+        Header: data;1USD;1THB;...;100HUF;...;nr tabeli;pełny numer tabeli
+        Rows: 20190102;3,7619;0,1161;...
+        Rows with descriptions of currencies and footers are skipped.
+        """
+        with open(path, newline='', encoding="cp1250") as csvfile:
+            columns = {}
+            for row in csv.reader(csvfile, delimiter=';'):
+                if row and row[0] == 'data':
+                    columns = {}
+                    for i in range(1, len(row)):
+                        match = re.fullmatch(r'(1(?:0*))([A-Z]{3})', row[i].strip())
+                        if match:
+                            # Rates of e.g. 100HUF shift the decimal point
+                            columns[i] = (match.group(2), len(match.group(1)) - 1)
+                    continue
+                if not row or not re.fullmatch(r'\d{8}', row[0]):
+                    continue
+
+                for i, (currency, shift) in columns.items():
+                    if i < len(row) and row[i].strip():
+                        integer, _, fraction = row[i].strip().partition(',')
+                        rate = Rate.from_units(int(integer + fraction), len(fraction) + shift)
+                        by_day.setdefault(currency, {})[int(row[0])] = rate.units
+
+    @staticmethod
+    def read_json(path, by_day):
+        """
+        Either a series of a single currency: {"code": "EUR", "rates": [{"effectiveDate": ..., "mid": ...}]}
+        or a list of whole tables: [{"effectiveDate": ..., "rates": [{"code": "EUR", "mid": ...}]}]
+        """
+        with open(path, encoding="utf-8") as json_file:
+            # Exact values, no floats
+            content = json.load(json_file, parse_float=str, parse_int=str)
+
+        if isinstance(content, dict):
+            entries = [(content['code'], rate['effectiveDate'], rate['mid']) for rate in content['rates']]
+        else:
+            entries = [(rate['code'], table['effectiveDate'], rate['mid'])
+                       for table in content for rate in table['rates']]
+
+        for currency, effective_date, mid in entries:
+            by_day.setdefault(currency, {})[int(effective_date.replace('-', ''))] = Rate.parse(mid).units
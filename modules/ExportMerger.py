@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+import csv
+import heapq
+from itertools import chain
+import os
+
+from modules.NativeExport import NativeExport
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+
+class ExportMerger:
+    """
+    The official bitbay CSV export covers only three months, so a history is a set of overlapping files.
+    Files are streamed and merged by the operation time (a heap over the current row of every file), rows
+     present in more than one file are dropped on the fly. The result is a single stream, younger first
+     like a bitbay export.
+    """
+
+    # Columns identifying a row, for transactions and fees
+    KEY_COLUMNS = {
+        'transactions': ['Data operacji', 'Rynek', 'Rodzaj', 'Kurs', 'Ilość'],
+        'fees': ['Data operacji', 'Rodzaj', 'Wartość', 'Saldo po'],
+    }
+
+    # Bytes read at once when reading a file backwards
+    BLOCK_SIZE = 64 * 1024
+
+    @staticmethod
+    def iter_rows(path):
+        """
+        :param path: A bitbay CSV file (also an official export, see NativeExport), or a directory with many of
+         them (merged)
+        :return: Generator of rows, headers first
+        """
+        if os.path.isdir(path):
+            paths = sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith('.csv'))
+            return ExportMerger.merge(paths)
+
+        return NativeExport.iter_rows(path)
+
+    @staticmethod
+    def merge(paths):
+        """
+        :param paths: bitbay CSV files of the same kind (transactions or fees), in any order
+        :return: Generator of rows, headers first, younger first, without duplicates
+        """
+        if not paths:
+            raise ValueError('No CSV files to merge')
+
+        headers = None
+        streams = []
+        for path in paths:
+            file_headers, stream = ExportMerger.open_younger_first(path)
+            if headers is not None and file_headers != headers:
+                raise ValueError('Different headers in: "{}"'.format(path))
+            headers = file_headers
+            streams.append(stream)
+
+        date_idx = headers.index('Data operacji')
+        history_type = 'transactions' if 'Rynek' in headers else 'fees'
+        # Operation IDs (see Feeer.include_fees()) identify a row on their own
+        key_columns = ['ID'] if 'ID' in headers else ExportMerger.KEY_COLUMNS[history_type]
+        key_idx = [headers.index(column) for column in key_columns]
+        log.debug('Merge "{}" {} files'.format(len(paths), history_type))
+
+        yield headers
+
+        tagged_streams = [ExportMerger.tag_rows(stream, i, date_idx) for i, stream in enumerate(streams)]
+
+        # Rolling window of the current second: row key -> [rows given, rows seen per file...]
+        window_time = None
+        window = {}
+        duplicates = 0
+        for time, file_idx, row in heapq.merge(*tagged_streams, key=lambda tagged: tagged[0], reverse=True):
+            if time != window_time:
+                window_time = time
+                window = {}
+
+            counts = window.setdefault(tuple(row[i] for i in key_idx), [0] * (len(streams) + 1))
+            counts[file_idx + 1] += 1
+            # The same fill can be there more than once within a second, as many times as in any single file
+            if counts[file_idx + 1] > counts[0]:
+                counts[0] += 1
+                yield row
+            else:
+                duplicates += 1
+
+        log.info('Merged "{}" files, "{}" duplicate rows dropped'.format(len(paths), duplicates))
+
+    @staticmethod
+    def tag_rows(rows, file_idx, date_idx):
+        """
+        :return: Generator of tuples (sort key of the date, file_idx, row)
+        """
+        for row in rows:
+            yield ExportMerger.get_sort_key(row[date_idx]), file_idx, row
+
+    @staticmethod
+    def get_sort_key(date_str):
+        """
+        :param date_str: 'dd-mm-YYYY HH:MM:SS'
+        :return: 'YYYYmmddHH:MM:SS', sorts in time order
+        """
+        return date_str[6:10] + date_str[3:5] + date_str[0:2] + date_str[11:]
+
+    @staticmethod
+    def open_younger_first(path):
+        """
+        :return: Tuple (headers, generator of the rows younger first), files older first are read backwards
+        """
+        delimiter, headers, convert = NativeExport.inspect(path)
+        rows = NativeExport.iter_rows(path)
+        next(rows)
+        first_row = next(rows, None)
+        if first_row is None:
+            return headers, iter(())
+
+        date_idx = headers.index('Data operacji')
+        last_row = next(ExportMerger.iter_rows_backwards(path, delimiter, convert), first_row)
+        if ExportMerger.get_sort_key(first_row[date_idx]) < ExportMerger.get_sort_key(last_row[date_idx]):
+            log.debug('Read backwards: "{}"'.format(path))
+            rows.close()
+            return headers, ExportMerger.iter_rows_backwards(path, delimiter, convert)
+
+        return headers, chain([first_row], rows)
+
+    @staticmethod
+    def iter_rows_backwards(path, delimiter=';', convert=None):
+        """
+        :param convert: Row converter, see NativeExport.get_converter()
+        :return: Generator of the rows from the last one, without headers. No new lines within values
+         (bitbay CSV files have none)
+        """
+        with open(path, 'rb') as binary_file:
+            headers_end = len(binary_file.readline())
+            position = binary_file.seek(0, os.SEEK_END)
+            rest = b''
+            while position > headers_end:
+                size = min(ExportMerger.BLOCK_SIZE, position - headers_end)
+                position -= size
+                binary_file.seek(position)
+                lines = (binary_file.read(size) + rest).split(b'\n')
+                # The first line can be incomplete, unless we are at the headers
+                rest = lines.pop(0) if position > headers_end else b''
+                for line in reversed(lines):
+                    line = line.rstrip(b'\r')
+                    if line:
+                        row = next(csv.reader([line.decode('utf-8')], delimiter=delimiter))
+                        row = row if convert is None else convert(row)
+                        if row is not None:
+                            yield row
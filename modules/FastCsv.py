@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+import csv
+import gc
+import re
+from itertools import islice, repeat
+from operator import mul
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+
+class FastCsv:
+    """
+    Reader of the fixed CSV dialect of bitbay and of the files written here: ';' separated, UTF-8, no quoting
+     in practice, known columns.
+    Large blocks are read and split in bulk: lines with str.split(), and when all the lines of a block have the
+     expected number of cells, all the cells at once, regrouped into rows by zip(). No per character state machine
+     as in csv.reader, and no collections of the garbage collector for every few hundred rows (it is paused while
+     a block is split). The headers are checked once.
+    Typed columns become int units (see FixedPoint) column by column: a whole column of a block is validated by
+     a single regular expression and converted by int(). Up to SCALE decimal places are taken (e.g. rates in PLN
+     with 2), zero padded, values in other formats go through parse().
+    A quote anywhere hands the rest of the file over to csv.reader, so quoted cells are still read right.
+    """
+
+    BUFFER_SIZE = 4 * 1024 * 1024
+
+    # (scale, decimal places) -> pattern of a column of values with exactly that many decimal places, one per line,
+    #  (scale, None) -> with up to scale decimal places
+    patterns = {}
+
+    @staticmethod
+    def iter_rows(path, expected_headers=None, types=None, buffer_size=BUFFER_SIZE):
+        """
+        :param expected_headers: Headers the file has to have (ValueError otherwise), anything when None
+        :param types: Dictionary header -> Money, Amount or Rate. Cells of these columns become int units of the
+         class (Amount.of() and the like take them), rows of other lengths (e.g. a footer) are left as text
+        :return: Generator of rows (lists), headers first, as csv.reader gives them
+        """
+        with open(path, newline='', encoding="utf-8-sig") as csvfile:
+            headers = None
+            converters = []
+            rows_done = 0
+            tail = ''
+            while True:
+                block = csvfile.read(buffer_size)
+                if '"' in block:
+                    # Quoted cells, maybe with the separator or new lines inside
+                    log.debug('Quotes in: "{}", read with csv.reader'.format(path))
+                    yield from FastCsv.iter_rows_slowly(path, rows_done, headers, expected_headers, types)
+                    return
+
+                if not block:
+                    lines = [tail.rstrip('\r')] if tail else []
+                else:
+                    block = tail + block
+                    if '\r' in block:
+                        block = block.replace('\r\n', '\n')
+                    lines = block.split('\n')
+                    # Not complete until the next block (or the end)
+                    tail = lines.pop()
+
+                if lines and headers is None:
+                    headers = lines.pop(0)
+                    headers = headers.split(';') if headers else []
+                    converters = FastCsv.check_headers(path, headers, expected_headers, types)
+                    rows_done += 1
+                    yield headers
+
+                gc_enabled = gc.isenabled()
+                gc.disable()
+                try:
+                    rows = FastCsv.split_lines(lines, len(headers or ()), converters)
+                finally:
+                    if gc_enabled:
+                        gc.enable()
+                rows_done += len(rows)
+                yield from rows
+
+                if not block:
+                    return
+
+    @staticmethod
+    def iter_rows_slowly(path, rows_done, headers, expected_headers, types):
+        """
+        Rest of the file by csv.reader, after rows_done rows (without quotes, so one per line)
+        """
+        with open(path, newline='', encoding="utf-8-sig") as csvfile:
+            reader = islice(csv.reader(csvfile, delimiter=';'), rows_done, None)
+            if headers is None:
+                headers = next(reader, None)
+                if headers is None:
+                    return
+                yield headers
+            converters = FastCsv.check_headers(path, headers, expected_headers, types)
+            for row in reader:
+                for position, cls in converters:
+                    FastCsv.convert_column([row], position, cls, len(headers))
+                yield row
+
+    @staticmethod
+    def check_headers(path, headers, expected_headers, types):
+        """
+        :return: List of (column position, class)
+        """
+        if expected_headers is not None and headers != list(expected_headers):
+            raise ValueError('Unexpected columns in "{}": {}, expected: {}'.format(path, headers,
+                                                                                   list(expected_headers)))
+        return [(headers.index(column), cls) for column, cls in (types or {}).items()]
+
+    @staticmethod
+    def split_lines(lines, width, converters=()):
+        """
+        :param converters: List of (column position, class), see check_headers()
+        :return: List of rows, an empty line is an empty row
+        """
+        if width and lines and '' not in lines and \
+                list(map(str.count, lines, repeat(';'))).count(width - 1) == len(lines):
+            # Whole columns are slices of the cells
+            cells = ';'.join(lines).split(';')
+            for position, cls in converters:
+                cells[position::width] = FastCsv.parse_units(cells[position::width], cls)
+            return list(map(list, zip(*[iter(cells)] * width)))
+
+        rows = [line.split(';') if line else [] for line in lines]
+        for position, cls in converters:
+            FastCsv.convert_column(rows, position, cls, width)
+        return rows
+
+    @staticmethod
+    def convert_column(rows, position, cls, width):
+        """
+        Cells at position become int units of cls, in the rows of the given width
+        """
+        rows = [row for row in rows if len(row) == width]
+        for row, units in zip(rows, FastCsv.parse_units([row[position] for row in rows], cls)):
+            row[position] = units
+
+    @staticmethod
+    def get_pattern(scale, decimals=None):
+        """
+        :param decimals: Exact number of decimal places, up to scale when None
+        :return: Compiled pattern of a column of values, one per line
+        """
+        key = (scale, decimals)
+        if key not in FastCsv.patterns:
+            if decimals is None:
+                fraction = r'(?:\.\d{{1,{}}})?'.format(scale)
+            elif decimals:
+                fraction = r'\.\d{{{}}}'.format(decimals)
+            else:
+                fraction = ''
+            FastCsv.patterns[key] = re.compile(r'(?:[+-]?\d+{0}\n)*[+-]?\d+{0}'.format(fraction), re.ASCII)
+        return FastCsv.patterns[key]
+
+    @staticmethod
+    def parse_units(texts, cls):
+        """
+        :param texts: Values as text, e.g. ['0.06777000', '-500.00000000', '14440.01']
+        :return: List of int units of cls, see FixedPoint
+        """
+        if not texts:
+            return []
+
+        joined = '\n'.join(texts)
+        # The same decimal places in the whole column, as the first value
+        first = texts[0]
+        decimals = len(first) - first.index('.') - 1 if '.' in first else 0
+        if decimals <= cls.SCALE and FastCsv.get_pattern(cls.SCALE, decimals).fullmatch(joined):
+            units = list(map(int, joined.replace('.', '').split('\n')))
+            if decimals == cls.SCALE:
+                return units
+            return list(map(mul, units, repeat(10 ** (cls.SCALE - decimals))))
+
+        if FastCsv.get_pattern(cls.SCALE).fullmatch(joined):
+            scale = cls.SCALE
+            return [int(whole + fraction.ljust(scale, '0'))
+                    for whole, _, fraction in (text.partition('.') for text in texts)]
+        return [cls.parse(text).units for text in texts]
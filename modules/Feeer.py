@@ -1,12 +1,14 @@
 #!/usr/bin/env python3
 # mk (c) 2018
 
-from decimal import Decimal
 from datetime import datetime
 # https://docs.python.org/3/library/collections.html#collections.OrderedDict
 from collections import OrderedDict
 
 from modules.Taxer import Taxer
+from modules.Money import Money, Amount, Rate, PRODUCT_SCALE
+from modules.ExchangeRates import ExchangeRates
+from modules.Checkpoint import Checkpoint
 
 import logging
 log = logging.getLogger('bitbay_tax_calculator')
@@ -18,15 +20,20 @@ class Feeer:
     """
 
     @staticmethod
-    def include_fees(transactions_data, fees_data):
+    def include_fees(transactions_data, fees_data, rates=None, checkpoint=None):
         """
         Obtain valid fees by combining transactions and fees data.
-        Main issue here is that the fees are presented in different order than
+        When both sides carry an 'ID' column (e.g. data from the API) rows are simply joined on it, a transaction
+         with an ID but without a fee gets a zero fee.
+        Main issue for the rest (web export has no IDs) is that the fees are presented in different order than
          relevant transactions. We therefore group them by datetime, sort by value, match,
          and finally present in the natural order of transactions.
 
         :param transactions_data: All data from transactions CSV
         :param fees_data: All data from fees CSV
+        :param rates: ExchangeRates, fees of markets not quoted in PLN are converted at the rate from the business
+         day before the transaction
+        :param checkpoint: Checkpoint, groups matched by the heuristic are saved and reused from it
         :return: Transactions data with an additional row for fees
         """
 
@@ -39,53 +46,188 @@ class Feeer:
         headers.append('Prowizja')
         rows_with_fees = [headers]
 
+        tran_rows = transactions_data[1:]
+        fees_rows = fees_data[1:]
+
+        # Hash join on IDs, whatever is left goes to the heuristic
+        fees_rows_for_tran_rows = [None] * len(tran_rows)
+        if 'ID' in tran_col_idx and 'ID' in fees_col_idx:
+            log.debug("==> Join transactions with fees on IDs")
+            fees_by_id = Feeer.index_entries_by_id(fees_rows, fees_col_idx)
+            joined_fees_positions = set()
+            for i in range(0, len(tran_rows)):
+                tran_id = tran_rows[i][tran_col_idx['ID']]
+                if tran_id in fees_by_id:
+                    fees_position, fees_rows_for_tran_rows[i] = fees_by_id.pop(tran_id)
+                    joined_fees_positions.add(fees_position)
+                elif tran_id:
+                    # No commission charged for it (e.g. 0% maker fee), not a fee to guess
+                    fees_rows_for_tran_rows[i] = Feeer.get_zero_fees_row(tran_rows[i], tran_col_idx, fees_col_idx)
+
+            log.debug('Joined "{}" rows on IDs'.format(len(joined_fees_positions)))
+
+            # Keep the given order of the fees that are left
+            fees_rows = [fees_rows[p] for p in range(0, len(fees_rows)) if p not in joined_fees_positions]
+
+        heuristic_tran_positions = [i for i in range(0, len(tran_rows)) if fees_rows_for_tran_rows[i] is None]
+        if heuristic_tran_positions:
+            heuristic_tran_rows = [tran_rows[i] for i in heuristic_tran_positions]
+            heuristic_fees_rows = Feeer.match_fees_by_heuristic([transactions_data[0]] + heuristic_tran_rows,
+                                                                [fees_data[0]] + fees_rows,
+                                                                tran_col_idx, fees_col_idx, checkpoint)
+            for i, fees_row in zip(heuristic_tran_positions, heuristic_fees_rows):
+                fees_rows_for_tran_rows[i] = fees_row
+        else:
+            assert len(fees_rows) == 0
+
+        for i in range(0, len(tran_rows)):
+            tran_row = tran_rows[i]
+            fees_row_for_tran_row = fees_rows_for_tran_rows[i]
+            log.debug('Transaction row: "{}"'.format(tran_row))
+            log.debug('Corresponding fees row: "{}"'.format(fees_row_for_tran_row))
+
+            # Finally, we can combine both rows
+            combined_row = tran_row
+            combined_row.append(Feeer.get_fee_in_pln(tran_row, fees_row_for_tran_row, tran_col_idx, fees_col_idx,
+                                                     rates))
+
+            log.debug('Combined row: "{}"'.format(combined_row))
+
+            rows_with_fees.append(combined_row)
+
+        return rows_with_fees
+
+    @staticmethod
+    def get_zero_fees_row(tran_row, tran_col_idx, fees_col_idx):
+        """
+        :return: Fees row of a zero fee for the transaction, in the currency its fee would be charged in
+        """
+        market = tran_row[tran_col_idx['Rynek']]
+        currency = ExchangeRates.get_base_currency(market) if tran_row[tran_col_idx['Rodzaj']] == 'Kupno' \
+            else ExchangeRates.get_quote_currency(market)
+        fees_row = [''] * len(fees_col_idx)
+        fees_row[fees_col_idx['Data operacji']] = tran_row[tran_col_idx['Data operacji']]
+        fees_row[fees_col_idx['Rodzaj']] = 'Pobranie prowizji za transakcję: {}'.format(currency)
+        fees_row[fees_col_idx['Wartość']] = '0'
+        fees_row[fees_col_idx['ID']] = tran_row[tran_col_idx['ID']]
+        return fees_row
+
+    @staticmethod
+    def get_fee_in_pln(tran_row, fees_row, tran_col_idx, fees_col_idx, rates=None):
+        """
+        :param rates: ExchangeRates for markets not quoted in PLN
+        :return: Fee of the transaction in PLN, as text
+        """
+        fee_value = fees_row[fees_col_idx['Wartość']]
+        market = tran_row[tran_col_idx['Rynek']]
+        currency = ExchangeRates.get_quote_currency(market)
+        convert = rates is not None and currency != 'PLN'
+        fx = rates.get_rate(currency, tran_row[tran_col_idx['Data operacji']]) if convert else None
+        if tran_row[tran_col_idx['Rodzaj']] == "Kupno":
+            cryptocur = market[:3]
+            rate = tran_row[tran_col_idx['Kurs']]
+            fee_units = Rate.parse(rate).units * Amount.parse(fee_value).units
+            if convert:
+                fee_value_pln = Money.from_units(fee_units * fx.units, PRODUCT_SCALE + Rate.SCALE)
+            else:
+                fee_value_pln = Money.from_units(fee_units, PRODUCT_SCALE)
+            fee_value_pln_str = str(fee_value_pln)
+            log.debug("Fee of {} in {} converted to PLN at rate {} gives {} PLN".format(fee_value, cryptocur,
+                                                                                        rate, fee_value_pln_str))
+            return fee_value_pln_str
+        elif convert:
+            return str(Money.from_units(Amount.parse(fee_value).units * fx.units, PRODUCT_SCALE))
+        else:
+            return fee_value
+
+    @staticmethod
+    def index_entries_by_id(rows, col_indexes):
+        """
+        :param rows: Rows without headers
+        :return: A dict mapping ID -> (given_order_id, row), rows with an empty ID are skipped
+        """
+        entries_by_id = {}
+        for i in range(0, len(rows)):
+            entry_id = rows[i][col_indexes['ID']]
+            if entry_id:
+                if entry_id in entries_by_id:
+                    raise ValueError('Duplicate ID "{}" in rows "{}" and "{}"'.format(entry_id,
+                                                                                   entries_by_id[entry_id][0], i))
+                entries_by_id[entry_id] = (i, rows[i])
+
+        return entries_by_id
+
+    @staticmethod
+    def match_fees_by_heuristic(transactions_data, fees_data, tran_col_idx, fees_col_idx, checkpoint=None):
+        """
+        As we have no primary keys, fees are matched with transactions by grouping by datetime and sorting by value.
+
+        :param transactions_data: Headers + transactions rows
+        :param fees_data: Headers + fees rows
+        :param checkpoint: Checkpoint, matches of groups with unchanged content are reused
+        :return: List of fees rows, in the order of transactions rows
+        """
+
+        fees_rows_for_tran_rows = []
+
         log.debug("==> Create a data structure good enough to combine transactions with proper fees")
         tran_groups = Feeer.group_entries_by_date(transactions_data, tran_col_idx)
         fees_groups = Feeer.group_entries_by_date(fees_data, fees_col_idx)
-        Feeer.sanity_check_of_groups(tran_groups, fees_groups)
+
+        # Group content hash -> fees group positions in the order of the transactions group
+        saved_groups = dict(checkpoint.get_journal('fee_groups')) if checkpoint is not None else {}
 
         log.debug('==> Combine groups')
         for i in range(0, len(tran_groups)):
             tran_group = tran_groups[i]
+            if i >= len(fees_groups) or len(fees_groups[i]) != len(tran_group):
+                # The groups before it are checkpointed, see sanity_check_of_groups() below
+                break
             fees_group = fees_groups[i]
 
             log.debug('Group: "{}"'.format(i))
 
-            # Sort both groups by value to get mappings that we can use to connect them
-            tran_order_given_to_value_map = Feeer.get_order_by_value_map(tran_group, tran_col_idx)
-            fees_order_given_to_value_map = Feeer.get_order_by_value_map(fees_group, fees_col_idx)
-            fees_order_value_to_given_map = {v: k for k, v in
-                                             fees_order_given_to_value_map.items()}
+            group_hash = None
+            if checkpoint is not None:
+                group_hash = Checkpoint.hash_rows(fees_group, Checkpoint.hash_rows(tran_group + [[]])).hexdigest()
 
-            for tran_group_given_order_id in range(0, len(tran_group)):
-                tran_row = tran_group[tran_group_given_order_id]
+            if group_hash in saved_groups:
+                log.debug('Group matched already, from the checkpoint')
+                fees_positions = saved_groups[group_hash]
+            else:
+                fees_positions = Feeer.match_group(tran_group, fees_group, tran_col_idx, fees_col_idx)
 
-                tran_group_value_order_id = tran_order_given_to_value_map[tran_group_given_order_id]
-                fees_group_given_order_id = fees_order_value_to_given_map[tran_group_value_order_id]
+            for fees_group_given_order_id in fees_positions:
+                fees_rows_for_tran_rows.append(fees_group[fees_group_given_order_id])
 
-                fees_row_for_tran_row = fees_group[fees_group_given_order_id]
-                log.debug('Transaction row: "{}"'.format(tran_row))
-                log.debug('Corresponding fees row: "{}"'.format(fees_row_for_tran_row))
+            if checkpoint is not None:
+                checkpoint.append('fee_groups', [[group_hash, fees_positions]])
+                if checkpoint.is_due():
+                    checkpoint.save()
 
-                # Finally, we can combine both rows
-                combined_row = tran_row
-                fee_value = fees_row_for_tran_row[fees_col_idx['Wartość']]
-                if tran_row[tran_col_idx['Rodzaj']] == "Kupno":
-                    cryptocur = tran_row[tran_col_idx['Rynek']][:3]
-                    rate = tran_row[tran_col_idx['Kurs']]
-                    fee_value_pln = Decimal(rate) * Decimal(fee_value)
-                    fee_value_pln_str = str(fee_value_pln.quantize(Decimal(10) ** -2))
-                    log.debug("Fee of {} in {} converted to PLN at rate {} gives {} PLN".format(fee_value, cryptocur,
-                                                                                                rate, fee_value_pln_str))
-                    combined_row.append(fee_value_pln_str)
-                else:
-                    combined_row.append(fee_value)
+        if checkpoint is not None:
+            checkpoint.save()
+        Feeer.sanity_check_of_groups(tran_groups, fees_groups)
 
-                log.debug('Combined row: "{}"'.format(combined_row))
+        return fees_rows_for_tran_rows
 
-                rows_with_fees.append(combined_row)
+    @staticmethod
+    def match_group(tran_group, fees_group, tran_col_idx, fees_col_idx):
+        """
+        :return: List of positions in fees_group, in the order of tran_group
+        """
+        # Sort both groups by value to get mappings that we can use to connect them
+        tran_order_given_to_value_map = Feeer.get_order_by_value_map(tran_group, tran_col_idx)
+        fees_order_given_to_value_map = Feeer.get_order_by_value_map(fees_group, fees_col_idx)
+        fees_order_value_to_given_map = {v: k for k, v in
+                                         fees_order_given_to_value_map.items()}
 
-        return rows_with_fees
+        fees_positions = []
+        for tran_group_given_order_id in range(0, len(tran_group)):
+            tran_group_value_order_id = tran_order_given_to_value_map[tran_group_given_order_id]
+            fees_positions.append(fees_order_value_to_given_map[tran_group_value_order_id])
+
+        return fees_positions
 
     @staticmethod
     def group_entries_by_date(data, col_indexes):
@@ -111,41 +253,45 @@ class Feeer:
         # Just for debugging
         overview = OrderedDict()
 
-        # Initialise with data value from the first row (after headers)
-        tmp_date = data[1][col_indexes['Data operacji']]
+        for group in Feeer.iter_groups_by_date(data, col_indexes):
+            overview[group[0][col_indexes['Data operacji']] if group else None] = len(group)
+            groups.append(group)
 
+        log.debug('Got "{}" groups: {}'.format(len(groups), overview))
+
+        return groups
+
+    @staticmethod
+    def iter_groups_by_date(rows, col_indexes):
+        """
+        Streaming version of group_entries_by_date(), rows can be any iterable
+        :return: Generator of groups (lists of rows), keeping the order
+        """
+        date_idx = col_indexes['Data operacji']
+        tmp_date = None
         tmp_group = []
-        index = 0
 
-        for row in data:
+        for row in rows:
             # Ignore headers
-            if row[col_indexes['Data operacji']] == 'Data operacji':
+            if row[date_idx] == 'Data operacji':
                 continue
 
+            # Initialise with data value from the first row (after headers)
+            if tmp_date is None:
+                tmp_date = row[date_idx]
+
             # Dynamically adjust max time difference based on group length
             max_time_diff = (len(tmp_group) // 10) + 2
 
-            if Feeer.is_within_time_diff(row[col_indexes['Data operacji']],
-                                         tmp_date, max_time_diff):
+            if Feeer.is_within_time_diff(row[date_idx], tmp_date, max_time_diff):
                 tmp_group.append(row)
             else:
-                overview[tmp_date] = len(tmp_group)
-                groups.append(tmp_group.copy())
-                tmp_date = row[col_indexes['Data operacji']]
-                tmp_group.clear()
-                index = 0
-
-                tmp_group.append(row)
-
-            index += 1
+                yield tmp_group
+                tmp_date = row[date_idx]
+                tmp_group = [row]
 
         # Final group
-        overview[tmp_date] = len(tmp_group)
-        groups.append(tmp_group.copy())
-
-        log.debug('Got "{}" groups: {}'.format(len(groups), overview))
-
-        return groups
+        yield tmp_group
 
     @staticmethod
     def sanity_check_of_groups(tran_groups, fees_groups):
@@ -173,17 +319,12 @@ class Feeer:
         # Target map
         given_to_value_order_map = {}
 
-        # Convert the list into a dictionary: given_order_id -> entry
-        given_order_dict = {}
-        for i in range(0, len(group)):
-            given_order_dict[i] = group[i]
+        # Values parsed once, exact (no floats) so that equal values compare as equal
+        sort_index = col_indexes['Wartość']
+        values = [Amount.parse(row[sort_index]) for row in group]
 
-        # .items() gives a tuple like (key, value)
-        # lambda is a an anonymous function that for every item returns it's value[sort_index]
         value_based_index = 0
-        sort_index = col_indexes['Wartość']
-        for given_index, v in (sorted(given_order_dict.items(),
-                                     key=lambda item: float(item[1][sort_index]))):
+        for given_index in sorted(range(0, len(group)), key=lambda i: values[i].units):
             given_to_value_order_map[given_index] = value_based_index
             value_based_index += 1
 
@@ -200,9 +341,9 @@ class Feeer:
             values_by_mapped_order[map[i]] = group[i][sort_index]
 
         log.debug('Mapping check')
-        prev = values_by_mapped_order[0]
+        prev = Amount.parse(values_by_mapped_order[0])
         for j in range(1, len(values_by_mapped_order)):
-            assert float(prev) < float(values_by_mapped_order[j])
+            assert prev < Amount.parse(values_by_mapped_order[j])
 
     @staticmethod
     def is_within_time_diff(date_a_str, date_b_str, max_time_diff):
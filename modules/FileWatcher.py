@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+
+class FileWatcher:
+    """
+    Waits for changes of a set of files. Uses inotify (Linux) when available, polling otherwise.
+    A file counts as changed only when its (mtime, size) differs from the last known one, so our own
+     writes can be ignored with refresh().
+    """
+
+    # https://man7.org/linux/man-pages/man7/inotify.7.html
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, paths, debounce=2.0, poll_interval=1.0):
+        """
+        :param paths: Files to watch, they don't need to exist yet
+        :param debounce: Seconds without any further change before changes are reported
+        :param poll_interval: Seconds between checks when polling
+        """
+        self.paths = [os.path.abspath(p) for p in paths]
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.signatures = {p: FileWatcher.get_signature(p) for p in self.paths}
+        self.inotify_fd = self.init_inotify()
+
+    def init_inotify(self):
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            return None
+        try:
+            libc = ctypes.CDLL(libc_name, use_errno=True)
+            inotify_fd = libc.inotify_init()
+        except (OSError, AttributeError):
+            return None
+        if inotify_fd < 0:
+            return None
+
+        # Watch directories, editors often replace files instead of writing them in place
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+        for directory in {os.path.dirname(p) for p in self.paths}:
+            if libc.inotify_add_watch(inotify_fd, directory.encode(), mask) < 0:
+                os.close(inotify_fd)
+                return None
+
+        log.debug('Using inotify to watch: {}'.format(self.paths))
+        return inotify_fd
+
+    def wait_for_changes(self):
+        """
+        Blocks until some files change and then stay unchanged for the debounce time.
+        :return: Set of changed paths
+        """
+        changed = set()
+        while not changed:
+            self.wait(None)
+            changed |= self.get_changed()
+
+        # Debounce, e.g. a paste saved several times in a row
+        while self.wait(self.debounce):
+            changed |= self.get_changed()
+        changed |= self.get_changed()
+
+        log.debug('Changed files: {}'.format(changed))
+        return changed
+
+    def wait(self, timeout):
+        """
+        :param timeout: Seconds, None for no timeout
+        :return: True if there may be a change
+        """
+        if self.inotify_fd is None:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while deadline is None or time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                if any(FileWatcher.get_signature(p) != self.signatures[p] for p in self.paths):
+                    return True
+            return False
+
+        ready, _, _ = select.select([self.inotify_fd], [], [], timeout)
+        if not ready:
+            return False
+
+        buffer = os.read(self.inotify_fd, 64 * 1024)
+        offset = 0
+        names = set()
+        while offset < len(buffer):
+            wd, mask, cookie, length = self.EVENT_HEADER.unpack_from(buffer, offset)
+            offset += self.EVENT_HEADER.size
+            names.add(buffer[offset:offset + length].rstrip(b'\0').decode(errors='replace'))
+            offset += length
+        return any(os.path.basename(p) in names for p in self.paths)
+
+    def get_changed(self):
+        changed = set()
+        for path in self.paths:
+            signature = FileWatcher.get_signature(path)
+            if signature != self.signatures[path]:
+                self.signatures[path] = signature
+                changed.add(path)
+        return changed
+
+    def refresh(self, path):
+        """
+        Accept the current state of path, e.g. after we wrote it ourselves
+        """
+        path = os.path.abspath(path)
+        if path in self.signatures:
+            self.signatures[path] = FileWatcher.get_signature(path)
+
+    @staticmethod
+    def get_signature(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
@@ -4,11 +4,15 @@
 # https://developers.google.com/sheets/api/quickstart/python
 # Requires: pip install --upgrade google-api-python-client google-auth-httplib2 google-auth-oauthlib
 # Likely within an venv
+# Google libraries are imported only when needed (in get_service), they are slow to import
 import pickle
 import os.path
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+import json
+import time
+from datetime import datetime, timedelta
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
 
 
 class GSheetsUploaderHelper:
@@ -28,34 +32,116 @@ class GSheetsUploaderHelper:
 
     SERVICE = ''
 
-    def __init__(self, client_secret_file, spreadsheet_id):
+    # The discovery document is fetched only when not cached or older than that
+    DISCOVERY_URL = 'https://sheets.googleapis.com/$discovery/rest?version=v4'
+    DISCOVERY_MAX_AGE = 30 * 24 * 3600
+
+    # Credentials expiring within that are refreshed before the first call, not after it fails
+    REFRESH_MARGIN = timedelta(minutes=5)
+
+    # (client secret file, token path) -> (credentials, service), reused by the helpers of the same process
+    services = {}
+
+    def __init__(self, client_secret_file, spreadsheet_id, token_path='token.pickle', discovery_path=None):
+        """
+        :param token_path: Pickle with the user's access and refresh tokens, created by the first authorization
+        :param discovery_path: JSON cache of the Sheets API discovery document, next to the token by default
+        """
+        start = time.perf_counter()
         self.CLIENT_SECRET_FILE = client_secret_file
         self.SPREADSHEET_ID = spreadsheet_id
+        self.token_path = token_path
+        self.discovery_path = discovery_path or os.path.join(os.path.dirname(token_path), 'sheets_v4_discovery.json')
         self.SERVICE = self.get_service()
+        # Start-up latency: credentials and the service, before any data moves
+        self.startup_seconds = time.perf_counter() - start
+        log.debug('Google Sheets service ready in "{:.3f}" s'.format(self.startup_seconds))
 
     def get_service(self):
+        key = (self.CLIENT_SECRET_FILE, self.token_path)
+        if key in GSheetsUploaderHelper.services:
+            creds, service = GSheetsUploaderHelper.services[key]
+            self.refresh_if_needed(creds)
+            return service
+
+        from googleapiclient.discovery import build_from_document
+
+        creds = self.get_credentials()
+        service = build_from_document(self.load_discovery_document(), credentials=creds)
+        GSheetsUploaderHelper.services[key] = (creds, service)
+
+        return service
+
+    def get_credentials(self):
+        from google_auth_oauthlib.flow import InstalledAppFlow
+
         creds = None
-        # The file token.pickle stores the user's access and refresh tokens, and is
-        # created automatically when the authorization flow completes for the first
-        # time.
-        if os.path.exists('token.pickle'):
-            with open('token.pickle', 'rb') as token:
+        if os.path.exists(self.token_path):
+            with open(self.token_path, 'rb') as token:
                 creds = pickle.load(token)
+
+        if creds:
+            self.refresh_if_needed(creds)
         # If there are no (valid) credentials available, let the user log in.
         if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    self.CLIENT_SECRET_FILE, self.SCOPE)
-                creds = flow.run_local_server()
-            # Save the credentials for the next run
-            with open('token.pickle', 'wb') as token:
-                pickle.dump(creds, token)
-
-        service = build('sheets', 'v4', credentials=creds)
+            flow = InstalledAppFlow.from_client_secrets_file(
+                self.CLIENT_SECRET_FILE, self.SCOPE)
+            creds = flow.run_local_server()
+            self.save_credentials(creds)
 
-        return service
+        return creds
+
+    def refresh_if_needed(self, creds, now=None):
+        """
+        Refreshes (and saves) the credentials when they expire within REFRESH_MARGIN
+        :param now: UTC time, naive as creds.expiry
+        """
+        if not GSheetsUploaderHelper.needs_refresh(creds, now):
+            return
+        from google.auth.transport.requests import Request
+
+        log.debug('Refresh the Google credentials')
+        creds.refresh(Request())
+        self.save_credentials(creds)
+
+    @staticmethod
+    def needs_refresh(creds, now=None):
+        if not creds.refresh_token:
+            return False
+        if creds.expiry is None:
+            return not creds.valid
+        now = now or datetime.utcnow()
+        return creds.expiry - now < GSheetsUploaderHelper.REFRESH_MARGIN
+
+    def save_credentials(self, creds):
+        with open(self.token_path + '.tmp', 'wb') as token:
+            pickle.dump(creds, token)
+        os.replace(self.token_path + '.tmp', self.token_path)
+
+    def load_discovery_document(self, fetch=None):
+        """
+        :param fetch: function(url) -> document text, urllib by default
+        :return: The Sheets API discovery document (text), from the cache when it's fresh enough
+        """
+        if os.path.exists(self.discovery_path) and \
+                time.time() - os.path.getmtime(self.discovery_path) < GSheetsUploaderHelper.DISCOVERY_MAX_AGE:
+            with open(self.discovery_path, encoding="utf-8") as discovery_file:
+                return discovery_file.read()
+
+        log.debug('Fetch the discovery document: "{}"'.format(GSheetsUploaderHelper.DISCOVERY_URL))
+        document = (fetch or GSheetsUploaderHelper.fetch_url)(GSheetsUploaderHelper.DISCOVERY_URL)
+        # Only a valid document is cached
+        json.loads(document)
+        with open(self.discovery_path + '.tmp', 'w', encoding="utf-8") as discovery_file:
+            discovery_file.write(document)
+        os.replace(self.discovery_path + '.tmp', self.discovery_path)
+        return document
+
+    @staticmethod
+    def fetch_url(url):
+        from urllib.request import urlopen
+
+        return urlopen(url).read().decode('utf-8')
 
     def read_data(self, range_name):
         """
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+# https://docs.python.org/3/library/csv.html
+import csv
+
+from datetime import datetime
+
+import logging
+log = logging.getLogger('bitbay_history_converter')
+
+
+class HistoryConverter:
+    """
+    Class used by bitbay_history_converter_txt_2_csv.py
+    Converts a "copy-paste" text from the bitbay.net history pages into the bitbay CSV format.
+    """
+
+    HEADERS = {
+        'transactions': ['Rynek', 'Data operacji', 'Rodzaj', 'Typ', 'Kurs', 'Ilość', 'Wartość'],
+        'fees': ['Data operacji', 'Rodzaj', 'Wartość', 'Saldo po'],
+    }
+
+    @staticmethod
+    def convert_file(inputfile, history_type):
+        """
+        :param inputfile: A "copy-paste" text file from the bitbay transaction page
+        :param history_type: "fees" or "transactions"
+        :return: List of lists in the bitbay CSV format, headers first
+        """
+        with open(inputfile, "r", encoding="utf-8") as tf:
+            raw_content = tf.readlines()
+        log.debug('Got "{}" raw lines'.format(len(raw_content)))
+
+        return HistoryConverter.convert(raw_content, history_type)
+
+    @staticmethod
+    def convert(raw_content, history_type):
+        """
+        :param raw_content: Lines of the "copy-paste" text
+        :param history_type: "fees" or "transactions"
+        :return: List of lists in the bitbay CSV format, headers first
+        """
+
+        # Strip newlines, unify minuses
+        list_content = [x.strip().replace('−', '-') for x in raw_content]
+
+        # Types
+        if history_type not in HistoryConverter.HEADERS:
+            raise ValueError('Unknown operation type: "{}"'.format(history_type))
+        headers = HistoryConverter.HEADERS[history_type]
+
+        log.debug('Type is "{}"'.format(history_type))
+        log.debug('Will use headers: "{}"'.format(headers))
+
+        entries_per_row = len(headers)
+        log.debug('Check if the copy-paste file is likely valid')
+        log.debug('Total number of lines "{}" should divide by number of headers "{}"'
+                  .format(len(list_content), entries_per_row))
+        assert (len(list_content) % entries_per_row == 0)
+
+        # Generate a proper list of rows
+        data = [list(headers)]
+
+        # Pre processing
+        counter = 0
+        current_row = []
+        for item in list_content:
+            current_row.append(item)
+            counter += 1
+
+            if counter == entries_per_row:
+                data.append(current_row)
+                current_row = []
+                counter = 0
+
+        log.debug('Got "{}" lines after pre-processing'.format(len(data)))
+
+        # Post processing
+        if history_type == "transactions":
+            data = HistoryConverter.post_processing_transactions(data)
+        elif history_type == "fees":
+            data = HistoryConverter.post_processing_operations(data)
+
+        log.debug('Got "{}" lines after post-processing'.format(len(data)))
+
+        return data
+
+    @staticmethod
+    def post_processing_transactions(data):
+        # Post processing to achieve identical format as bitbay.net use in their exports
+
+        formatted_list_of_rows = []
+        for row in data:
+            if row[0] == 'Rynek':
+                formatted_list_of_rows.append(row)
+                continue
+
+            # Surround currency separator with spaces...
+            row[0] = row[0].replace('-', ' - ')
+
+            # Convert date and time
+            old_datetime_string = row[1].replace(' ', '').replace(',', ' ')
+            old_datetime_format = "%m/%d/%Y %I:%M:%S%p"
+            datatime_object = datetime.strptime(old_datetime_string, old_datetime_format)
+            new_datetime_format = "%d-%m-%Y %H:%M:%S"
+            row[1] = datatime_object.strftime(new_datetime_format)
+
+            # Translate BID/ASK
+            if row[2] == 'BID':
+                row[2] = 'Kupno'
+            else:
+                row[2] = 'Sprzedaż'
+
+            # Remove currency spaces and indicators
+            row[4] = row[4][:-3].replace(' ', '')  # PLN
+            row[5] = row[5][:-3].replace(' ', '')  # BTC, ETH etc. (from pair)
+            row[6] = row[6][:-3].replace(' ', '')  # PLN
+
+            formatted_list_of_rows.append(row)
+
+        return formatted_list_of_rows
+
+    @staticmethod
+    def post_processing_operations(data):
+        formatted_list_of_rows = []
+        for row in data:
+            if row[1] == 'Rodzaj':
+                formatted_list_of_rows.append(row)
+                continue
+
+            # Convert date and time
+            old_datetime_string = row[0].replace(' ', '').replace(',', ' ')
+            old_datetime_format = "%m/%d/%Y %I:%M:%S%p"
+            datatime_object = datetime.strptime(old_datetime_string, old_datetime_format)
+            new_datetime_format = "%d-%m-%Y %H:%M:%S"
+            row[0] = datatime_object.strftime(new_datetime_format)
+
+            # Add currency to Rodzaj
+            currency = row[2][-3:]
+            row[1] = row[1] + ': ' + currency
+
+            # Remove minus from the fee value
+            row[2] = row[2][1:]
+
+            # Remove currency spaces and indicators
+            row[2] = row[2][:-3].replace(' ', '')
+            row[3] = row[3][:-3].replace(' ', '')
+
+            formatted_list_of_rows.append(row)
+
+        return formatted_list_of_rows
+
+    @staticmethod
+    def get_output_path(inputfile):
+        return str(inputfile)[:-4] + '.csv'
+
+    @staticmethod
+    def write_csv(output, data):
+        with open(output, 'w', newline='', encoding="utf-8") as csvfile:
+            csvwriter = csv.writer(csvfile, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            for row in data:
+                csvwriter.writerow(row)
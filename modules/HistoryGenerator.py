@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+from datetime import datetime, timedelta
+import random
+
+from modules.Money import Money, Amount, Rate, PRODUCT_SCALE
+from modules.HistoryConverter import HistoryConverter
+
+
+class HistoryGenerator:
+    """
+    Random, but valid, transactions and fees histories for testing engines against each other, see Oracle.
+
+    A case is a dictionary:
+     * 'entries': list of [transactions row, fees row] in the order of execution
+     * 'reversed': True for the order of the bitbay export (younger first)
+    Fills of one order (a burst) share the second, the fees of a burst are listed in a different order than
+     the transactions, just like on bitbay. Balances ('Saldo po') are consistent with the trades and fees.
+    """
+
+    MARKETS = ['BTC - PLN', 'ETH - PLN', 'LSK - PLN']
+    FEE_KIND = 'Pobranie prowizji za transakcję'
+    START = datetime(2019, 1, 1)
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+
+    def generate(self, bursts=20):
+        """
+        :param bursts: Number of orders, each of 1 or more fills
+        :return: Case, see the class description
+        """
+        r = self.random
+        entries = []
+        # market -> amounts of BUYs, for exact matches
+        bought = {}
+        # currency -> balance units (of Amount), for 'Saldo po'
+        balances = {}
+        time = HistoryGenerator.START + timedelta(seconds=r.randint(0, 3600))
+        for _ in range(0, bursts):
+            # Far enough apart to be separate groups of fees
+            time += timedelta(seconds=r.choice([60, 61, 3600, 86400]))
+            market = r.choice(HistoryGenerator.MARKETS)
+            kind = r.choice(['Kupno', 'Kupno', 'Sprzedaż'])
+            size = r.choice([1, 1, 1, 2, 3, 5, 12])
+
+            values = set()
+            fees = set()
+            fills = []
+            while len(fills) < size:
+                rate = Rate.parse('{}.{:02d}'.format(r.randint(100, 20000), r.randint(0, 99)))
+                amount = self.get_amount(kind, bought.get(market, []))
+                value = Money.from_units(rate.units * amount.units, PRODUCT_SCALE)
+                # 0.43%, in the bought crypto currency for BUYs
+                if kind == 'Kupno':
+                    currency = market[:3]
+                    fee = str(Amount.from_units(amount.units * 43, Amount.SCALE + 4))
+                else:
+                    currency = 'PLN'
+                    fee = str(Money.from_units(value.units * 43, Money.SCALE + 4))
+                # The fees heuristic needs distinct values within a group
+                if str(value) in values or fee in fees:
+                    continue
+                values.add(str(value))
+                fees.add(fee)
+                date = time.strftime('%d-%m-%Y %H:%M:%S')
+                fills.append([[market, date, kind, r.choice(['Maker', 'Taker']), str(rate), str(amount), str(value)],
+                              [date, '{}: {}'.format(HistoryGenerator.FEE_KIND, currency), fee, '0']])
+                if kind == 'Kupno':
+                    bought.setdefault(market, []).append(amount)
+
+            # The last fee listed (the first fill) reports the balance after the whole burst
+            for tran_row, fees_row in reversed(fills):
+                sign = 1 if kind == 'Kupno' else -1
+                balances[market[:3]] = balances.get(market[:3], 0) + sign * Amount.parse(tran_row[5]).units
+                balances['PLN'] = balances.get('PLN', 0) - sign * Amount.parse(tran_row[6]).units
+                currency = fees_row[1].rpartition(': ')[2]
+                balances[currency] -= Amount.parse(fees_row[2]).units
+                fees_row[3] = str(Amount(balances[currency]))
+
+            entries.extend(fills)
+
+        return {'entries': entries, 'reversed': r.random() < 0.5}
+
+    def get_amount(self, kind, bought):
+        """
+        :param bought: Amounts of the previous BUYs on the market
+        :return: Amount, partial fills, round ones and the same as a previous BUY (exact matches)
+        """
+        r = self.random
+        choice = r.random()
+        if kind == 'Sprzedaż' and bought and choice < 0.3:
+            return r.choice(bought)
+        if choice < 0.5:
+            return Amount.parse(r.choice(['1', '0.5', '0.25', '2']))
+        return Amount(r.randint(1, 3 * 10 ** Amount.SCALE))
+
+    @staticmethod
+    def render(case):
+        """
+        :param case: See the class description
+        :return: Tuple (transactions data, fees data), lists of lists in the bitbay CSV format, headers first
+        """
+        transactions = [tran_row for tran_row, fees_row in case['entries']]
+        fees = []
+        # Fees of a burst in the opposite order
+        burst = []
+        for tran_row, fees_row in case['entries']:
+            if burst and burst[-1][0] != fees_row[0]:
+                fees.extend(reversed(burst))
+                burst = []
+            burst.append(fees_row)
+        fees.extend(reversed(burst))
+
+        if case['reversed']:
+            transactions.reverse()
+            fees.reverse()
+
+        return ([list(HistoryConverter.HEADERS['transactions'])] + transactions,
+                [list(HistoryConverter.HEADERS['fees'])] + fees)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+import json
+import os
+from datetime import datetime
+
+from modules.Taxer import Taxer
+from modules.Feeer import Feeer
+from modules.Money import Amount
+from modules.ExchangeRates import ExchangeRates
+from modules.Checkpoint import Checkpoint
+from modules.LotPool import LotPool
+from modules.StageCache import StageCache
+from modules.FastCsv import FastCsv
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+
+class Incremental:
+    """
+    Calculations from the first changed group of rows on, the rows before it are reused from the previous
+     _tax.csv. A fixed paste or an amended old row costs the rows after it, not all the years.
+
+    State of the last run (JSON, next to the _tax.csv):
+     * a rolling hash of the input after every group (Feeer groups of transactions and their fees, oldest
+       first), so the first changed group is found in a single pass
+     * periodic FIFO snapshots: amounts taken from the BUY queue of every crypto currency after a group
+    A snapshot is taken only where the SELLs before it were covered by the BUYs before it, so the rows before it
+     don't depend on anything after it. The run restarts from the last snapshot before the first changed group:
+     fees and PCC of the groups after it, FIFO with the BUY queues restored from the snapshot.
+    """
+
+    VERSION = 2
+
+    def __init__(self, path, key='', snapshot_every=1000):
+        """
+        :param path: JSON file, see get_path_for()
+        :param key: Anything else the results depend on (e.g. exchange rates), state of a different key is
+         not reused
+        :param snapshot_every: Minimum rows between FIFO snapshots
+        """
+        self.path = path
+        self.key = '{}|{}'.format(key, StageCache.get_code_version([Taxer, Feeer, LotPool, Amount,
+                                                                          ExchangeRates]))
+        self.snapshot_every = snapshot_every
+        self.state = None
+
+    @staticmethod
+    def get_path_for(tax_csv_path):
+        return tax_csv_path[:-4] + '_incremental.json'
+
+    def load(self, output):
+        """
+        :param output: The _tax.csv of the last run, it has to be the one written with the state
+        :return: The state of the last run, or None
+        """
+        if not os.path.exists(self.path) or not os.path.exists(output):
+            return None
+
+        with open(self.path, encoding="utf-8") as state_file:
+            saved = json.load(state_file)
+        if saved.get('version') != Incremental.VERSION or saved.get('key') != self.key:
+            log.info('State of a different version or settings, calculating everything: "{}"'.format(self.path))
+            return None
+        if saved.get('output') != StageCache.get_files_key([output]):
+            log.info('The output changed since the last run, calculating everything: "{}"'.format(output))
+            return None
+
+        return saved
+
+    def save(self, output):
+        """
+        Call after the output is written, the state is valid for that file only
+        """
+        if self.state is None:
+            self.remove()
+            return
+
+        self.state['output'] = StageCache.get_files_key([output])
+        with open(self.path + '.tmp', 'w', encoding="utf-8") as state_file:
+            json.dump(self.state, state_file, ensure_ascii=False)
+        os.replace(self.path + '.tmp', self.path)
+        log.debug('Incremental state saved as: "{}"'.format(self.path))
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @staticmethod
+    def read_output(output):
+        """
+        :return: Rows of the _tax.csv, headers first, without the footer
+        """
+        rows = list(FastCsv.iter_rows(output))
+        return [row for row in rows if len(row) == len(rows[0])]
+
+    def calculate(self, transactions_data, fees_data, rates=None, output=None):
+        """
+        Same results as bitbay_tax_calculator.calculate() (serial)
+        :param output: The _tax.csv of the last run, nothing is reused without it
+        :return: Transactions data with the fees, FIFO and PCC columns, oldest first
+        """
+        tran_col_idx = Taxer.get_col_indexes(transactions_data)
+        fees_col_idx = Feeer.get_col_indexes(fees_data)
+        tran_groups = list(Feeer.iter_groups_by_date(transactions_data[1:], tran_col_idx))
+        fees_groups = list(Feeer.iter_groups_by_date(fees_data[1:], fees_col_idx))
+        if [len(group) for group in tran_groups] != [len(group) for group in fees_groups]:
+            # Nothing to pair the groups on, the full calculations report it (or join on IDs)
+            log.warning('Groups of transactions and fees differ, calculating everything')
+            self.state = None
+            data = Feeer.include_fees(transactions_data, fees_data, rates)
+            data = Taxer.calculate_gain_fifo(data, rates)
+            return Taxer.calculate_pcc(data, rates)
+
+        # Taxer.calculate_gain_fifo() turns younger first data around, the output is always oldest first
+        date_idx = tran_col_idx['Data operacji']
+        younger_first = len(transactions_data) > 2 and \
+            datetime.strptime(transactions_data[1][date_idx], '%d-%m-%Y %H:%M:%S') > \
+            datetime.strptime(transactions_data[-1][date_idx], '%d-%m-%Y %H:%M:%S')
+        if younger_first:
+            tran_groups.reverse()
+            fees_groups.reverse()
+
+        hashes = []
+        # Other columns or the other order (of the rows within groups too) change everything
+        rolling_hash = Checkpoint.hash_rows([transactions_data[0], fees_data[0], [younger_first]])
+        for tran_group, fees_group in zip(tran_groups, fees_groups):
+            # Same rows grouped differently (younger first groups depend on the rows above) are matched differently
+            Checkpoint.hash_rows([[len(tran_group)]] + tran_group, rolling_hash)
+            Checkpoint.hash_rows(fees_group, rolling_hash)
+            hashes.append(rolling_hash.hexdigest()[:16])
+
+        snapshot, previous_rows = self.find_snapshot(hashes, tran_groups, output)
+        done = snapshot['groups']
+
+        # Groups after the snapshot, in the given order
+        later = range(len(tran_groups) - 1, done - 1, -1) if younger_first else range(done, len(tran_groups))
+        data = Feeer.include_fees([list(transactions_data[0])] + [row for g in later for row in tran_groups[g]],
+                                  [list(fees_data[0])] + [row for g in later for row in fees_groups[g]], rates)
+        headers = data[0]
+        rows = data[:0:-1] if younger_first else data[1:]
+
+        self.calculate_gain_fifo(headers, rows, tran_groups, snapshot, younger_first, rates)
+        data = Taxer.calculate_pcc([headers] + rows, rates)
+
+        snapshots = [s for s in self.state['snapshots'] if s['groups'] <= done] if self.state is not None else []
+        self.state = {'version': Incremental.VERSION, 'key': self.key, 'hashes': hashes,
+                      'snapshots': snapshots + self.new_snapshots}
+
+        return [headers] + (previous_rows[1:] if previous_rows is not None else []) + data[1:]
+
+    def find_snapshot(self, hashes, tran_groups, output):
+        """
+        :return: Tuple (the last snapshot before the first changed group, rows of the output before it, headers
+         first, or None when nothing is reused)
+        """
+        start = {'groups': 0, 'consumed': {}}
+        self.state = self.load(output) if output is not None else None
+        if self.state is None:
+            return start, None
+
+        previous_hashes = self.state['hashes']
+        changed = next((g for g in range(len(hashes))
+                        if g >= len(previous_hashes) or hashes[g] != previous_hashes[g]), len(hashes))
+        if changed == len(hashes) == len(previous_hashes):
+            # All of it is the same, whatever the snapshots
+            snapshot = {'groups': changed, 'consumed': {}}
+        else:
+            snapshot = max((s for s in self.state['snapshots'] if s['groups'] <= changed),
+                           key=lambda s: s['groups'], default=start)
+        if snapshot['groups'] == 0:
+            log.info('No snapshot before the first changed group ("{}"), calculating everything'.format(changed + 1))
+            return start, None
+
+        rows = Incremental.read_output(output)
+        reused = sum(len(tran_groups[g]) for g in range(snapshot['groups']))
+        if reused + 1 > len(rows):
+            log.warning('Fewer rows than expected in: "{}", calculating everything'.format(output))
+            return start, None
+
+        if changed == len(hashes):
+            log.info('No changed groups, "{}" rows reused from: "{}"'.format(reused, output))
+        else:
+            log.info('First changed group: "{}" of "{}", "{}" rows reused from: "{}"'.format(
+                changed + 1, len(hashes), reused, output))
+        return snapshot, rows[:reused + 1]
+
+    def calculate_gain_fifo(self, headers, rows, tran_groups, snapshot, younger_first, rates):
+        """
+        Appends the FIFO columns to rows (the groups after the snapshot, oldest first), the BUYs before the
+         snapshot are queued with what is left of them. New snapshots go to self.new_snapshots.
+        """
+        col_idx = Taxer.get_col_indexes([headers])
+        market_idx = col_idx['Rynek']
+        kind_idx = col_idx['Rodzaj']
+        amount_idx = col_idx['Ilość']
+        headers.extend(['Przychód', 'Koszt', 'Dochód'])
+
+        # Amount units of crypto currency: asked for by the SELLs so far, of the BUYs so far
+        consumed = dict(snapshot['consumed'])
+        bought = {}
+
+        # Lots: BUYs before the snapshot that aren't used up yet, then all the rows after it
+        pool = LotPool(col_idx, rates)
+        left = dict(consumed)
+        for g in range(snapshot['groups']):
+            for row in (tran_groups[g][::-1] if younger_first else tran_groups[g]):
+                if row[kind_idx] != 'Kupno':
+                    continue
+                crypto = ExchangeRates.get_base_currency(row[market_idx])
+                units = Amount.parse(row[amount_idx]).units
+                bought[crypto] = bought.get(crypto, 0) + units
+                used = min(units, left.get(crypto, 0))
+                left[crypto] = left.get(crypto, 0) - used
+                if used < units:
+                    lot = Taxer.get_typed_copy([headers, row])[1]
+                    lot[amount_idx] = Amount(units - used)
+                    pool.add_buy(lot)
+        for row in Taxer.get_typed_copy([headers] + rows)[1:]:
+            pool.add_buy(row)
+
+        self.new_snapshots = []
+        position = 0
+        since_snapshot = 0
+        for g in range(snapshot['groups'], len(tran_groups)):
+            for row in rows[position:position + len(tran_groups[g])]:
+                crypto = ExchangeRates.get_base_currency(row[market_idx])
+                units = Amount.parse(row[amount_idx]).units
+                if row[kind_idx] == 'Sprzedaż':
+                    gains = Taxer.get_gains_for_pool(row, pool)
+                    row.extend([gains['income'], gains['cost'], gains['gain']])
+                    # Uncapped, a SELL not covered by the BUYs so far takes from the later ones: no snapshot then
+                    consumed[crypto] = consumed.get(crypto, 0) + units
+                else:
+                    row.extend(['', '', ''])
+                    bought[crypto] = bought.get(crypto, 0) + units
+            position += len(tran_groups[g])
+            since_snapshot += len(tran_groups[g])
+
+            if since_snapshot >= self.snapshot_every and \
+                    all(units <= bought.get(crypto, 0) for crypto, units in consumed.items()):
+                self.new_snapshots.append({'groups': g + 1, 'consumed': dict(consumed)})
+                since_snapshot = 0
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+# https://docs.python.org/3/howto/logging-cookbook.html
+import logging
+
+
+def setup_log(name, verbose=False, logfile=None):
+    """
+    Console handler (DEBUG with verbose, INFO otherwise) and an optional file handler with everything
+    :param name: Logger name, e.g. 'bitbay_tax_calculator'
+    :return: The logger
+    """
+    log = logging.getLogger(name)
+    log.setLevel(logging.DEBUG)
+    # Format
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # Console handler
+    ch = logging.StreamHandler()
+    ch.setLevel(logging.DEBUG if verbose else logging.INFO)
+    ch.setFormatter(formatter)
+    log.addHandler(ch)
+    # Log file handler
+    if logfile:
+        fh = logging.FileHandler(logfile, encoding="utf-8")
+        fh.setLevel(logging.DEBUG)
+        fh.setFormatter(formatter)
+        log.addHandler(fh)
+
+    return log
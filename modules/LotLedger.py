@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+from bisect import bisect_left
+from collections import deque
+
+from modules.Taxer import Taxer
+from modules.Money import Amount, Rate
+from modules.ExchangeRates import ExchangeRates
+from modules.LotPool import LotPool
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+
+class LotLedger:
+    """
+    Open BUY lots per crypto currency (all its markets, see ExchangeRates.get_base_currency()), consumed by SELLs
+     in a FIFO way. Lots are kept with their cost rate in PLN, like in LotPool: markets not quoted in PLN need
+     exchange rates.
+    Gives the same results as Taxer.get_gains_for_row(): all BUYs of a crypto currency are queued in the order of
+     data and every SELL takes from the front.
+
+    What-if SELLs (quote_sell()) use prefix sums of the amounts and costs of the lots instead, a binary search
+     finds where a SELL would end. The sums are built on the first quote of a crypto currency, then kept up to
+     date.
+    """
+
+    def __init__(self, rates=None):
+        """
+        :param rates: ExchangeRates, needed for markets not quoted in PLN. Income and cost are then one Rate.SCALE
+         more precise, see scale
+        """
+        self.rates = rates
+        self.scale = LotPool.get_scale(rates)
+        # crypto currency -> deque of [amount units, cost rate units in PLN]
+        self.lots = {}
+        # crypto currency -> SELL amount units that could not be matched with any BUY
+        self.shortfall = {}
+        # crypto currency -> [cumulative amount units, cumulative cost units, rate units] per lot, 0 first
+        self.prefix_sums = {}
+        # crypto currency -> amount units taken by SELLs since the prefix sums were built
+        self.consumed = {}
+
+    @staticmethod
+    def from_data(data, rates=None):
+        """
+        :param data: List of lists, headers first, in the order used by Taxer.calculate_gain_fifo()
+        :return: LotLedger after all the SELLs in data
+        """
+        col_idx = Taxer.get_col_indexes(data)
+
+        ledger = LotLedger(rates)
+        for kind, method in (('Kupno', ledger.add_buy), ('Sprzedaż', ledger.sell)):
+            for row in data[1:]:
+                if row[col_idx['Rodzaj']] == kind:
+                    method(row[col_idx['Rynek']], Amount.of(row[col_idx['Ilość']]), Rate.of(row[col_idx['Kurs']]),
+                           row[col_idx['Data operacji']])
+
+        return ledger
+
+    def get_fx(self, market, date_str):
+        """
+        :return: Exchange rate units of the market to PLN, see LotPool.get_fx()
+        """
+        if self.rates is None and ExchangeRates.get_quote_currency(market) != 'PLN':
+            raise ValueError('Market "{}" is not quoted in PLN, exchange rates are needed'.format(market))
+        return LotPool.get_fx(market, date_str, self.rates)
+
+    def add_buy(self, market, amount, rate, date_str=None):
+        """
+        :param amount: Amount
+        :param rate: Rate
+        :param date_str: Date of the BUY, for the exchange rate of a market not quoted in PLN
+        """
+        crypto = ExchangeRates.get_base_currency(market)
+        cost_rate = rate.units * self.get_fx(market, date_str)
+        if amount.units:
+            self.lots.setdefault(crypto, deque()).append([amount.units, cost_rate])
+            if crypto in self.prefix_sums:
+                amounts, costs, rates = self.prefix_sums[crypto]
+                amounts.append(amounts[-1] + amount.units)
+                costs.append(costs[-1] + amount.units * cost_rate)
+                rates.append(cost_rate)
+
+    def sell(self, market, amount, rate, date_str=None):
+        """
+        :param amount: Amount
+        :param rate: Rate
+        :param date_str: Date of the SELL, for the exchange rate of a market not quoted in PLN
+        :return: Tuple (income, cost) as sums of Amount x Rate products (in the scale of the ledger)
+        """
+        crypto = ExchangeRates.get_base_currency(market)
+        income_rate = rate.units * self.get_fx(market, date_str)
+        lots = self.lots.get(crypto, ())
+        sell_amount = amount.units
+        income = 0
+        cost = 0
+        while sell_amount and lots:
+            lot = lots[0]
+            used = min(sell_amount, lot[0])
+            income += used * income_rate
+            cost += used * lot[1]
+            lot[0] -= used
+            sell_amount -= used
+            if not lot[0]:
+                lots.popleft()
+
+        if sell_amount:
+            log.debug('Not enough BUYs on "{}" for "{}" units'.format(market, sell_amount))
+            self.shortfall[crypto] = self.shortfall.get(crypto, 0) + sell_amount
+
+        if crypto in self.prefix_sums:
+            self.consumed[crypto] += amount.units - sell_amount
+            # Mostly used up lots, built again (from the open ones) on the next quote
+            if 2 * len(lots) < len(self.prefix_sums[crypto][0]):
+                del self.prefix_sums[crypto]
+
+        return income, cost
+
+    def get_prefix_sums(self, crypto):
+        """
+        :param crypto: Crypto currency, see ExchangeRates.get_base_currency()
+        :return: List [cumulative amount units, cumulative cost units, rate units], see __init__()
+        """
+        if crypto not in self.prefix_sums:
+            amounts, costs, rates = [0], [0], [0]
+            for amount, rate in self.lots.get(crypto, ()):
+                amounts.append(amounts[-1] + amount)
+                costs.append(costs[-1] + amount * rate)
+                rates.append(rate)
+            self.prefix_sums[crypto] = [amounts, costs, rates]
+            self.consumed[crypto] = 0
+
+        return self.prefix_sums[crypto]
+
+    def get_cost_until(self, crypto, position):
+        """
+        :param position: Amount units from the start of the prefix sums
+        :return: Cost units of the lots up to position, O(log n)
+        """
+        amounts, costs, rates = self.get_prefix_sums(crypto)
+        i = bisect_left(amounts, position)
+        if i == 0:
+            return 0
+        return costs[i - 1] + (position - amounts[i - 1]) * rates[i]
+
+    def quote_sell(self, market, amount, rate, date_str=None):
+        """
+        What-if SELL, the lots are not changed
+        :param amount: Amount
+        :param rate: Rate
+        :param date_str: Date of the SELL, for the exchange rate of a market not quoted in PLN
+        :return: Tuple (income, cost, amount units matched), income and cost as in sell()
+        """
+        crypto = ExchangeRates.get_base_currency(market)
+        income_rate = rate.units * self.get_fx(market, date_str)
+        amounts = self.get_prefix_sums(crypto)[0]
+        start = self.consumed[crypto]
+        end = min(start + amount.units, amounts[-1])
+        cost = self.get_cost_until(crypto, end) - self.get_cost_until(crypto, start)
+        return (end - start) * income_rate, cost, end - start
+
+    def get_open_amount(self, market):
+        """
+        :return: Amount of the market crypto currency still held (bought on any of its markets)
+        """
+        crypto = ExchangeRates.get_base_currency(market)
+        return Amount(sum(lot[0] for lot in self.lots.get(crypto, ())))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+from collections import deque
+
+from modules.Money import Amount, Rate, PRODUCT_SCALE
+from modules.ExchangeRates import ExchangeRates
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+
+class LotPool:
+    """
+    Open BUY lots of the FIFO, one queue per crypto currency (see ExchangeRates.get_base_currency()) fed from
+     all of its markets, so BTC bought on 'BTC - EUR' covers a SELL on 'BTC - PLN'.
+    Lots enter the pool in the order of data with their cost already in PLN (Rate x exchange rate of the BUY
+     day), a SELL takes from the front of its queue: O(1) per lot instead of a scan of all the rows.
+    """
+
+    def __init__(self, col_idx, rates=None):
+        """
+        :param col_idx: Column indexes, see Taxer.get_col_indexes()
+        :param rates: ExchangeRates, with them all the values are converted to PLN (one Rate.SCALE more precise)
+        """
+        self.col_idx = col_idx
+        self.rates = rates
+        self.scale = LotPool.get_scale(rates)
+        # currency -> deque of [BUY row, amount units left, cost rate units in PLN]
+        self.lots = {}
+
+    @staticmethod
+    def from_rows(data_copy, col_idx, rates=None):
+        """
+        :param data_copy: Rows, headers first, in the order used by Taxer.calculate_gain_fifo(). Amounts of the
+         BUY rows are reduced in place when they are used, see Taxer.get_typed_copy()
+        :return: LotPool of all the BUYs with some amount left
+        """
+        pool = LotPool(col_idx, rates)
+        for row in data_copy[1:]:
+            pool.add_buy(row)
+        return pool
+
+    @staticmethod
+    def get_scale(rates):
+        """
+        :return: Scale of the income and cost sums
+        """
+        return PRODUCT_SCALE + Rate.SCALE if rates is not None else PRODUCT_SCALE
+
+    @staticmethod
+    def get_fx(market, date_str, rates):
+        """
+        :return: Units of the exchange rate of the market quote currency to PLN at get_scale(), 1 without rates
+        """
+        if rates is None:
+            return 1
+        currency = ExchangeRates.get_quote_currency(market)
+        if currency == 'PLN':
+            return 10 ** Rate.SCALE
+        return rates.get_rate(currency, date_str).units
+
+    def add_buy(self, row):
+        """
+        :param row: Any row, only BUYs with some amount left are queued
+        """
+        if row[self.col_idx['Rodzaj']] == 'Sprzedaż':
+            return
+        amount = Amount.of(row[self.col_idx['Ilość']]).units
+        if amount == 0:  # Already used BUYs
+            return
+        market = row[self.col_idx['Rynek']]
+        cost_rate = Rate.of(row[self.col_idx['Kurs']]).units * \
+            LotPool.get_fx(market, row[self.col_idx['Data operacji']], self.rates)
+        self.lots.setdefault(ExchangeRates.get_base_currency(market), deque()).append([row, amount, cost_rate])
+
+    def sell(self, sell_row):
+        """
+        :param sell_row: 'Sprzedaż' row
+        :return: Tuple (income, cost) as sums of Amount x Rate (x exchange rate) products, see get_scale()
+        """
+        amount_idx = self.col_idx['Ilość']
+        market = sell_row[self.col_idx['Rynek']]
+        lots = self.lots.get(ExchangeRates.get_base_currency(market), ())
+        sell_amount = Amount.of(sell_row[amount_idx]).units
+
+        used = 0
+        cost = 0
+        while sell_amount and lots:
+            lot = lots[0]
+            log.debug("Working with BUY row: {}".format(lot[0]))
+            taken = min(sell_amount, lot[1])
+            used += taken
+            cost += taken * lot[2]
+            sell_amount -= taken
+            lot[1] -= taken
+            lot[0][amount_idx] = Amount(lot[1])
+            if not lot[1]:
+                lots.popleft()
+
+        if sell_amount:
+            log.debug('Not enough BUYs for "{}" units of "{}"'.format(sell_amount, market))
+
+        income = used * Rate.of(sell_row[self.col_idx['Kurs']]).units * \
+            LotPool.get_fx(market, sell_row[self.col_idx['Data operacji']], self.rates)
+        return income, cost
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+
+class FixedPoint:
+    """
+    Exact decimal value kept as an int number of the smallest units (10^-SCALE).
+    Arithmetic is plain int arithmetic, formatting happens once, at the output.
+    """
+
+    SCALE = 0
+
+    __slots__ = ('units',)
+
+    def __init__(self, units=0):
+        self.units = units
+
+    @classmethod
+    def parse(cls, text):
+        """
+        :param text: e.g. '14440.01', '-500', '0.06777000'
+        :return: Instance of cls. More decimal places than SCALE are rounded half to even,
+         same as Decimal.quantize() does by default
+        """
+        text = text.strip()
+        negative = text.startswith('-')
+        if negative or text.startswith('+'):
+            text = text[1:]
+
+        integer, _, fraction = text.partition('.')
+        if not (integer or fraction) or not (integer + fraction).isdigit():
+            raise ValueError('Not a decimal value: "{}"'.format(text))
+
+        units = int((integer or '0') + fraction)
+        instance = cls.from_units(units, len(fraction))
+        if negative:
+            instance.units = -instance.units
+        return instance
+
+    @classmethod
+    def of(cls, value):
+        """
+        :param value: Instance of cls, its text representation or its int units (e.g. read by FastCsv)
+        """
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, int):
+            return cls(value)
+        return cls.parse(value)
+
+    @classmethod
+    def from_units(cls, units, scale):
+        """
+        :param units: int number of 10^-scale units, e.g. a product of an Amount and a Rate
+        :return: Instance of cls, rounded half to even
+        """
+        if scale <= cls.SCALE:
+            return cls(units * 10 ** (cls.SCALE - scale))
+
+        divisor = 10 ** (scale - cls.SCALE)
+        quotient, remainder = divmod(units, divisor)
+        if 2 * remainder > divisor or (2 * remainder == divisor and quotient % 2):
+            quotient += 1
+        return cls(quotient)
+
+    def __add__(self, other):
+        return self.__class__(self.units + other.units)
+
+    def __sub__(self, other):
+        return self.__class__(self.units - other.units)
+
+    def __neg__(self):
+        return self.__class__(-self.units)
+
+    def __eq__(self, other):
+        return isinstance(other, FixedPoint) and self.SCALE == other.SCALE and self.units == other.units
+
+    def __hash__(self):
+        return hash((self.SCALE, self.units))
+
+    def __lt__(self, other):
+        return self.units < other.units
+
+    def __le__(self, other):
+        return self.units <= other.units
+
+    def __gt__(self, other):
+        return self.units > other.units
+
+    def __ge__(self, other):
+        return self.units >= other.units
+
+    def __bool__(self):
+        return self.units != 0
+
+    def __str__(self):
+        units = abs(self.units)
+        sign = '-' if self.units < 0 else ''
+        if not self.SCALE:
+            return sign + str(units)
+        integer, fraction = divmod(units, 10 ** self.SCALE)
+        return '{}{}.{:0{}d}'.format(sign, integer, fraction, self.SCALE)
+
+    def __repr__(self):
+        return "{}('{}')".format(self.__class__.__name__, self)
+
+
+class Money(FixedPoint):
+    """
+    PLN in grosze
+    """
+    SCALE = 2
+
+
+class Amount(FixedPoint):
+    """
+    Crypto currency amount in 10^-8 units (satoshi for BTC)
+    """
+    SCALE = 8
+
+
+class Rate(FixedPoint):
+    """
+    Exchange rate (Kurs) in 10^-8 units, precise enough for both PLN and crypto quoted markets
+    """
+    SCALE = 8
+
+
+# Scale of the product of an Amount and a Rate, e.g. value of a transaction
+PRODUCT_SCALE = Amount.SCALE + Rate.SCALE
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+# https://docs.python.org/3/library/csv.html
+import csv
+from datetime import datetime
+from itertools import chain
+
+from modules.HistoryConverter import HistoryConverter
+from modules.FastCsv import FastCsv
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+
+class NativeExport:
+    """
+    Reads the official bitbay CSV export (the "Export to CSV" of the history pages) directly, row by row.
+    It differs from the format used here (see HistoryConverter.HEADERS): column names (Polish or English),
+     ISO dates, decimal commas with spaces, BID/ASK, markets as BTC-PLN, currencies in the values, and the
+     operations history lists all the operations, not only the fees.
+    The format is detected from the headers and the first row, then every row is mapped on the fly.
+    """
+
+    # Internal column -> names in the export, lower case
+    COLUMNS = {
+        'transactions': {
+            'Rynek': ['rynek', 'market'],
+            'Data operacji': ['data operacji', 'data', 'operation date', 'date', 'time'],
+            'Rodzaj': ['rodzaj', 'action', 'side'],
+            'Typ': ['typ', 'type'],
+            'Kurs': ['kurs', 'rate', 'price'],
+            'Ilość': ['ilość', 'ilosc', 'amount', 'quantity'],
+            'Wartość': ['wartość', 'wartosc', 'value'],
+        },
+        'fees': {
+            'Data operacji': ['data operacji', 'data', 'operation date', 'date', 'time'],
+            'Rodzaj': ['rodzaj', 'operation type', 'operation', 'type'],
+            'Wartość': ['wartość', 'wartosc', 'value', 'amount'],
+            'Saldo po': ['saldo po', 'balance after', 'balance'],
+        },
+    }
+    # Optional column of the operations history
+    CURRENCY_COLUMN = ['waluta', 'currency']
+
+    KINDS = {'kupno': 'Kupno', 'bid': 'Kupno', 'buy': 'Kupno',
+             'sprzedaż': 'Sprzedaż', 'ask': 'Sprzedaż', 'sell': 'Sprzedaż'}
+    # Operations kept in the fees history, the others (deposits, withdrawals, trades...) are skipped
+    FEE_KIND = 'Pobranie prowizji za transakcję'
+    FEE_KINDS = ['pobranie prowizji za transakcję', 'transaction fee', 'trading fee', 'fee']
+
+    DATE_FORMAT = '%d-%m-%Y %H:%M:%S'
+    DATE_FORMATS = ['%d-%m-%Y %H:%M:%S', '%Y-%m-%d %H:%M:%S', '%d.%m.%Y %H:%M:%S', '%Y/%m/%d %H:%M:%S',
+                    '%m/%d/%Y %I:%M:%S %p', '%m/%d/%Y, %I:%M:%S %p']
+
+    @staticmethod
+    def iter_rows(path):
+        """
+        :param path: A CSV file, either already in the format used here or an official export
+        :return: Generator of rows in the format used here, headers first
+        """
+        with open(path, newline='', encoding="utf-8-sig") as csvfile:
+            delimiter = NativeExport.get_delimiter(csvfile.readline())
+            csvfile.seek(0)
+            reader = csv.reader(csvfile, delimiter=delimiter)
+            headers = next(reader, None)
+            if headers is None:
+                return
+            first_row = next(reader, None)
+            headers, convert = NativeExport.get_converter(headers, first_row)
+            if convert is None and delimiter == ';':
+                # The format used here, in bulk
+                csvfile.close()
+                yield from FastCsv.iter_rows(path, headers)
+                return
+            yield headers
+
+            rows = reader if first_row is None else chain([first_row], reader)
+            if convert is None:
+                yield from rows
+                return
+            for row in rows:
+                row = convert(row)
+                if row is not None:
+                    yield row
+
+    @staticmethod
+    def inspect(path):
+        """
+        :return: Tuple (delimiter, headers in the format used here, row converter or None)
+        """
+        with open(path, newline='', encoding="utf-8-sig") as csvfile:
+            delimiter = NativeExport.get_delimiter(csvfile.readline())
+            csvfile.seek(0)
+            reader = csv.reader(csvfile, delimiter=delimiter)
+            headers, convert = NativeExport.get_converter(next(reader, []), next(reader, None))
+        return delimiter, headers, convert
+
+    @staticmethod
+    def get_delimiter(headers_line):
+        return ',' if headers_line.count(',') > headers_line.count(';') else ';'
+
+    @staticmethod
+    def get_converter(headers, first_row):
+        """
+        :param headers: Headers of the file
+        :param first_row: First data row, for the date format, or None
+        :return: Tuple (headers in the format used here, function: row -> row in the format used here, or None
+         when the row is skipped; the function is None when the file is already in the format used here, maybe
+         with more columns)
+        """
+        for history_type in ['transactions', 'fees']:
+            internal_headers = list(HistoryConverter.HEADERS[history_type])
+            if all(column in headers for column in internal_headers) and (first_row is None or NativeExport.is_date(
+                    first_row[headers.index('Data operacji')], NativeExport.DATE_FORMAT)):
+                # Extra columns (e.g. 'ID' of the API history) are kept as they are
+                return list(headers), None
+
+            positions = NativeExport.get_positions(headers, NativeExport.COLUMNS[history_type])
+            if positions is None:
+                continue
+
+            date_format = NativeExport.get_date_format(first_row[positions[1 if history_type == 'transactions'
+                                                                           else 0]] if first_row else None)
+            log.debug('Official {} export, dates as "{}"'.format(history_type, date_format))
+            if history_type == 'transactions':
+                return internal_headers, NativeExport.get_transactions_converter(positions, date_format)
+
+            currency_position = NativeExport.get_positions(headers, {'Waluta': NativeExport.CURRENCY_COLUMN})
+            return internal_headers, NativeExport.get_fees_converter(
+                positions, currency_position[0] if currency_position else None, date_format)
+
+        raise ValueError('Unknown CSV format, headers: "{}"'.format(headers))
+
+    @staticmethod
+    def get_positions(headers, columns):
+        """
+        :param columns: Internal column -> names in the export
+        :return: Positions of the internal columns in the headers, in order, None if any is missing
+        """
+        names = [name.strip().lower() for name in headers]
+        positions = []
+        for aliases in columns.values():
+            position = next((names.index(alias) for alias in aliases if alias in names and
+                             names.index(alias) not in positions), None)
+            if position is None:
+                return None
+            positions.append(position)
+
+        return positions
+
+    @staticmethod
+    def is_date(date_str, date_format):
+        try:
+            datetime.strptime(date_str.strip(), date_format)
+            return True
+        except ValueError:
+            return False
+
+    @staticmethod
+    def get_date_format(date_str):
+        if date_str is None:
+            return NativeExport.DATE_FORMAT
+        for date_format in NativeExport.DATE_FORMATS:
+            if NativeExport.is_date(date_str, date_format):
+                return date_format
+        raise ValueError('Unknown date format: "{}"'.format(date_str))
+
+    @staticmethod
+    def get_date_converter(date_format):
+        """
+        :return: function: date in date_format -> 'dd-mm-YYYY HH:MM:SS'
+        """
+        if date_format == NativeExport.DATE_FORMAT:
+            return str.strip
+        if date_format == '%Y-%m-%d %H:%M:%S':
+            # Most of the exports, no need for strptime
+            return lambda date_str: date_str[8:10] + '-' + date_str[5:7] + '-' + date_str[0:4] + date_str[10:19]
+        return lambda date_str: datetime.strptime(date_str.strip(), date_format).strftime(NativeExport.DATE_FORMAT)
+
+    @staticmethod
+    def parse_number(value):
+        """
+        :param value: Like '-1 234,56 PLN', '0.0677 ETH' or '1,234.56'
+        :return: Tuple (number as text with a decimal point, currency or '')
+        """
+        value = value.replace('\xa0', '').replace(' ', '').replace('−', '-')
+        number = value.rstrip('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+        currency = value[len(number):]
+        if ',' in number:
+            number = number.replace(',', '') if '.' in number else number.replace(',', '.')
+        return number, currency
+
+    @staticmethod
+    def get_market(market):
+        """
+        :return: Market as 'BTC - PLN'
+        """
+        base, _, quote = market.replace(' ', '').replace('/', '-').upper().partition('-')
+        return '{} - {}'.format(base, quote)
+
+    @staticmethod
+    def get_transactions_converter(positions, date_format):
+        market_idx, date_idx, kind_idx, type_idx, rate_idx, amount_idx, value_idx = positions
+        convert_date = NativeExport.get_date_converter(date_format)
+
+        def convert(row):
+            kind = row[kind_idx].strip()
+            return [NativeExport.get_market(row[market_idx]),
+                    convert_date(row[date_idx]),
+                    NativeExport.KINDS.get(kind.lower(), kind),
+                    row[type_idx].strip().capitalize(),
+                    NativeExport.parse_number(row[rate_idx])[0],
+                    NativeExport.parse_number(row[amount_idx])[0],
+                    NativeExport.parse_number(row[value_idx])[0]]
+
+        return convert
+
+    @staticmethod
+    def get_fees_converter(positions, currency_idx, date_format):
+        date_idx, kind_idx, value_idx, balance_idx = positions
+        convert_date = NativeExport.get_date_converter(date_format)
+
+        def convert(row):
+            kind, _, kind_currency = row[kind_idx].strip().partition(':')
+            if kind.lower() not in NativeExport.FEE_KINDS:
+                return None
+            value, value_currency = NativeExport.parse_number(row[value_idx])
+            currency = row[currency_idx].strip().upper() if currency_idx is not None else \
+                kind_currency.strip() or value_currency
+            return [convert_date(row[date_idx]),
+                    '{}: {}'.format(NativeExport.FEE_KIND, currency),
+                    value.lstrip('-'),
+                    NativeExport.parse_number(row[balance_idx])[0]]
+
+        return convert
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+import copy
+import csv
+import os
+import tempfile
+from datetime import datetime
+
+from modules.Taxer import Taxer
+from modules.Feeer import Feeer
+from modules.HistoryGenerator import HistoryGenerator
+from modules.HistoryConverter import HistoryConverter
+from modules.OutOfCore import OutOfCore
+from modules.Incremental import Incremental
+from modules.OutputSinks import CsvSink, write_to_sinks
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+
+def reference_engine(transactions_data, fees_data):
+    """
+    The serial calculations, as done by bitbay_tax_calculator.py
+    """
+    data = Feeer.include_fees(transactions_data, fees_data)
+    data = Taxer.calculate_gain_fifo(data)
+    return Taxer.calculate_pcc(data)
+
+
+def parallel_engine(transactions_data, fees_data):
+    data = Feeer.include_fees(transactions_data, fees_data)
+    data = Taxer.calculate_gain_fifo(data, workers=2, parallel_min_rows=0)
+    return Taxer.calculate_pcc(data)
+
+
+def out_of_core_engine(transactions_data, fees_data):
+    # Tiny segments, so that everything is spilled
+    with tempfile.TemporaryDirectory() as directory:
+        transactions_path = os.path.join(directory, 'transactions_history.csv')
+        fees_path = os.path.join(directory, 'fees_history.csv')
+        output = os.path.join(directory, 'transactions_history_tax.csv')
+        HistoryConverter.write_csv(transactions_path, transactions_data)
+        HistoryConverter.write_csv(fees_path, fees_data)
+        OutOfCore.calculate(transactions_path, fees_path, [CsvSink(output)], 0, spill_dir=directory, segment_rows=3)
+        with open(output, newline='', encoding="utf-8") as csvfile:
+            return list(csv.reader(csvfile, delimiter=';'))
+
+
+def incremental_engine(transactions_data, fees_data):
+    # The older half of the history first, then all of it reusing that run (a snapshot after every group)
+    dates = sorted(datetime.strptime(row[1], '%d-%m-%Y %H:%M:%S') for row in transactions_data[1:])
+    cutoff = dates[len(dates) // 2]
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, 'transactions_history_tax.csv')
+        incremental = Incremental(Incremental.get_path_for(output), snapshot_every=1)
+        older = [[transactions_data[0]] + [row for row in transactions_data[1:]
+                                           if datetime.strptime(row[1], '%d-%m-%Y %H:%M:%S') < cutoff],
+                 [fees_data[0]] + [row for row in fees_data[1:]
+                                   if datetime.strptime(row[0], '%d-%m-%Y %H:%M:%S') < cutoff]]
+        for data in (copy.deepcopy(older), (transactions_data, fees_data)):
+            if len(data[0]) > 1:
+                write_to_sinks(incremental.calculate(data[0], data[1], output=output), [CsvSink(output)])
+                incremental.save(output)
+        with open(output, newline='', encoding="utf-8") as csvfile:
+            return list(csv.reader(csvfile, delimiter=';'))
+
+
+class Oracle:
+    """
+    Differential testing of alternative (faster) engines against the reference calculations.
+    Numbers go on tax returns, so an engine is enabled only when it gives the same output, cell by cell,
+     for many random histories (see HistoryGenerator), bitbay_fuzz.py runs it as a gate.
+    """
+
+    # Engine: function(transactions data, fees data) -> output rows, inputs may be changed in place
+    ENGINES = {
+        'parallel': parallel_engine,
+        'out_of_core': out_of_core_engine,
+        'incremental': incremental_engine,
+    }
+
+    @staticmethod
+    def run(engine, transactions_data, fees_data):
+        """
+        :return: Output rows, or the name of the exception raised (failing the same way is the same output)
+        """
+        try:
+            return engine(copy.deepcopy(transactions_data), copy.deepcopy(fees_data))
+        except Exception as e:
+            return type(e).__name__
+
+    @staticmethod
+    def compare(expected, actual):
+        """
+        :param expected: Output of the reference engine, see run()
+        :param actual: Output of the engine under test, see run()
+        :return: List of differences as text, empty when the same
+        """
+        if isinstance(expected, str) or isinstance(actual, str):
+            return [] if expected == actual else ['expected {!r}, got {!r}'.format(
+                expected if isinstance(expected, str) else 'rows', actual if isinstance(actual, str) else 'rows')]
+
+        differences = []
+        if len(expected) != len(actual):
+            differences.append('expected {} rows, got {}'.format(len(expected), len(actual)))
+        headers = expected[0] if expected else []
+        for i in range(0, min(len(expected), len(actual))):
+            if len(expected[i]) != len(actual[i]):
+                differences.append('row {}: expected {} cells, got {}'.format(i, len(expected[i]), len(actual[i])))
+            for j in range(0, min(len(expected[i]), len(actual[i]))):
+                if expected[i][j] != actual[i][j]:
+                    column = headers[j] if j < len(headers) else j
+                    differences.append('row {} "{}": expected "{}", got "{}"'.format(i, column, expected[i][j],
+                                                                                     actual[i][j]))
+
+        return differences
+
+    @staticmethod
+    def check(engine, case):
+        """
+        :param case: See HistoryGenerator
+        :return: List of differences between the engine and the reference, empty when the same
+        """
+        transactions_data, fees_data = HistoryGenerator.render(case)
+        return Oracle.compare(Oracle.run(reference_engine, transactions_data, fees_data),
+                              Oracle.run(engine, transactions_data, fees_data))
+
+    @staticmethod
+    def shrink(engine, case):
+        """
+        Delta debugging: drop chunks of entries (halves, quarters... single ones) as long as the case still fails
+        :param case: Failing case, see HistoryGenerator
+        :return: A minimal failing case
+        """
+        entries = case['entries']
+        chunks = 2
+        while len(entries) > 1:
+            chunk_size = -(-len(entries) // chunks)
+            for start in range(0, len(entries), chunk_size):
+                candidate = dict(case, entries=entries[:start] + entries[start + chunk_size:])
+                if candidate['entries'] and Oracle.check(engine, candidate):
+                    log.debug('Shrunk to "{}" entries'.format(len(candidate['entries'])))
+                    entries = candidate['entries']
+                    chunks = max(chunks - 1, 2)
+                    break
+            else:
+                if chunk_size == 1:
+                    break
+                chunks = min(chunks * 2, len(entries))
+
+        case = dict(case, entries=entries)
+        if case['reversed'] and Oracle.check(engine, dict(case, reversed=False)):
+            case['reversed'] = False
+        return case
+
+    @staticmethod
+    def fuzz(engine, cases=200, seed=0, bursts=20):
+        """
+        :return: None when all the cases pass, a tuple (minimal failing case, its differences) otherwise
+        """
+        generator = HistoryGenerator(seed)
+        for i in range(0, cases):
+            case = generator.generate(generator.random.randint(1, bursts))
+            if Oracle.check(engine, case):
+                log.warning('Case "{}" failed, shrinking it'.format(i))
+                case = Oracle.shrink(engine, case)
+                return case, Oracle.check(engine, case)
+
+        return None
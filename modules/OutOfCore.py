@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+from datetime import datetime
+from itertools import zip_longest
+# https://docs.python.org/3/library/marshal.html
+import marshal
+import os
+import struct
+import tempfile
+
+from modules.Taxer import Taxer
+from modules.Feeer import Feeer
+from modules.Money import Amount, Rate
+from modules.ExchangeRates import ExchangeRates
+from modules.LotPool import LotPool
+from modules.OutputSinks import write_to_sinks
+from modules.ExportMerger import ExportMerger
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+# Rough size of a parsed row in memory (a list of a dozen short str objects), to turn the budget into rows
+ROW_BYTES = 1024
+# Read/write buffer of every lot queue, the files are open only to move a whole buffer
+LOT_BUFFER_SIZE = 64 * 1024
+
+
+class RowSpill:
+    """
+    Rows in the order appended, the last segment in memory and the others on disk (marshal files).
+    Segments are written and read back whole, sequentially.
+    """
+
+    def __init__(self, directory, name, segment_rows):
+        self.directory = directory
+        self.name = name
+        self.segment_rows = segment_rows
+        self.paths = []
+        self.buffer = []
+
+    def append(self, row):
+        self.buffer.append(row)
+        if len(self.buffer) >= self.segment_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        path = os.path.join(self.directory, '{}_{:06d}.seg'.format(self.name, len(self.paths)))
+        with open(path, 'wb') as segment_file:
+            marshal.dump(self.buffer, segment_file)
+        self.paths.append(path)
+        self.buffer = []
+
+    def iter_rows(self, reverse=False):
+        """
+        :param reverse: Last row first, segments are still read as a whole
+        """
+        if reverse:
+            yield from reversed(self.buffer)
+        for path in (reversed(self.paths) if reverse else self.paths):
+            with open(path, 'rb') as segment_file:
+                rows = marshal.load(segment_file)
+            yield from (reversed(rows) if reverse else rows)
+        if not reverse:
+            yield from self.buffer
+
+
+class LotQueue:
+    """
+    BUY lots of a single crypto currency (all its markets) in a file of fixed size records: amount units, rate
+     units, exchange rate units. Written once in the order of data, then consumed from the front by SELLs,
+     see LotPool.
+    No file is kept open, so any number of crypto currencies fits in the limit of open files.
+    """
+
+    RECORD = struct.Struct('=qqq')
+
+    def __init__(self, path):
+        self.path = path
+        open(path, 'wb').close()
+        self.buffer = bytearray()
+        # Bytes of the file read so far
+        self.position = 0
+        self.records = iter(())
+        # [amount units left, rate units x exchange rate units]
+        self.lot = None
+
+    def append(self, amount, rate, fx):
+        self.buffer += LotQueue.RECORD.pack(amount, rate, fx)
+        if len(self.buffer) >= LOT_BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        with open(self.path, 'ab') as lots_file:
+            lots_file.write(self.buffer)
+        self.buffer = bytearray()
+
+    def start_reading(self):
+        self.flush()
+
+    def read_chunk(self):
+        with open(self.path, 'rb') as lots_file:
+            lots_file.seek(self.position)
+            chunk = lots_file.read(LOT_BUFFER_SIZE // LotQueue.RECORD.size * LotQueue.RECORD.size)
+        self.position += len(chunk)
+        return chunk
+
+    def next_lot(self):
+        """
+        :return: Next lot with some amount left or None
+        """
+        while True:
+            record = next(self.records, None)
+            if record is None:
+                chunk = self.read_chunk()
+                if not chunk:
+                    return None
+                self.records = LotQueue.RECORD.iter_unpack(chunk)
+                continue
+            # Empty BUYs are skipped, just like already used ones
+            if record[0]:
+                return [record[0], record[1] * record[2]]
+
+    def sell(self, amount):
+        """
+        :param amount: SELL amount units
+        :return: Tuple (amount units matched, cost as a sum of Amount x Rate (x exchange rate) products)
+        """
+        used = 0
+        cost = 0
+        while amount:
+            if self.lot is None:
+                self.lot = self.next_lot()
+                if self.lot is None:
+                    log.debug('Not enough BUYs for "{}" units'.format(amount))
+                    break
+            taken = min(amount, self.lot[0])
+            used += taken
+            cost += taken * self.lot[1]
+            amount -= taken
+            self.lot[0] -= taken
+            if not self.lot[0]:
+                self.lot = None
+
+        return used, cost
+
+    def close(self):
+        self.records = iter(())
+        self.lot = None
+
+
+class OutOfCore:
+    """
+    External memory version of bitbay_tax_calculator.py calculations, for histories larger than RAM.
+    The same results as Feeer.include_fees(), Taxer.calculate_gain_fifo() and Taxer.calculate_pcc():
+     1. both CSV files are streamed group by group, rows with fees are spilled to disk segments
+     2. the rows are read back in the FIFO order and BUYs written to a lot queue file per crypto currency
+     3. the rows are read back once more, SELLs consume their lot queues, results go straight to the sinks
+    Only a segment of rows and small buffers are in memory at a time, all the I/O is sequential.
+    """
+
+    @staticmethod
+    def calculate(transactions_path, fees_path, sinks, memory_budget, rates=None, spill_dir=None,
+                  segment_rows=None):
+        """
+        :param sinks: List of OutputSink
+        :param memory_budget: Bytes, mostly for the segments of rows
+        :param rates: ExchangeRates for markets not quoted in PLN
+        :param spill_dir: Directory for the temporary files, system default if None
+        :param segment_rows: Rows per segment, derived from the memory budget if None
+        """
+        # A segment being written or read, plus one of the sinks batches, with a good margin
+        segment_rows = segment_rows or max(1000, memory_budget // 4 // ROW_BYTES)
+        log.info('Out-of-core calculations, "{}" rows per segment'.format(segment_rows))
+
+        with tempfile.TemporaryDirectory(prefix='bitbay_spill_', dir=spill_dir) as directory:
+            rows = RowSpill(directory, 'rows', segment_rows)
+
+            log.info('Include fees in transaction data')
+            headers, reverse = OutOfCore.include_fees(transactions_path, fees_path, rows, rates)
+            rows.flush()
+            log.debug('Spilled "{}" segments of rows'.format(len(rows.paths)))
+            col_idx = Taxer.get_col_indexes([headers])
+
+            log.info('Queue the BUYs per crypto currency')
+            lots = OutOfCore.queue_buys(rows.iter_rows(reverse), col_idx, directory, rates)
+
+            log.info('Include the gain tax FIFO and PCC calculations')
+            try:
+                results = OutOfCore.iter_results(headers, rows.iter_rows(reverse), col_idx, lots, rates, segment_rows)
+                write_to_sinks(results, sinks, batch_size=segment_rows)
+            finally:
+                for lot_queue in lots.values():
+                    lot_queue.close()
+
+    @staticmethod
+    def include_fees(transactions_path, fees_path, rows, rates=None):
+        """
+        Feeer.include_fees() group by group (the heuristic only, rows with IDs are not supported here)
+        :param rows: RowSpill for the transactions rows with fees
+        :return: Tuple (headers, True if the rows are younger first)
+        """
+        # A CSV file or a directory of them, streamed either way
+        transactions_reader = ExportMerger.iter_rows(transactions_path)
+        fees_reader = ExportMerger.iter_rows(fees_path)
+        headers = next(transactions_reader)
+        tran_col_idx = Taxer.get_col_indexes([headers])
+        fees_col_idx = Feeer.get_col_indexes([next(fees_reader)])
+        if 'ID' in tran_col_idx and 'ID' in fees_col_idx:
+            raise ValueError('Data with IDs is not supported by the out-of-core mode')
+
+        first_date = None
+        last_date = None
+        for tran_group, fees_group in zip_longest(Feeer.iter_groups_by_date(transactions_reader, tran_col_idx),
+                                                  Feeer.iter_groups_by_date(fees_reader, fees_col_idx)):
+            # Same as Feeer.sanity_check_of_groups()
+            assert tran_group is not None and fees_group is not None
+            assert len(tran_group) == len(fees_group)
+
+            fees_positions = Feeer.match_group(tran_group, fees_group, tran_col_idx, fees_col_idx)
+            for tran_row, fees_position in zip(tran_group, fees_positions):
+                tran_row.append(Feeer.get_fee_in_pln(tran_row, fees_group[fees_position], tran_col_idx,
+                                                     fees_col_idx, rates))
+                rows.append(tran_row)
+
+            if tran_group:
+                first_date = first_date or tran_group[0][tran_col_idx['Data operacji']]
+                last_date = tran_group[-1][tran_col_idx['Data operacji']]
+
+        headers.append('Prowizja')
+
+        # Same as Taxer.calculate_gain_fifo(), older first
+        date_format = '%d-%m-%Y %H:%M:%S'
+        reverse = first_date is not None and \
+            datetime.strptime(first_date, date_format) > datetime.strptime(last_date, date_format)
+        return headers, reverse
+
+    @staticmethod
+    def queue_buys(rows, col_idx, directory, rates=None):
+        """
+        :return: Dictionary crypto currency -> LotQueue, ready for reading
+        """
+        lots = {}
+        for row in rows:
+            if row[col_idx['Rodzaj']] == 'Sprzedaż':
+                continue
+            market = row[col_idx['Rynek']]
+            crypto = ExchangeRates.get_base_currency(market)
+            if crypto not in lots:
+                lots[crypto] = LotQueue(os.path.join(directory, 'lots_{:04d}.bin'.format(len(lots))))
+            lots[crypto].append(Amount.parse(row[col_idx['Ilość']]).units, Rate.parse(row[col_idx['Kurs']]).units,
+                                LotPool.get_fx(market, row[col_idx['Data operacji']], rates))
+
+        for lot_queue in lots.values():
+            lot_queue.start_reading()
+        return lots
+
+    @staticmethod
+    def iter_results(headers, rows, col_idx, lots, rates, batch_size):
+        """
+        :return: Generator of the output rows, headers first
+        """
+        headers = headers + ['Przychód', 'Koszt', 'Dochód']
+        yield headers + ['PCC']
+
+        scale = LotPool.get_scale(rates)
+        batch = []
+        for row in rows:
+            if row[col_idx['Rodzaj']] == 'Sprzedaż':
+                market = row[col_idx['Rynek']]
+                crypto = ExchangeRates.get_base_currency(market)
+                fx = LotPool.get_fx(market, row[col_idx['Data operacji']], rates)
+                used, cost = lots[crypto].sell(Amount.parse(row[col_idx['Ilość']]).units) if crypto in lots \
+                    else (0, 0)
+                income = used * Rate.parse(row[col_idx['Kurs']]).units * fx
+                gains = Taxer.get_gains_results(income, cost, scale)
+                row.extend([gains['income'], gains['cost'], gains['gain']])
+            else:
+                row.extend(['', '', ''])
+
+            batch.append(row)
+            if len(batch) >= batch_size:
+                # PCC is calculated per row, headers copy gets the 'PCC' column there
+                yield from Taxer.calculate_pcc([list(headers)] + batch, rates)[1:]
+                batch = []
+
+        yield from Taxer.calculate_pcc([list(headers)] + batch, rates)[1:]
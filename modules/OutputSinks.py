@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+# https://docs.python.org/3/library/csv.html
+import csv
+import json
+
+from modules.Taxer import Taxer
+from modules.TaxIndex import TaxIndex
+from modules.Money import Money
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+# Bytes of the file buffers, rows are written in bulk anyway
+BUFFER_SIZE = 1024 * 1024
+
+
+class OutputSink:
+    """
+    Receives the stream of finished rows, see write_to_sinks().
+    open() gets the headers, write_rows() batches of rows, close() finishes the output.
+    The base class discards everything, sinks override what they need.
+    """
+
+    def open(self, headers):
+        self.headers = headers
+        self.col_idx = Taxer.get_col_indexes([headers])
+
+    def write_rows(self, rows):
+        pass
+
+    def close(self):
+        pass
+
+
+class CsvSink(OutputSink):
+    """
+    The calculator output: a bitbay style CSV file followed by footer rows
+    """
+
+    def __init__(self, path, footer=()):
+        self.path = path
+        self.footer = footer
+
+    def open(self, headers):
+        super().open(headers)
+        self.file = open(self.path, 'w', newline='', encoding="utf-8", buffering=BUFFER_SIZE)
+        self.writer = csv.writer(self.file, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        self.writer.writerow(headers)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.writer.writerows(self.footer)
+        self.file.close()
+        log.info('CSV saved as: "{}"'.format(self.path))
+
+
+class JsonLinesSink(OutputSink):
+    """
+    One JSON object per row, keys are the column names
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def open(self, headers):
+        super().open(headers)
+        self.file = open(self.path, 'w', encoding="utf-8", buffering=BUFFER_SIZE)
+
+    def write_rows(self, rows):
+        self.file.write(''.join(json.dumps(dict(zip(self.headers, row)), ensure_ascii=False) + '\n'
+                                for row in rows))
+
+    def close(self):
+        self.file.close()
+        log.info('JSON Lines saved as: "{}"'.format(self.path))
+
+
+class PerYearCsvSink(OutputSink):
+    """
+    A separate CSV file (with headers) for every year, e.g. transactions_history_tax_2019.csv
+    """
+
+    def __init__(self, path_prefix):
+        self.path_prefix = path_prefix
+        self.files = {}
+
+    def write_rows(self, rows):
+        date_idx = self.col_idx['Data operacji']
+        rows_by_year = {}
+        for row in rows:
+            rows_by_year.setdefault(row[date_idx][6:10], []).append(row)
+
+        for year, year_rows in rows_by_year.items():
+            if year not in self.files:
+                year_file = open('{}_{}.csv'.format(self.path_prefix, year), 'w', newline='', encoding="utf-8",
+                                 buffering=BUFFER_SIZE)
+                writer = csv.writer(year_file, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+                writer.writerow(self.headers)
+                self.files[year] = (year_file, writer)
+            self.files[year][1].writerows(year_rows)
+
+    def close(self):
+        for year, (year_file, writer) in sorted(self.files.items()):
+            year_file.close()
+            log.info('CSV for {} saved as: "{}_{}.csv"'.format(year, self.path_prefix, year))
+
+
+class SummarySink(OutputSink):
+    """
+    Totals of the tax columns per year and market, plus all markets together
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # (year, market) -> [grosze per TaxIndex.COLUMNS]
+        self.totals = {}
+
+    def write_rows(self, rows):
+        date_idx = self.col_idx['Data operacji']
+        market_idx = self.col_idx['Rynek']
+        columns_idx = [self.col_idx.get(column) for column in TaxIndex.COLUMNS]
+        for row in rows:
+            for key in ((row[date_idx][6:10], row[market_idx]), (row[date_idx][6:10], TaxIndex.ALL_MARKETS)):
+                sums = self.totals.setdefault(key, [0] * len(columns_idx))
+                for i in range(0, len(columns_idx)):
+                    if columns_idx[i] is not None and row[columns_idx[i]]:
+                        sums[i] += Money.parse(row[columns_idx[i]]).units
+
+    def close(self):
+        with open(self.path, 'w', newline='', encoding="utf-8") as summary_file:
+            writer = csv.writer(summary_file, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(['Rok', 'Rynek'] + TaxIndex.COLUMNS)
+            for (year, market), sums in sorted(self.totals.items()):
+                writer.writerow([year, market] + [str(Money(units)) for units in sums])
+        log.info('Summary saved as: "{}"'.format(self.path))
+
+
+class TaxIndexSink(OutputSink):
+    """
+    Prefix sums index, see TaxIndex. Built as the rows come, only the running sums per market and timestamp
+     are kept.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index = TaxIndex()
+
+    def write_rows(self, rows):
+        market_idx = self.col_idx['Rynek']
+        date_idx = self.col_idx['Data operacji']
+        for row in rows:
+            self.index.add(row[market_idx], TaxIndex.date_to_key(row[date_idx]), TaxIndex.get_values(row, self.col_idx))
+
+    def close(self):
+        self.index.save(self.path)
+        log.info('Index saved as: "{}"'.format(self.path))
+
+
+def write_to_sinks(data, sinks, batch_size=10000):
+    """
+    A single traversal of data, every sink gets the same batches of rows
+    :param data: Iterable of rows, headers first
+    :param sinks: List of OutputSink
+    """
+    rows = iter(data)
+    headers = next(rows)
+    for sink in sinks:
+        sink.open(headers)
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            for sink in sinks:
+                sink.write_rows(batch)
+            batch = []
+    if batch:
+        for sink in sinks:
+            sink.write_rows(batch)
+
+    for sink in sinks:
+        sink.close()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+from bisect import bisect_left
+from itertools import accumulate
+# https://docs.python.org/3/library/multiprocessing.html
+import multiprocessing
+
+from modules.Taxer import Taxer
+from modules.Money import Amount, Rate
+from modules.LotPool import LotPool
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+# Buy lots of all the chunks, set in every worker of the resolve stage, see init_worker()
+WORKER_STATE = {}
+
+
+class ParallelFifo:
+    """
+    FIFO of a single (very large) crypto currency split into time chunks, with the same results as the serial
+     LotPool: all BUYs of its markets are queued in the order of data and every SELL takes
+     from the front of the queue.
+
+    Then a SELL uses exactly the units [sells before it, sells before it + its amount) of the queue (clipped to
+     all the BUYs, the rest is a shortfall), so:
+     1. chunks are parsed in parallel into local prefix sums of BUY amounts and costs, plus their SELL demand
+     2. a prefix scan over the chunk totals gives every chunk its offsets in the queue and in the SELL demand
+     3. chunks resolve their SELLs in parallel, cost of any queue interval is a difference of two prefix sums
+    Sums are the same ints as the serial engine adds, so the rounded results are identical.
+    """
+
+    @staticmethod
+    def calculate_market(rows, col_idx, rates=None, workers=None, chunk_size=None):
+        """
+        :param rows: Rows of all the markets of a single crypto currency, in the order used by
+         Taxer.calculate_gain_fifo()
+        :param col_idx: Column indexes, see Taxer.get_col_indexes()
+        :param rates: ExchangeRates for markets not quoted in PLN
+        :param workers: Number of processes, all CPUs by default
+        :param chunk_size: Rows per chunk, a few chunks per worker by default
+        :return: List of gains dictionaries (see Taxer.get_gains_results()) for the SELL rows, in order
+        """
+        workers = workers or multiprocessing.cpu_count()
+        chunk_size = chunk_size or max(1, -(-len(rows) // (workers * 4)))
+
+        # Only what the workers need, exchange rates are looked up here (they are cached per day anyway)
+        entries = [(row[col_idx['Rodzaj']] == 'Sprzedaż', row[col_idx['Ilość']], row[col_idx['Kurs']],
+                    LotPool.get_fx(row[col_idx['Rynek']], row[col_idx['Data operacji']], rates))
+                   for row in rows]
+        chunks = [entries[i:i + chunk_size] for i in range(0, len(entries), chunk_size)]
+        log.debug('Parallel FIFO of "{}" rows in "{}" chunks by "{}" workers'.format(len(rows), len(chunks), workers))
+
+        with multiprocessing.Pool(workers) as pool:
+            scanned = pool.map(scan_chunk, chunks)
+
+        # Prefix scan of the chunk totals
+        buy_ends = list(accumulate(chunk[0][-1] if chunk[0] else 0 for chunk in scanned))
+        cost_ends = list(accumulate(chunk[1][-1] if chunk[1] else 0 for chunk in scanned))
+        sell_starts = [0] + list(accumulate(chunk[3] for chunk in scanned))[:-1]
+
+        lots = (buy_ends, cost_ends, [chunk[0] for chunk in scanned], [chunk[1] for chunk in scanned],
+                [chunk[2] for chunk in scanned])
+        with multiprocessing.Pool(workers, initializer=init_worker, initargs=(lots,)) as pool:
+            resolved = pool.starmap(resolve_chunk, [(scanned[c][4], sell_starts[c]) for c in range(0, len(chunks))])
+
+        scale = LotPool.get_scale(rates)
+        return [Taxer.get_gains_results(income, cost, scale) for chunk in resolved for income, cost in chunk]
+
+
+def scan_chunk(entries):
+    """
+    :param entries: List of (is sell, amount, rate, exchange rate units)
+    :return: Tuple (prefix sums of BUY amounts, prefix sums of BUY costs, BUY rates, SELL demand,
+     list of SELLs as (amount units, rate units))
+    """
+    buy_amounts = []
+    buy_rates = []
+    sells = []
+    for is_sell, amount, rate, fx in entries:
+        if is_sell:
+            sells.append((Amount.of(amount).units, Rate.of(rate).units * fx))
+        else:
+            buy_amounts.append(Amount.of(amount).units)
+            buy_rates.append(Rate.of(rate).units * fx)
+
+    return (list(accumulate(buy_amounts)), list(accumulate(a * r for a, r in zip(buy_amounts, buy_rates))),
+            buy_rates, sum(amount for amount, rate in sells), sells)
+
+
+def init_worker(lots):
+    WORKER_STATE['lots'] = lots
+
+
+def get_queue_cost(position):
+    """
+    :param position: Units from the front of the BUY queue of all chunks
+    :return: Cost of these units (sum of Amount x Rate products)
+    """
+    if position == 0:
+        return 0
+    buy_ends, cost_ends, chunk_amounts, chunk_costs, chunk_rates = WORKER_STATE['lots']
+
+    # Chunks without BUYs share the end with the previous one and are never found first
+    c = bisect_left(buy_ends, position)
+    local_position = position - (buy_ends[c - 1] if c else 0)
+    j = bisect_left(chunk_amounts[c], local_position)
+    cost_before = cost_ends[c - 1] if c else 0
+    # The lot containing the position is used up to it only
+    return cost_before + chunk_costs[c][j] - (chunk_amounts[c][j] - local_position) * chunk_rates[c][j]
+
+
+def resolve_chunk(sells, sell_start):
+    """
+    :param sells: List of (amount units, rate units)
+    :param sell_start: SELL units of all the previous chunks
+    :return: List of (income, cost) for the SELLs
+    """
+    total = WORKER_STATE['lots'][0][-1] if WORKER_STATE['lots'][0] else 0
+    results = []
+    start = sell_start
+    for amount, rate in sells:
+        end = start + amount
+        used_from = min(start, total)
+        used_to = min(end, total)
+        results.append(((used_to - used_from) * rate, get_queue_cost(used_to) - get_queue_cost(used_from)))
+        start = end
+
+    return results
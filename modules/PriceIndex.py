@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+import csv
+from datetime import datetime
+from functools import lru_cache
+import mmap
+import os
+import struct
+
+try:
+    # Python 3.9+, local time of the machine otherwise
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+
+from modules.ApiHistory import ApiHistory
+from modules.Money import Rate
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+
+class PriceIndex:
+    """
+    PLN prices of a crypto currency (e.g. BTC) for valuing crypto quoted markets like ETH - BTC.
+
+    A price history file (CSV: timestamp;price or OHLC with a 'close' column) is converted once into
+    a packed binary file next to it: a header and (timestamp, Rate units) int64 pairs sorted by timestamp.
+    The binary file is memory-mapped, so lookups (binary search) only touch a few pages of it.
+    """
+
+    MAGIC = b'BBPRICE1'
+    # magic, mtime_ns and size of the source file
+    HEADER = struct.Struct('=8sqq')
+    RECORD = struct.Struct('=qq')
+
+    def __init__(self, path):
+        """
+        :param path: Packed binary file, see build()
+        """
+        self.file = open(path, 'rb')
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        # Pairs of int64: timestamp, price units
+        self.values = memoryview(self.mmap)[PriceIndex.HEADER.size:].cast('q')
+        self.count = len(self.values) // 2
+        # Fills of one order share the timestamp
+        self.get_price_at = lru_cache(maxsize=4096)(self.find_price_at)
+
+    def close(self):
+        self.values.release()
+        self.mmap.close()
+        self.file.close()
+
+    @staticmethod
+    def get_path_for(history_path):
+        return history_path + '.bin'
+
+    @staticmethod
+    def load(history_path):
+        """
+        :param history_path: Price history CSV file
+        :return: PriceIndex, the binary file is (re)built when missing or older than the CSV file
+        """
+        path = PriceIndex.get_path_for(history_path)
+        stat = os.stat(history_path)
+        if not PriceIndex.is_up_to_date(path, stat):
+            PriceIndex.build(history_path, path)
+        return PriceIndex(path)
+
+    @staticmethod
+    def is_up_to_date(path, stat):
+        if not os.path.exists(path):
+            return False
+        with open(path, 'rb') as index_file:
+            header = index_file.read(PriceIndex.HEADER.size)
+        if len(header) != PriceIndex.HEADER.size:
+            return False
+        return PriceIndex.HEADER.unpack(header) == (PriceIndex.MAGIC, stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    def build(history_path, path):
+        """
+        :param history_path: CSV with a header, ',' or ';' separated. First column is the time: unix
+         seconds/milliseconds or 'YYYY-mm-dd HH:MM:SS'. Price is the 'close' or 'price' column, the second otherwise.
+        :param path: Output binary file
+        """
+        log.info('Build price index for: "{}"'.format(history_path))
+        with open(history_path, newline='', encoding="utf-8") as csvfile:
+            sample = csvfile.readline()
+            csvfile.seek(0)
+            reader = csv.reader(csvfile, delimiter=';' if sample.count(';') > sample.count(',') else ',')
+            headers = [header.strip().lower() for header in next(reader)]
+            price_idx = headers.index('close') if 'close' in headers else \
+                headers.index('price') if 'price' in headers else 1
+
+            records = {}
+            for row in reader:
+                if not row or not row[0].strip():
+                    continue
+                records[PriceIndex.parse_time(row[0].strip())] = Rate.parse(row[price_idx]).units
+
+        stat = os.stat(history_path)
+        with open(path + '.tmp', 'wb') as index_file:
+            index_file.write(PriceIndex.HEADER.pack(PriceIndex.MAGIC, stat.st_mtime_ns, stat.st_size))
+            for timestamp in sorted(records):
+                index_file.write(PriceIndex.RECORD.pack(timestamp, records[timestamp]))
+        os.replace(path + '.tmp', path)
+        log.debug('Price index with "{}" records saved as: "{}"'.format(len(records), path))
+
+    @staticmethod
+    def parse_time(text):
+        """
+        :return: Unix timestamp in seconds
+        """
+        if text.isdigit():
+            timestamp = int(text)
+            # Milliseconds
+            return timestamp // 1000 if timestamp > 10 ** 11 else timestamp
+        return PriceIndex.get_timestamp(text[:19], '%Y-%m-%d %H:%M:%S')
+
+    @staticmethod
+    def get_timezone():
+        """
+        :return: Timezone of the exchange (see ApiHistory.TIMEZONE), None (local time) without zoneinfo
+        """
+        return ZoneInfo(ApiHistory.TIMEZONE) if ZoneInfo is not None else None
+
+    @staticmethod
+    def get_timestamp(text, date_format):
+        """
+        :param text: Date in the time of the exchange
+        :return: Unix timestamp in seconds
+        """
+        return int(datetime.strptime(text, date_format).replace(tzinfo=PriceIndex.get_timezone()).timestamp())
+
+    def find_price_at(self, timestamp):
+        """
+        :param timestamp: Unix timestamp in seconds
+        :return: Rate, the last price at or before the timestamp
+        """
+        values = self.values
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if values[2 * middle] <= timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        if low == 0:
+            raise ValueError('No price before: "{}"'.format(datetime.fromtimestamp(timestamp, PriceIndex.get_timezone())))
+        return Rate(values[2 * (low - 1) + 1])
+
+    def get_rate(self, date_str):
+        """
+        :param date_str: Date of the transaction in the bitbay format 'dd-mm-YYYY HH:MM:SS'
+        :return: Rate, PLN price at the time of the transaction
+        """
+        return self.get_price_at(PriceIndex.get_timestamp(date_str, '%d-%m-%Y %H:%M:%S'))
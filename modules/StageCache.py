@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+import hashlib
+import os
+import pickle
+import sys
+import time
+
+try:
+    # Unix only, no locking elsewhere
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+
+class CacheLock:
+    """
+    File lock of the whole cache directory: shared for reading, exclusive for writing and eviction
+    """
+
+    def __init__(self, directory, exclusive):
+        self.path = os.path.join(directory, '.lock')
+        self.exclusive = exclusive
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+class StageCache:
+    """
+    Outputs of the pipeline stages in a local directory, addressed by a hash of everything they depend on:
+     the stage, the source code of its modules and the key of its input (the previous stage key, so the
+     inputs of the chain are hashed only once).
+    A chain of stages starts from the last one with a cached output, the stages before it are skipped entirely.
+    Entries are pickle files, the least recently used ones are evicted above the size limit (mtime is the
+     last use). Concurrent runs share the directory under a file lock.
+    """
+
+    # Path of a module file -> hash of its content
+    code_versions = {}
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def get_code_version(modules):
+        """
+        :param modules: Modules the stage runs, or classes (their modules are taken)
+        :return: Hash of their source files
+        """
+        hash_object = hashlib.sha1()
+        for module in modules:
+            path = getattr(module, '__file__', None) or sys.modules[module.__module__].__file__
+            if path not in StageCache.code_versions:
+                with open(path, 'rb') as source_file:
+                    StageCache.code_versions[path] = hashlib.sha1(source_file.read()).hexdigest()
+            hash_object.update(StageCache.code_versions[path].encode('ascii'))
+        return hash_object.hexdigest()
+
+    @staticmethod
+    def get_key(stage, modules, *inputs):
+        """
+        :param inputs: Texts (keys of inputs, settings...) the output depends on
+        :return: Key of the stage output
+        """
+        hash_object = hashlib.sha1('\x1f'.join([stage, StageCache.get_code_version(modules)] + list(inputs))
+                                   .encode('utf-8'))
+        return hash_object.hexdigest()
+
+    @staticmethod
+    def get_files_key(paths):
+        """
+        :return: Text key of the content of files (name, size and modification time)
+        """
+        signature = []
+        for path in paths:
+            stat = os.stat(path)
+            signature.append('{}:{}:{}'.format(os.path.abspath(path), stat.st_size, stat.st_mtime_ns))
+        return '|'.join(signature)
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    def get(self, key):
+        """
+        :return: Tuple (True, cached output) or (False, None)
+        """
+        path = self.get_path(key)
+        with CacheLock(self.directory, exclusive=False):
+            if not os.path.exists(path):
+                return False, None
+            with open(path, 'rb') as entry_file:
+                value = pickle.load(entry_file)
+            # Recently used
+            os.utime(path)
+        return True, value
+
+    def put(self, key, value):
+        path = self.get_path(key)
+        with CacheLock(self.directory, exclusive=True):
+            with open(path + '.tmp', 'wb') as entry_file:
+                pickle.dump(value, entry_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path + '.tmp', path)
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries above the size limit, call under the exclusive lock
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pickle'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+            log.debug('Evicted from the cache: "{}"'.format(name))
+
+    def run(self, key, function):
+        """
+        :return: Cached output of the key, function() (then cached) otherwise
+        """
+        found, value = self.get(key)
+        if found:
+            return value
+        value = function()
+        self.put(key, value)
+        return value
+
+    def run_chain(self, stages, input_key, value):
+        """
+        :param stages: List of (name, modules, function: input -> output)
+        :param input_key: Key of the chain input
+        :param value: The chain input, used only when no stage output is cached
+        :return: Output of the last stage
+        """
+        keys = []
+        for name, modules, function in stages:
+            input_key = StageCache.get_key(name, modules, input_key)
+            keys.append(input_key)
+
+        start = 0
+        for i in reversed(range(0, len(stages))):
+            found, cached = self.get(keys[i])
+            if found:
+                log.info('Stage "{}" loaded from the cache, "{}" stages skipped'.format(stages[i][0], i + 1))
+                start, value = i + 1, cached
+                break
+
+        for i in range(start, len(stages)):
+            name, modules, function = stages[i]
+            log.info('Stage "{}"'.format(name))
+            stage_start = time.perf_counter()
+            value = function(value)
+            log.debug('Stage "{}" took "{:.3f}" s'.format(name, time.perf_counter() - stage_start))
+            self.put(keys[i], value)
+
+        return value
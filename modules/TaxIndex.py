@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+import json
+
+from modules.Taxer import Taxer
+from modules.Money import Money
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+
+class TaxIndex:
+    """
+    Cumulative (prefix) sums of the tax columns per market, keyed by the operation timestamp.
+    Any date range or per market summary is then two binary searches and a subtraction,
+     instead of re-summing the whole _tax.csv.
+    Rows with the same timestamp share a single entry, no query can tell them apart.
+    """
+
+    # Columns of the calculator output we keep the sums for
+    COLUMNS = ['Przychód', 'Koszt', 'Dochód', 'PCC', 'Prowizja']
+
+    # Pseudo market containing all the rows
+    ALL_MARKETS = '*'
+
+    def __init__(self, markets=None):
+        # market -> {'keys': [timestamp, ...], 'sums': {column: [0, ..., total in grosze]}}
+        self.markets = markets if markets is not None else {}
+
+    @staticmethod
+    def build(data):
+        """
+        :param data: List of lists, full output of the calculator (headers first)
+        :return: TaxIndex with prefix sums per market
+        """
+        col_idx = Taxer.get_col_indexes(data)
+        entries = [(TaxIndex.date_to_key(row[col_idx['Data operacji']]), row) for row in data[1:]]
+        # In the order of time, every row is then added at the end
+        entries.sort(key=lambda entry: entry[0])
+
+        index = TaxIndex()
+        for key, row in entries:
+            index.add(row[col_idx['Rynek']], key, TaxIndex.get_values(row, col_idx))
+
+        for market, entry in index.markets.items():
+            log.debug('Indexed "{}" timestamps of market "{}"'.format(len(entry['keys']), market))
+        return index
+
+    @staticmethod
+    def get_values(row, col_idx):
+        """
+        :return: Values of the row in grosze, per COLUMNS
+        """
+        values = []
+        for column in TaxIndex.COLUMNS:
+            value = row[col_idx[column]] if column in col_idx else ''
+            values.append(Money.parse(value).units if value else 0)
+        return values
+
+    def add(self, market, key, values):
+        """
+        Adds a row to the sums of its market and of all the markets. O(1) for rows in the order of time,
+         an older row shifts the sums after it.
+        :param key: Timestamp of the row, see date_to_key()
+        :param values: Grosze per COLUMNS, see get_values()
+        """
+        for name in (market, TaxIndex.ALL_MARKETS):
+            entry = self.markets.setdefault(name, {'keys': [], 'sums': {column: [0] for column in TaxIndex.COLUMNS}})
+            keys = entry['keys']
+            position = bisect_right(keys, key)
+            if not position or keys[position - 1] != key:
+                keys.insert(position, key)
+                for prefix in entry['sums'].values():
+                    prefix.insert(position + 1, prefix[position])
+                position += 1
+
+            # Sums from the entry of the key on
+            for column, value in zip(TaxIndex.COLUMNS, values):
+                if value:
+                    prefix = entry['sums'][column]
+                    for i in range(position, len(prefix)):
+                        prefix[i] += value
+
+    def query(self, market=None, date_from=None, date_to=None):
+        """
+        :param market: e.g. 'BTC - PLN', all markets if None
+        :param date_from: Inclusive, 'YYYY-MM-DD[ HH:MM:SS]' or datetime, open if None
+        :param date_to: Exclusive, 'YYYY-MM-DD[ HH:MM:SS]' or datetime, open if None
+        :return: Dictionary mapping column names to Money totals
+        """
+        entry = self.markets.get(market or TaxIndex.ALL_MARKETS)
+        if entry is None:
+            return {column: Money(0) for column in TaxIndex.COLUMNS}
+
+        keys = entry['keys']
+        lo = 0 if date_from is None else bisect_left(keys, TaxIndex.to_key(date_from))
+        hi = len(keys) if date_to is None else bisect_left(keys, TaxIndex.to_key(date_to))
+        hi = max(lo, hi)
+
+        sums = entry['sums']
+        return {column: Money(sums[column][hi] - sums[column][lo]) for column in TaxIndex.COLUMNS}
+
+    def query_year(self, year, market=None):
+        """
+        Totals for a single tax year (PIT-38)
+        """
+        return self.query(market, '{:04d}-01-01'.format(year), '{:04d}-01-01'.format(year + 1))
+
+    def get_markets(self):
+        return sorted(m for m in self.markets if m != TaxIndex.ALL_MARKETS)
+
+    def get_years(self):
+        keys = self.markets.get(TaxIndex.ALL_MARKETS, {'keys': []})['keys']
+        return sorted({int(key[:4]) for key in keys})
+
+    def save(self, path):
+        with open(path, 'w', encoding="utf-8") as index_file:
+            json.dump(self.markets, index_file, ensure_ascii=False)
+
+    @staticmethod
+    def load(path):
+        with open(path, encoding="utf-8") as index_file:
+            return TaxIndex(json.load(index_file))
+
+    @staticmethod
+    def get_path_for(tax_csv_path):
+        """
+        The index lives next to the _tax.csv file
+        """
+        return tax_csv_path[:-4] + '_index.json'
+
+    @staticmethod
+    def date_to_key(date_str):
+        """
+        :param date_str: Bitbay format e.g. '05-01-2019 22:25:34'
+        :return: Sortable key e.g. '2019-01-05 22:25:34'
+        """
+        return datetime.strptime(date_str, '%d-%m-%Y %H:%M:%S').strftime('%Y-%m-%d %H:%M:%S')
+
+    @staticmethod
+    def to_key(value):
+        if isinstance(value, datetime):
+            return value.strftime('%Y-%m-%d %H:%M:%S')
+        # A plain date sorts before all the timestamps of that day
+        return value
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+# https://docs.python.org/3/library/csv.html
+import csv
+import os
+import threading
+from datetime import datetime
+
+from modules.Feeer import Feeer
+from modules.Taxer import Taxer
+from modules.LotLedger import LotLedger
+from modules.TaxIndex import TaxIndex
+from modules.Money import Money, Amount, Rate
+from modules.ExchangeRates import ExchangeRates
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+
+class ServiceMetrics:
+    """
+    Request latency histograms and cache counters in the Prometheus text format.
+    https://prometheus.io/docs/instrumenting/exposition_formats/
+    """
+
+    BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # endpoint -> [bucket counts..., count, sum]
+        self.latencies = {}
+        self.cache = {'hit': 0, 'miss': 0}
+
+    def observe(self, endpoint, seconds):
+        with self.lock:
+            entry = self.latencies.setdefault(endpoint, [0] * len(self.BUCKETS) + [0, 0.0])
+            for i in range(0, len(self.BUCKETS)):
+                if seconds <= self.BUCKETS[i]:
+                    entry[i] += 1
+            entry[-2] += 1
+            entry[-1] += seconds
+
+    def count_cache(self, hit):
+        with self.lock:
+            self.cache['hit' if hit else 'miss'] += 1
+
+    def render(self):
+        lines = ['# HELP bitbay_taxer_request_latency_seconds Time spent handling requests.',
+                 '# TYPE bitbay_taxer_request_latency_seconds histogram']
+        with self.lock:
+            for endpoint, entry in sorted(self.latencies.items()):
+                for i in range(0, len(self.BUCKETS)):
+                    lines.append('bitbay_taxer_request_latency_seconds_bucket{{endpoint="{}",le="{}"}} {}'
+                                 .format(endpoint, self.BUCKETS[i], entry[i]))
+                lines.append('bitbay_taxer_request_latency_seconds_bucket{{endpoint="{}",le="+Inf"}} {}'
+                             .format(endpoint, entry[-2]))
+                lines.append('bitbay_taxer_request_latency_seconds_count{{endpoint="{}"}} {}'
+                             .format(endpoint, entry[-2]))
+                lines.append('bitbay_taxer_request_latency_seconds_sum{{endpoint="{}"}} {}'
+                             .format(endpoint, entry[-1]))
+
+            lines.append('# HELP bitbay_taxer_cache_requests_total '
+                         'Account state served warm (hit) or rebuilt (miss).')
+            lines.append('# TYPE bitbay_taxer_cache_requests_total counter')
+            for result in ('hit', 'miss'):
+                lines.append('bitbay_taxer_cache_requests_total{{result="{}"}} {}'
+                             .format(result, self.cache[result]))
+
+        return '\n'.join(lines) + '\n'
+
+
+class AccountState:
+    """
+    Everything kept warm for a single account
+    """
+
+    def __init__(self, transactions_path, fees_path):
+        self.transactions_path = transactions_path
+        self.fees_path = fees_path
+        self.signature = None
+
+        # Input data (headers first), oldest first, including appended deltas
+        self.transactions_data = None
+        self.fees_data = None
+
+        # Calculator output (headers first) and the open lots after it
+        self.rows = None
+        self.ledger = None
+
+        # (year, market) -> [grosze per TaxIndex.COLUMNS]
+        self.totals = {}
+
+
+class TaxService:
+    """
+    Keeps parsed histories, lot ledgers and totals warm in memory per account.
+    Appended transactions are processed as deltas against the warm lot ledger.
+    """
+
+    def __init__(self, rates=None):
+        """
+        :param rates: ExchangeRates for markets not quoted in PLN
+        """
+        self.lock = threading.Lock()
+        self.accounts = {}
+        self.metrics = ServiceMetrics()
+        self.rates = rates
+
+    def add_account(self, name, transactions_path, fees_path):
+        self.accounts[name] = AccountState(transactions_path, fees_path)
+
+    def get_account(self, name):
+        """
+        :return: Warm AccountState, (re)built if the files changed since last time
+        """
+        account = self.accounts[name]
+        signature = TaxService.get_files_signature(account)
+        hit = account.rows is not None and account.signature == signature
+        self.metrics.count_cache(hit)
+        if not hit:
+            log.info('Load account "{}"'.format(name))
+            account.transactions_data = TaxService.chronological(TaxService.read_csv(account.transactions_path))
+            account.fees_data = TaxService.chronological(TaxService.read_csv(account.fees_path))
+            account.signature = signature
+            TaxService.recalculate(account, self.rates)
+
+        return account
+
+    def reload(self, name):
+        """
+        Forget the warm state (and appended deltas), the files are read again on the next request
+        """
+        with self.lock:
+            self.accounts[name].rows = None
+
+    def get_totals(self, name, year=None, market=None):
+        with self.lock:
+            account = self.get_account(name)
+
+            totals = [0] * len(TaxIndex.COLUMNS)
+            for (row_year, row_market), sums in account.totals.items():
+                if year is not None and row_year != year:
+                    continue
+                if market is not None and row_market != market:
+                    continue
+                totals = [a + b for a, b in zip(totals, sums)]
+
+        return {column: str(Money(units)) for column, units in zip(TaxIndex.COLUMNS, totals)}
+
+    def quote(self, name, market, amount, rate, date=None):
+        """
+        What-if SELL against the open lots, nothing is changed
+        :param amount: Text, e.g. '0.5'
+        :param rate: Text, e.g. '20000'
+        :param date: Date of the SELL (dd-mm-YYYY HH:MM:SS) for the exchange rate of a market not quoted in PLN,
+         now by default
+        :return: Dictionary with 'matched' amount (less than amount when there are not enough lots),
+         'income', 'cost' and 'gain' in PLN
+        """
+        date = date or datetime.now().strftime('%d-%m-%Y %H:%M:%S')
+        with self.lock:
+            ledger = self.get_account(name).ledger
+            income, cost, matched = ledger.quote_sell(market, Amount.parse(amount), Rate.parse(rate), date)
+
+        gains = Taxer.get_gains_results(income, cost, ledger.scale)
+        return {'market': market, 'amount': amount, 'rate': rate, 'matched': str(Amount(matched)),
+                'income': gains['income'], 'cost': gains['cost'], 'gain': gains['gain']}
+
+    def get_rows(self, name):
+        with self.lock:
+            return [list(row) for row in self.get_account(name).rows]
+
+    def append(self, name, transactions_rows, fees_rows):
+        """
+        :param transactions_rows: New rows (no headers), same columns as the transactions CSV
+        :param fees_rows: Corresponding new rows (no headers), same columns as the fees CSV
+        :return: Number of rows appended. They are kept until the files change, then the files are read again
+         (without them)
+        """
+        with self.lock:
+            account = self.get_account(name)
+
+            delta_transactions = TaxService.chronological([account.transactions_data[0]] + transactions_rows)
+            delta_fees = TaxService.chronological([account.fees_data[0]] + fees_rows)
+            assert len(delta_transactions) == len(delta_fees)
+            if len(delta_transactions) == 1:
+                return 0
+
+            combined = Feeer.include_fees([list(row) for row in delta_transactions],
+                                          [list(row) for row in delta_fees], self.rates)
+            account.transactions_data.extend(delta_transactions[1:])
+            account.fees_data.extend(delta_fees[1:])
+
+            col_idx = Taxer.get_col_indexes(combined)
+            market_idx = col_idx['Rynek']
+            for row in combined[1:]:
+                if row[col_idx['Rodzaj']] == 'Kupno' and \
+                        account.ledger.shortfall.get(ExchangeRates.get_base_currency(row[market_idx])):
+                    # An earlier SELL of the crypto currency (any market) would take from this BUY in a full calculation
+                    log.info('New BUY of a crypto currency with unmatched SELLs, full recalculation')
+                    self.metrics.count_cache(False)
+                    TaxService.recalculate(account, self.rates)
+                    return len(combined) - 1
+
+            # Same as the full calculation: all the BUYs are queued first, SELLs take from the front
+            for row in combined[1:]:
+                if row[col_idx['Rodzaj']] == 'Kupno':
+                    account.ledger.add_buy(row[market_idx], Amount.parse(row[col_idx['Ilość']]),
+                                           Rate.parse(row[col_idx['Kurs']]), row[col_idx['Data operacji']])
+                    row.extend(['', '', ''])
+            for row in combined[1:]:
+                if row[col_idx['Rodzaj']] == 'Sprzedaż':
+                    income_cost = account.ledger.sell(row[market_idx], Amount.parse(row[col_idx['Ilość']]),
+                                                      Rate.parse(row[col_idx['Kurs']]), row[col_idx['Data operacji']])
+                    gains = Taxer.get_gains_results(*income_cost, account.ledger.scale)
+                    row.extend([gains['income'], gains['cost'], gains['gain']])
+
+            combined[0] = list(account.rows[0][:-1])
+            combined = Taxer.calculate_pcc(combined, self.rates)
+            account.rows.extend(combined[1:])
+            TaxService.add_to_totals(account, combined)
+
+            return len(combined) - 1
+
+    @staticmethod
+    def recalculate(account, rates=None):
+        transactions_data = Feeer.include_fees([list(row) for row in account.transactions_data],
+                                               [list(row) for row in account.fees_data], rates)
+        transactions_data = Taxer.calculate_gain_fifo(transactions_data, rates)
+        account.rows = Taxer.calculate_pcc(transactions_data, rates)
+        account.ledger = LotLedger.from_data(account.rows, rates)
+        account.totals = {}
+        TaxService.add_to_totals(account, account.rows)
+
+    @staticmethod
+    def add_to_totals(account, rows):
+        col_idx = Taxer.get_col_indexes(rows)
+        for row in rows[1:]:
+            year = int(row[col_idx['Data operacji']][6:10])
+            sums = account.totals.setdefault((year, row[col_idx['Rynek']]), [0] * len(TaxIndex.COLUMNS))
+            for i in range(0, len(TaxIndex.COLUMNS)):
+                value = row[col_idx[TaxIndex.COLUMNS[i]]]
+                if value:
+                    sums[i] += Money.parse(value).units
+
+    @staticmethod
+    def chronological(data):
+        """
+        :param data: List of lists, headers first
+        :return: The same data, oldest rows first
+        """
+        col_idx = Taxer.get_col_indexes(data)
+        if len(data) > 2:
+            date_format = '%d-%m-%Y %H:%M:%S'
+            first_date = datetime.strptime(data[1][col_idx['Data operacji']], date_format)
+            last_date = datetime.strptime(data[-1][col_idx['Data operacji']], date_format)
+            if first_date > last_date:
+                data = [data[0]] + data[:0:-1]
+        return data
+
+    @staticmethod
+    def read_csv(path):
+        data = []
+        with open(path, newline='', encoding="utf-8") as csvfile:
+            cr = csv.reader(csvfile, delimiter=';')
+            for row in cr:
+                data.append(row)
+        return data
+
+    @staticmethod
+    def get_files_signature(account):
+        signature = []
+        for path in (account.transactions_path, account.fees_path):
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        return signature
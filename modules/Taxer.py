@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 # mk (c) 2018
 
-from decimal import Decimal
-from copy import deepcopy
 from datetime import datetime
 
+from modules.Money import Money, Amount, Rate, PRODUCT_SCALE
+from modules.ExchangeRates import ExchangeRates
+from modules.LotPool import LotPool
+from modules.Checkpoint import Checkpoint
+
 import logging
 log = logging.getLogger('bitbay_tax_calculator')
 
@@ -15,10 +18,15 @@ class Taxer:
     """
 
     @staticmethod
-    def calculate_gain_fifo(data):
+    def calculate_gain_fifo(data, rates=None, checkpoint=None, workers=0, parallel_min_rows=100000):
         """
         :param self:
         :param data: List of lists containing all the data from the input CSV
+        :param rates: ExchangeRates for markets not quoted in PLN
+        :param checkpoint: Checkpoint, periodically saved progress. Rows done by a previous run are reused
+         as long as they and all the buys are the same
+        :param workers: Number of processes for the parallel FIFO (see ParallelFifo), 0 for serial only
+        :param parallel_min_rows: Crypto currencies with at least that many rows go parallel, the rest stays serial
         :return: Data with additional rows: 'income', 'cost' and 'gain' - required
          by polish tax statement
         """
@@ -40,20 +48,48 @@ class Taxer:
         # Headers back
         data.insert(0, headers)
 
-        # Calculations change data in progress, so we need a deep copy here
-        data_deepcopy = deepcopy(data)
-
-        for row in data:
-            kind = row[col_idx['Rodzaj']]
-            if kind == 'Rodzaj':  # Headers
-                row.append('Przychód')
-                row.append('Koszt')
-                row.append('Dochód')
-                continue
-
-            if kind == 'Sprzedaż':
+        if rates is None:
+            foreign_markets = set(row[col_idx['Rynek']] for row in data[1:]
+                                  if ExchangeRates.get_quote_currency(row[col_idx['Rynek']]) != 'PLN')
+            if foreign_markets:
+                log.warning('No exchange rates given, values of {} are NOT converted to PLN'
+                            .format(sorted(foreign_markets)))
+
+        # Row position -> gains of the SELLs of very large crypto currencies, calculated in parallel
+        parallel_gains = {}
+        if workers:
+            parallel_gains = Taxer.get_parallel_gains(data, rates, workers, parallel_min_rows)
+        parallel_cryptos = set(ExchangeRates.get_base_currency(data[i][col_idx['Rynek']]) for i in parallel_gains)
+
+        # Calculations change amounts in progress, so we need a copy here (with amounts and rates already parsed)
+        # Crypto currencies don't affect each other, so the parallel ones are left out of the lot pool
+        data_copy = Taxer.get_typed_copy([headers] + [
+            row for row in data[1:] if ExchangeRates.get_base_currency(row[col_idx['Rynek']]) not in parallel_cryptos])
+
+        headers.append('Przychód')
+        headers.append('Koszt')
+        headers.append('Dochód')
+
+        # BUYs of all the markets of a crypto currency in one queue
+        pool = LotPool.from_rows(data_copy, col_idx, rates)
+
+        rows_done = 0
+        prefix_hash = None
+        if checkpoint is not None:
+            buys_hash = Taxer.get_buys_hash(data)
+            # Amounts left after a resume
+            rows_done, prefix_hash = Taxer.resume_gain_fifo(data, pool, buys_hash, checkpoint)
+        # Results of the resumed rows are in the journal of this run already
+        rows_saved = rows_done
+
+        for i in range(rows_done + 1, len(data)):
+            row = data[i]
+            if prefix_hash is not None:
+                Checkpoint.hash_rows([row], prefix_hash)
+
+            if row[col_idx['Rodzaj']] == 'Sprzedaż':
                 # Tax is requirement activates at the moment of 'sell'
-                gains = Taxer.get_gains_for_row(row, data_deepcopy)
+                gains = parallel_gains[i] if i in parallel_gains else Taxer.get_gains_for_pool(row, pool)
                 row.append(gains['income'])
                 row.append(gains['cost'])
                 row.append(gains['gain'])
@@ -63,70 +99,170 @@ class Taxer:
                 row.append('')
                 row.append('')
 
+            if checkpoint is not None and (checkpoint.is_due() or i == len(data) - 1):
+                Taxer.save_gain_fifo(data, pool, rows_saved, i, buys_hash, prefix_hash, checkpoint)
+                rows_saved = i
+
         return data
 
     @staticmethod
-    def get_gains_for_row(sell_row, data_deepcopy):
-        col_idx = Taxer.get_col_indexes(data_deepcopy)
+    def get_parallel_gains(data, rates, workers, min_rows):
+        """
+        :return: Dictionary row position -> gains, for the SELLs of crypto currencies with at least min_rows rows
+         (of all their markets)
+        """
+        # Only needed here (multiprocessing)
+        from modules.ParallelFifo import ParallelFifo
 
-        log.debug("==> Working with SELL row: {}".format(sell_row))
-        sell_crypto = sell_row[col_idx['Rynek']]
-        sell_amount = Decimal(sell_row[col_idx['Ilość']])
-        sell_rate = Decimal(sell_row[col_idx['Kurs']])
-
-        # Find the first relevant buy transaction(s) that are enough for the sell amount
-        income = Decimal(0)
-        cost = Decimal(0)
-        for buy_row in data_deepcopy:
-            # Buy rows only, valid crypto currency
-            if buy_row[col_idx['Rynek']] != sell_crypto:
-                continue
-            if buy_row[col_idx['Rodzaj']] == 'Sprzedaż':
-                continue
+        col_idx = Taxer.get_col_indexes(data)
+        positions_by_crypto = {}
+        for i in range(1, len(data)):
+            positions_by_crypto.setdefault(ExchangeRates.get_base_currency(data[i][col_idx['Rynek']]), []).append(i)
 
-            buy_amount = Decimal(buy_row[col_idx['Ilość']])
-            buy_rate = Decimal(buy_row[col_idx['Kurs']])
-            if buy_amount == 0:  # Already used BUYs
+        parallel_gains = {}
+        for crypto, positions in positions_by_crypto.items():
+            if len(positions) < min_rows:
                 continue
-            log.debug("Working with BUY row: {}".format(buy_row))
-
-            remainder = sell_amount - buy_amount
-            if remainder > 0:
-                log.debug("Larger sell ({}) than buy ({}) amount (in this row)".format(sell_amount, buy_amount))
-                income += buy_amount * sell_rate
-                cost += buy_amount * buy_rate
-                buy_row[col_idx['Ilość']] = str(Decimal(buy_row[col_idx['Ilość']]) - buy_amount)
-                sell_amount -= buy_amount
-            elif remainder < 0:
-                log.debug("Larger buy ({}) than sell ({}) amount (in this row)".format(buy_amount, sell_amount))
-                income += sell_amount * sell_rate
-                cost += sell_amount * buy_rate
-                buy_row[col_idx['Ilość']] = str(Decimal(buy_row[col_idx['Ilość']]) - sell_amount)
-                break
-            elif remainder == 0:
-                log.debug("Exact match on buy and sell amount")
-                income += sell_amount * sell_rate
-                cost += buy_amount * buy_rate
-                break
+            log.debug('Parallel FIFO for "{}" ("{}" rows)'.format(crypto, len(positions)))
+            gains = ParallelFifo.calculate_market([data[i] for i in positions], col_idx, rates, workers)
+            sell_positions = [i for i in positions if data[i][col_idx['Rodzaj']] == 'Sprzedaż']
+            parallel_gains.update(zip(sell_positions, gains))
 
-        gain = income - cost
-        results = {
-            'income': str(income.quantize(Decimal(10) ** -2)),
-            'cost': str(cost.quantize(Decimal(10) ** -2)),
-            'gain': str(gain.quantize(Decimal(10) ** -2)),
-        }
+        return parallel_gains
+
+    @staticmethod
+    def get_buys_hash(data):
+        """
+        :return: Hash of all the rows except sells, any of them can be used by FIFO for any sell
+        """
+        kind_idx = Taxer.get_col_indexes(data)['Rodzaj']
+        return Checkpoint.hash_rows(row for row in data[1:] if row[kind_idx] != 'Sprzedaż').hexdigest()
+
+    @staticmethod
+    def save_gain_fifo(data, pool, rows_saved, rows_done, buys_hash, prefix_hash, checkpoint):
+        """
+        Rows up to rows_done are finished, the state is consistent only between rows. Only the results of the
+         rows after rows_saved (the last save) are appended to the journal.
+        """
+        checkpoint.append('fifo', [row[-3:] for row in data[rows_saved + 1:rows_done + 1]])
+        checkpoint.update('fifo', {
+            'buys_hash': buys_hash,
+            'rows_done': rows_done,
+            'prefix_hash': prefix_hash.hexdigest(),
+            # Lots are used up from the front: per crypto currency the number of lots left and the amount left
+            #  of the first one
+            'lots': {crypto: [len(lots), lots[0][1] if lots else 0] for crypto, lots in pool.lots.items()},
+        })
+        checkpoint.save()
+
+    @staticmethod
+    def resume_gain_fifo(data, pool, buys_hash, checkpoint):
+        """
+        :param pool: LotPool of all the BUYs, the lots used by the rows done are taken from it
+        :return: Tuple (number of rows done, hash object of their content)
+        """
+        saved = checkpoint.get('fifo')
+        if saved and saved['rows_done'] < len(data) and saved['buys_hash'] == buys_hash:
+            rows_done = saved['rows_done']
+            prefix_hash = Checkpoint.hash_rows(data[1:rows_done + 1])
+            results = checkpoint.get_journal('fifo')
+            if prefix_hash.hexdigest() == saved['prefix_hash'] and len(results) == rows_done:
+                log.info('FIFO resumed after "{}" rows'.format(rows_done))
+                for row, row_results in zip(data[1:rows_done + 1], results):
+                    row.extend(row_results)
+                # The journal of this run starts over
+                checkpoint.append('fifo', results)
+                Taxer.restore_lots(pool, saved['lots'])
+                return rows_done, prefix_hash
+
+        return 0, Checkpoint.hash_rows([])
+
+    @staticmethod
+    def restore_lots(pool, saved_lots):
+        """
+        :param saved_lots: Dictionary crypto currency -> [number of lots left, amount units left of the first one]
+        """
+        amount_idx = pool.col_idx['Ilość']
+        for crypto, lots in pool.lots.items():
+            left, amount = saved_lots[crypto]
+            while len(lots) > left:
+                lots.popleft()[0][amount_idx] = Amount(0)
+            if lots:
+                lots[0][1] = amount
+                lots[0][0][amount_idx] = Amount(amount)
+
+    @staticmethod
+    def get_typed_copy(data):
+        """
+        :param data: List of lists containing all the data from the input CSV
+        :return: A copy of data with 'Ilość' as Amount and 'Kurs' as Rate, so it's parsed only once
+        """
+        col_idx = Taxer.get_col_indexes(data)
+        amount_idx = col_idx['Ilość']
+        rate_idx = col_idx['Kurs']
+
+        data_copy = [list(data[0])]
+        for row in data[1:]:
+            row_copy = list(row)
+            row_copy[amount_idx] = Amount.parse(row[amount_idx])
+            row_copy[rate_idx] = Rate.parse(row[rate_idx])
+            data_copy.append(row_copy)
+
+        return data_copy
+
+    @staticmethod
+    def get_gains_for_row(sell_row, data_copy, rates=None):
+        """
+        :param sell_row: 'Sprzedaż' row
+        :param data_copy: All the rows, amounts of used BUYs get reduced here. Cells are either text or
+         already parsed, see get_typed_copy()
+        :param rates: ExchangeRates, markets not quoted in PLN are converted at the rate from the business
+         day before the transaction (the sell for income, the buys for cost)
+        :return: Dictionary with 'income', 'cost' and 'gain' in PLN
+        """
+        # BUYs of the same crypto currency on any market, see LotPool
+        return Taxer.get_gains_for_pool(sell_row, LotPool.from_rows(data_copy, Taxer.get_col_indexes(data_copy),
+                                                                    rates))
+
+    @staticmethod
+    def get_gains_for_pool(sell_row, pool):
+        """
+        :param sell_row: 'Sprzedaż' row
+        :param pool: LotPool, the used lots are taken from it
+        :return: Dictionary with 'income', 'cost' and 'gain' in PLN
+        """
+        log.debug("==> Working with SELL row: {}".format(sell_row))
+        # Sums of Amount x Rate products, rounded to grosze only once at the end
+        income, cost = pool.sell(sell_row)
+        results = Taxer.get_gains_results(income, cost, pool.scale)
 
         log.debug("Row final results: {}".format(results))
         return results
 
     @staticmethod
-    def calculate_pcc(data):
+    def get_gains_results(income, cost, scale=PRODUCT_SCALE):
+        """
+        :param income: Sum of Amount x Rate products (PRODUCT_SCALE)
+        :param cost: Sum of Amount x Rate products (PRODUCT_SCALE)
+        :param scale: Scale of income and cost, more precise when converted to PLN with exchange rates
+        :return: Dictionary with 'income', 'cost' and 'gain' in PLN, rounded to grosze only here
+        """
+        gain = income - cost
+        return {
+            'income': str(Money.from_units(income, scale)),
+            'cost': str(Money.from_units(cost, scale)),
+            'gain': str(Money.from_units(gain, scale)),
+        }
+
+    @staticmethod
+    def calculate_pcc(data, rates=None):
         """
         PCC tax is just 1% of the BUY value, however it is rounded like that:
         values less than 0.5 PLN are becoming 0
         values equal and over 0.5 PLN are becoming +1
         :param self:
         :param data:
+        :param rates: ExchangeRates for values of markets not quoted in PLN ('Prowizja' is in PLN already)
         :return:
         """
         col_idx = Taxer.get_col_indexes(data)
@@ -137,17 +273,19 @@ class Taxer:
                 row.append('PCC')
                 continue
 
-            value = Decimal(row[col_idx['Wartość']])
-
             if kind == 'Kupno':
                 # PCC tax from provision...
-                value += Decimal(row[col_idx['Prowizja']])
-
-                pcc = Decimal(value) * Decimal(0.01)
+                value = Money.parse(row[col_idx['Wartość']])
+                currency = ExchangeRates.get_quote_currency(row[col_idx['Rynek']])
+                if rates is not None and currency != 'PLN':
+                    fx = rates.get_rate(currency, row[col_idx['Data operacji']])
+                    value = Money.from_units(value.units * fx.units, Money.SCALE + Rate.SCALE)
+                value += Money.parse(row[col_idx['Prowizja']])
+
+                # 1% of the value in grosze, so the rest below 1 PLN is in 10^-4 PLN
+                zlote, grosze = divmod(value.units, 100 * 100)
                 # Rounding
-                zlote = int(pcc)
-                grosze = pcc % 1
-                if grosze >= 0.50:
+                if grosze >= 50 * 100:
                     zlote += 1
 
                 row.append(str(zlote))
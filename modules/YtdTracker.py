@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+from collections import deque
+import json
+import os
+
+from modules.Taxer import Taxer
+from modules.Feeer import Feeer
+from modules.LotLedger import LotLedger
+from modules.LotPool import LotPool
+from modules.TaxIndex import TaxIndex
+from modules.HistoryConverter import HistoryConverter
+from modules.Money import Money, Amount, Rate
+
+import logging
+log = logging.getLogger('bitbay_tax_calculator')
+
+
+class YtdTracker:
+    """
+    Running PIT-38 (Przychód, Koszt, Dochód) and PCC totals per year, updated one trade at a time.
+    Instead of the full Feeer.include_fees() + Taxer.calculate_gain_fifo() + Taxer.calculate_pcc() over the
+     whole history, every appended trade (a transactions row with its fees row) only touches the open lots of
+     its crypto currency (LotLedger) and the totals of its year.
+
+    State is a JSON snapshot plus a journal of the trades added since, one JSON line each:
+     * a trade is appended (and synced) to the journal, O(1)
+     * every compact_every trades the snapshot is replaced atomically and the journal removed
+    Journal lines carry the number of the trade, so lines already in the snapshot are never applied twice.
+
+    Trades have to be appended in the order of time. A SELL takes only from BUYs added before it, unlike the
+     full calculation, which would also use later BUYs when there are not enough of them.
+    """
+
+    # 2: lots and shortfall per crypto currency, not per market
+    VERSION = 2
+
+    HEADERS = HistoryConverter.HEADERS['transactions'] + ['Prowizja']
+    TRAN_COL_IDX = Taxer.get_col_indexes([HEADERS])
+    FEES_COL_IDX = Feeer.get_col_indexes([HistoryConverter.HEADERS['fees']])
+
+    def __init__(self, path, compact_every=1000, rates=None):
+        """
+        :param path: JSON snapshot, see get_path_for(), the journal is next to it
+        :param compact_every: Trades in the journal before a new snapshot
+        :param rates: ExchangeRates for markets not quoted in PLN
+        """
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.compact_every = compact_every
+        self.rates = rates
+        self.ledger = LotLedger(rates)
+        # year -> units of TaxIndex.COLUMNS
+        self.totals = {}
+        self.trades = 0
+        self.last_date = None
+        self.journal_trades = 0
+
+    @staticmethod
+    def get_path_for(tax_csv_path):
+        return tax_csv_path[:-4] + '_ytd.json'
+
+    @staticmethod
+    def get_sort_key(date_str):
+        """
+        :param date_str: 'dd-mm-YYYY HH:MM:SS'
+        """
+        return date_str[6:10] + date_str[3:5] + date_str[0:2] + date_str[11:]
+
+    def load(self):
+        """
+        :return: True if there was any state
+        """
+        found = False
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as snapshot_file:
+                snapshot = json.load(snapshot_file)
+            if snapshot.get('version') != YtdTracker.VERSION:
+                raise ValueError('Unknown version of the YTD state: "{}"'.format(self.path))
+            self.trades = snapshot['trades']
+            self.last_date = snapshot['last_date']
+            if snapshot.get('scale', LotPool.get_scale(None)) != self.ledger.scale:
+                raise ValueError('YTD state saved {} exchange rates: "{}"'.format(
+                    'without' if self.rates is not None else 'with', self.path))
+            self.ledger.lots = {crypto: deque(lots) for crypto, lots in snapshot['lots'].items()}
+            self.ledger.shortfall = snapshot['shortfall']
+            self.totals = {int(year): units for year, units in snapshot['totals'].items()}
+            found = True
+
+        if os.path.exists(self.journal_path):
+            # Bytes of the complete lines, the next trades go right after them
+            complete = 0
+            with open(self.journal_path, 'rb') as journal_file:
+                for line in journal_file:
+                    if not line.endswith(b'\n'):
+                        log.warning('Incomplete last trade in the journal is dropped: "{}"'.format(
+                            line.decode('utf-8', 'replace')))
+                        break
+                    complete += len(line)
+                    number, tran_row, fees_row = json.loads(line.decode('utf-8'))
+                    if number > self.trades:
+                        self.apply(tran_row, fees_row)
+                        self.journal_trades += 1
+            if complete < os.path.getsize(self.journal_path):
+                with open(self.journal_path, 'r+b') as journal_file:
+                    journal_file.truncate(complete)
+                    journal_file.flush()
+                    os.fsync(journal_file.fileno())
+            found = True
+
+        log.debug('YTD state of "{}" trades loaded'.format(self.trades))
+        return found
+
+    @staticmethod
+    def from_rows(path, rows, compact_every=1000, rates=None):
+        """
+        Start from a full calculation
+        :param rows: Output of bitbay_tax_calculator.calculate() (with the same rates), headers first, older first
+        :return: YtdTracker, saved
+        """
+        tracker = YtdTracker(path, compact_every, rates)
+        tracker.ledger = LotLedger.from_data(rows, rates)
+        col_idx = Taxer.get_col_indexes(rows)
+        for row in rows[1:]:
+            tracker.add_to_totals(row, col_idx)
+        tracker.trades = len(rows) - 1
+        if len(rows) > 1:
+            tracker.last_date = max((row[col_idx['Data operacji']] for row in rows[1:]), key=YtdTracker.get_sort_key)
+        tracker.save()
+        return tracker
+
+    def add(self, tran_row, fees_row):
+        """
+        :param tran_row: Transactions row in the bitbay CSV format
+        :param fees_row: Its fees row in the bitbay CSV format
+        :return: The output row, with Prowizja, Przychód, Koszt, Dochód and PCC
+        """
+        row = self.apply(tran_row, fees_row)
+
+        with open(self.journal_path, 'a', encoding="utf-8") as journal_file:
+            journal_file.write(json.dumps([self.trades, tran_row, fees_row], ensure_ascii=False) + '\n')
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        self.journal_trades += 1
+
+        if self.journal_trades >= self.compact_every:
+            self.save()
+        return row
+
+    def apply(self, tran_row, fees_row):
+        col_idx = YtdTracker.TRAN_COL_IDX
+        date = tran_row[col_idx['Data operacji']]
+        if self.last_date is not None and YtdTracker.get_sort_key(date) < YtdTracker.get_sort_key(self.last_date):
+            raise ValueError('Trade older than the last one ("{}"): {}'.format(self.last_date, tran_row))
+
+        row = list(tran_row)
+        row.append(Feeer.get_fee_in_pln(row, fees_row, col_idx, YtdTracker.FEES_COL_IDX, self.rates))
+        market = row[col_idx['Rynek']]
+        amount = Amount.parse(row[col_idx['Ilość']])
+        rate = Rate.parse(row[col_idx['Kurs']])
+        if row[col_idx['Rodzaj']] == 'Sprzedaż':
+            gains = Taxer.get_gains_results(*self.ledger.sell(market, amount, rate, date), self.ledger.scale)
+            row.extend([gains['income'], gains['cost'], gains['gain']])
+        else:
+            self.ledger.add_buy(market, amount, rate, date)
+            row.extend(['', '', ''])
+
+        output = Taxer.calculate_pcc([YtdTracker.HEADERS + ['Przychód', 'Koszt', 'Dochód'], row], self.rates)
+        self.add_to_totals(row, Taxer.get_col_indexes(output))
+        self.trades += 1
+        self.last_date = date
+        return row
+
+    def add_to_totals(self, row, col_idx):
+        sums = self.totals.setdefault(int(row[col_idx['Data operacji']][6:10]), [0] * len(TaxIndex.COLUMNS))
+        for i in range(0, len(TaxIndex.COLUMNS)):
+            value = row[col_idx[TaxIndex.COLUMNS[i]]]
+            if value:
+                sums[i] += Money.parse(value).units
+
+    def get_totals(self, year=None):
+        """
+        :param year: Tax year, the year of the last trade by default
+        :return: Dictionary column -> Money, for TaxIndex.COLUMNS
+        """
+        if year is None:
+            year = int(self.last_date[6:10]) if self.last_date else None
+        sums = self.totals.get(year, [0] * len(TaxIndex.COLUMNS))
+        return {TaxIndex.COLUMNS[i]: Money(sums[i]) for i in range(0, len(TaxIndex.COLUMNS))}
+
+    def save(self):
+        # Never leave a half written snapshot behind, the journal goes only after the snapshot is in place
+        snapshot = {
+            'version': YtdTracker.VERSION,
+            'trades': self.trades,
+            'last_date': self.last_date,
+            # Units of the lots and shortfall, with exchange rates or not
+            'scale': self.ledger.scale,
+            'lots': {crypto: list(lots) for crypto, lots in self.ledger.lots.items()},
+            'shortfall': self.ledger.shortfall,
+            'totals': self.totals,
+        }
+        with open(self.path + '.tmp', 'w', encoding="utf-8") as snapshot_file:
+            json.dump(snapshot, snapshot_file, ensure_ascii=False)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(self.path + '.tmp', self.path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.journal_trades = 0
+        log.debug('YTD state of "{}" trades saved as: "{}"'.format(self.trades, self.path))
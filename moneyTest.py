@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for the fixed point types
+
+import unittest
+from unittest import TestCase
+
+from modules.Money import Money, Amount, Rate, PRODUCT_SCALE
+
+
+class MoneyTest(TestCase):
+
+    def test_parse_and_format(self):
+        self.assertEqual(str(Money.parse('14440.01')), '14440.01')
+        self.assertEqual(str(Money.parse('-500')), '-500.00')
+        self.assertEqual(str(Amount.parse('0.06777')), '0.06777000')
+        self.assertEqual(Amount.parse('.5').units, 50000000)
+        self.assertRaises(ValueError, Money.parse, '')
+        self.assertRaises(ValueError, Money.parse, '1,5')
+
+    def test_rounding_half_even(self):
+        self.assertEqual(str(Money.parse('0.125')), '0.12')
+        self.assertEqual(str(Money.parse('0.135')), '0.14')
+        self.assertEqual(str(Money.parse('-0.125')), '-0.12')
+        self.assertEqual(str(Money.parse('-0.126')), '-0.13')
+
+    def test_product(self):
+        value = Amount.parse('0.36920290').units * Rate.parse('14440.01').units
+        self.assertEqual(str(Money.from_units(value, PRODUCT_SCALE)), '5331.29')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for reading the official bitbay CSV export
+
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from modules.NativeExport import NativeExport
+from modules.ExportMerger import ExportMerger
+from modules.HistoryConverter import HistoryConverter
+
+
+class NativeExportTest(TestCase):
+
+    def write(self, directory, name, text):
+        path = os.path.join(directory, name)
+        with open(path, 'w', encoding='utf-8-sig') as csv_file:
+            csv_file.write(text)
+        return path
+
+    def test_transactions(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self.write(tmp, 'transactions.csv',
+                              'Market,Operation date,Action,Type,Rate,Amount,Value\n'
+                              'BTC-PLN,2019-01-05 22:25:34,ASK,TAKER,"14 440,01 PLN","0,36920290 BTC","5 331,29 PLN"\n'
+                              'ETH-PLN,2019-01-07 18:15:16,BID,MAKER,"573,00","25,10000000","14 382,30"\n')
+            rows = list(ExportMerger.iter_rows(path))
+
+        self.assertEqual(rows, [
+            HistoryConverter.HEADERS['transactions'],
+            ['BTC - PLN', '05-01-2019 22:25:34', 'Sprzedaż', 'Taker', '14440.01', '0.36920290', '5331.29'],
+            ['ETH - PLN', '07-01-2019 18:15:16', 'Kupno', 'Maker', '573.00', '25.10000000', '14382.30'],
+        ])
+
+    def test_operations_only_fees(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self.write(tmp, 'operations.csv',
+                              'Data operacji;Rodzaj;Wartość;Saldo przed;Saldo po;Waluta\n'
+                              '07.01.2019 18:15:17;Pobranie prowizji za transakcję;-0,06777;25,1;25,03223;ETH\n'
+                              '07.01.2019 18:15:16;Kupno;25,1;0;25,1;ETH\n'
+                              '05.01.2019 22:25:34;Pobranie prowizji za transakcję;-8,20;9163,21;9155,01;PLN\n'
+                              '04.01.2019 10:00:00;Wpłata;10 000,00;0;10 000,00;PLN\n')
+            rows = list(NativeExport.iter_rows(path))
+
+        self.assertEqual(rows, [
+            HistoryConverter.HEADERS['fees'],
+            ['07-01-2019 18:15:17', 'Pobranie prowizji za transakcję: ETH', '0.06777', '25.03223'],
+            ['05-01-2019 22:25:34', 'Pobranie prowizji za transakcję: PLN', '8.20', '9155.01'],
+        ])
+
+    def test_internal_format_unchanged(self):
+        path = os.path.join('sample_data', 'fees_history.csv')
+        self.assertIsNone(NativeExport.inspect(path)[2])
+        with open(path, encoding='utf-8') as csv_file:
+            self.assertEqual(list(NativeExport.iter_rows(path)), [line.rstrip('\n').split(';') for line in csv_file])
+
+    def test_extra_columns_kept(self):
+        headers = HistoryConverter.HEADERS['fees'] + ['ID']
+        rows = [['07-01-2019 18:15:17', 'Pobranie prowizji za transakcję: ETH', '0.06777', '25.03223', '1002'],
+                ['05-01-2019 22:25:34', 'Pobranie prowizji za transakcję: PLN', '8.20', '9155.01', '1001']]
+        with tempfile.TemporaryDirectory() as tmp:
+            HistoryConverter.write_csv(os.path.join(tmp, 'a.csv'), [headers] + rows)
+            HistoryConverter.write_csv(os.path.join(tmp, 'b.csv'), [headers] + rows[:1])
+            self.assertIsNone(NativeExport.inspect(os.path.join(tmp, 'a.csv'))[2])
+            self.assertEqual(list(ExportMerger.iter_rows(os.path.join(tmp, 'a.csv'))), [headers] + rows)
+            # Merged on the IDs
+            self.assertEqual(list(ExportMerger.iter_rows(tmp)), [headers] + rows)
+
+    def test_unknown_format(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaises(ValueError):
+                list(NativeExport.iter_rows(self.write(tmp, 'other.csv', 'a;b;c\n1;2;3\n')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for the differential testing of engines
+
+import unittest
+from unittest import TestCase
+
+from modules.HistoryGenerator import HistoryGenerator
+from modules.Oracle import Oracle, reference_engine
+
+
+def off_by_grosz_engine(transactions_data, fees_data):
+    data = reference_engine(transactions_data, fees_data)
+    col_idx = {header: i for i, header in enumerate(data[0])}
+    for row in data[1:]:
+        if row[col_idx['Rodzaj']] == 'Sprzedaż' and row[col_idx['Rynek']] == 'ETH - PLN':
+            row[col_idx['Koszt']] += '1'
+    return data
+
+
+class OracleTest(TestCase):
+
+    def test_generated_histories_are_valid(self):
+        generator = HistoryGenerator(1)
+        for _ in range(0, 20):
+            transactions_data, fees_data = HistoryGenerator.render(generator.generate(10))
+            self.assertEqual(len(transactions_data), len(fees_data))
+            self.assertIsInstance(Oracle.run(reference_engine, transactions_data, fees_data), list)
+
+    def test_compare_cell_by_cell(self):
+        expected = [['Rynek', 'Koszt'], ['BTC - PLN', '1.00']]
+        self.assertEqual(Oracle.compare(expected, [['Rynek', 'Koszt'], ['BTC - PLN', '1.00']]), [])
+        self.assertEqual(Oracle.compare(expected, [['Rynek', 'Koszt'], ['BTC - PLN', '1.01']]),
+                         ['row 1 "Koszt": expected "1.00", got "1.01"'])
+        self.assertEqual(Oracle.compare('AssertionError', 'AssertionError'), [])
+        self.assertEqual(len(Oracle.compare(expected, 'ValueError')), 1)
+
+    def test_shrink_to_minimal_case(self):
+        case, differences = Oracle.fuzz(off_by_grosz_engine, cases=50, seed=0, bursts=10)
+        # A single ETH sell is enough
+        self.assertEqual(len(case['entries']), 1)
+        self.assertEqual(case['entries'][0][0][0], 'ETH - PLN')
+        self.assertFalse(case['reversed'])
+        self.assertEqual(len(differences), 1)
+
+    def test_parallel_engine(self):
+        self.assertIsNone(Oracle.fuzz(Oracle.ENGINES['parallel'], cases=5, seed=0, bursts=10))
+
+
+if __name__ == '__main__':
+    unittest.main()
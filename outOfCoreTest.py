@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for the out-of-core calculations
+
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from modules.OutOfCore import RowSpill, LotQueue, LOT_BUFFER_SIZE
+from modules.Oracle import Oracle
+
+
+class OutOfCoreTest(TestCase):
+
+    def test_row_spill_both_directions(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            spill = RowSpill(tmp, 'rows', 3)
+            rows = [['row', str(i)] for i in range(0, 10)]
+            for row in rows:
+                spill.append(row)
+            self.assertEqual(len(spill.paths), 3)
+            self.assertEqual(list(spill.iter_rows()), rows)
+            self.assertEqual(list(spill.iter_rows(reverse=True)), rows[::-1])
+
+    def test_lot_queue(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            lots = LotQueue(os.path.join(tmp, 'lots.bin'))
+            lots.append(100, 5, 1)
+            lots.append(0, 7, 1)
+            lots.append(50, 3, 1)
+            lots.start_reading()
+            self.assertEqual(lots.sell(120), (120, 100 * 5 + 20 * 3))
+            # Shortfall
+            self.assertEqual(lots.sell(40), (30, 30 * 3))
+            self.assertEqual(lots.sell(1), (0, 0))
+            lots.close()
+
+    def test_lot_queue_of_many_buffers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            # More than a buffer of each of them, written alternately
+            queues = [LotQueue(os.path.join(tmp, 'lots_{}.bin'.format(i))) for i in range(0, 3)]
+            count = 2 * LOT_BUFFER_SIZE // LotQueue.RECORD.size + 7
+            for n in range(0, count):
+                for i in range(0, len(queues)):
+                    queues[i].append(1, i + 1, 1)
+            for i in range(0, len(queues)):
+                queues[i].start_reading()
+                self.assertEqual(queues[i].sell(count + 1), (count, count * (i + 1)))
+
+    def test_same_as_reference(self):
+        self.assertIsNone(Oracle.fuzz(Oracle.ENGINES['out_of_core'], cases=20, seed=1, bursts=15))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for the output sinks
+
+import csv
+import json
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from modules.OutputSinks import OutputSink, CsvSink, JsonLinesSink, PerYearCsvSink, SummarySink, write_to_sinks
+
+
+class OutputSinksTest(TestCase):
+
+    data_lol = [
+        ['Rynek', 'Data operacji', 'Rodzaj', 'Prowizja', 'Przychód', 'Koszt', 'Dochód', 'PCC'],
+        ['BTC - PLN', '30-06-2019 23:59:59', 'Kupno', '1.00', '', '', '', '10'],
+        ['ETH - PLN', '15-08-2019 12:00:00', 'Sprzedaż', '3.00', '50.00', '80.00', '-30.00', ''],
+        ['BTC - PLN', '01-01-2020 00:00:00', 'Sprzedaż', '4.00', '10.00', '5.00', '5.00', ''],
+    ]
+
+    def read_csv(self, path):
+        with open(path, newline='', encoding="utf-8") as csvfile:
+            return list(csv.reader(csvfile, delimiter=';'))
+
+    def test_all_sinks_in_one_pass(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            prefix = os.path.join(tmp, 'history_tax')
+            write_to_sinks(self.data_lol, [CsvSink(prefix + '.csv', [[], ['note']]), JsonLinesSink(prefix + '.jsonl'),
+                                           PerYearCsvSink(prefix), SummarySink(prefix + '_summary.csv')], batch_size=2)
+
+            self.assertEqual(self.read_csv(prefix + '.csv'), self.data_lol + [[], ['note']])
+            self.assertEqual(self.read_csv(prefix + '_2019.csv'), self.data_lol[0:3])
+            self.assertEqual(self.read_csv(prefix + '_2020.csv'), [self.data_lol[0], self.data_lol[3]])
+
+            with open(prefix + '.jsonl', encoding="utf-8") as jsonl:
+                rows = [json.loads(line) for line in jsonl]
+            self.assertEqual(len(rows), 3)
+            self.assertEqual(rows[1]['Dochód'], '-30.00')
+
+            summary = self.read_csv(prefix + '_summary.csv')
+            self.assertEqual(summary[0], ['Rok', 'Rynek', 'Przychód', 'Koszt', 'Dochód', 'PCC', 'Prowizja'])
+            self.assertIn(['2019', '*', '50.00', '80.00', '-30.00', '10.00', '4.00'], summary)
+            self.assertIn(['2020', 'BTC - PLN', '10.00', '5.00', '5.00', '0.00', '4.00'], summary)
+
+    def test_base_sink_discards_rows(self):
+        sink = OutputSink()
+        write_to_sinks(self.data_lol, [sink], batch_size=2)
+        self.assertEqual(sink.col_idx['Rynek'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for the parallel FIFO, it has to give exactly the serial results
+
+import copy
+import random
+import unittest
+from unittest import TestCase
+
+from modules.ParallelFifo import ParallelFifo
+from modules.Taxer import Taxer
+
+
+class ParallelFifoTest(TestCase):
+
+    headers = ['Rynek', 'Data operacji', 'Rodzaj', 'Typ', 'Kurs', 'Ilość', 'Wartość', 'Prowizja']
+
+    def get_data(self, seed, rows=200):
+        r = random.Random(seed)
+        data = [list(self.headers)]
+        for i in range(0, rows):
+            # Exact matches, partial fills, shortfalls and empty lots
+            amount = r.choice(['1', '0.5', '0', '{}.{:08d}'.format(r.randint(0, 3), r.randint(0, 10 ** 8 - 1))])
+            data.append([r.choice(['BTC - PLN', 'ETH - PLN']), '01-01-2019 10:{:02d}:{:02d}'.format(i // 60, i % 60),
+                         r.choice(['Kupno', 'Kupno', 'Sprzedaż']), 'Taker',
+                         '{}.{:02d}'.format(r.randint(100, 20000), r.randint(0, 99)), amount, '0', '0'])
+        return data
+
+    def test_same_as_serial(self):
+        for seed in range(0, 5):
+            data = self.get_data(seed)
+            serial = Taxer.calculate_gain_fifo(copy.deepcopy(data))
+            parallel = Taxer.calculate_gain_fifo(copy.deepcopy(data), workers=2, parallel_min_rows=0)
+            self.assertEqual(parallel, serial, seed)
+
+    def test_chunk_sizes(self):
+        data = self.get_data(7)
+        serial = Taxer.calculate_gain_fifo(copy.deepcopy(data))
+        col_idx = Taxer.get_col_indexes(data)
+        btc_rows = [row for row in data[1:] if row[0] == 'BTC - PLN']
+        expected = [row[-3:] for row in serial[1:] if row[0] == 'BTC - PLN' and row[2] == 'Sprzedaż']
+        for chunk_size in (1, 3, 1000):
+            gains = ParallelFifo.calculate_market(btc_rows, col_idx, workers=2, chunk_size=chunk_size)
+            self.assertEqual([[g['income'], g['cost'], g['gain']] for g in gains], expected, chunk_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for the memory-mapped crypto prices
+
+import os
+import tempfile
+import time
+import unittest
+from unittest import TestCase
+
+from modules.ExchangeRates import ExchangeRates
+from modules.Feeer import Feeer
+from modules.Money import Rate
+from modules.PriceIndex import PriceIndex
+from modules.Taxer import Taxer
+
+
+def get_timestamp(date_str):
+    return PriceIndex.get_timestamp(date_str, '%d-%m-%Y %H:%M:%S')
+
+
+class PriceIndexTest(TestCase):
+
+    def write_prices(self, path, prices):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('timestamp,open,high,low,close,volume\n')
+            for date_str, price in prices:
+                f.write('{},1,1,1,{},1\n'.format(get_timestamp(date_str), price))
+
+    def test_price_at_or_before(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'btc_pln.csv')
+            self.write_prices(path, [('01-01-2019 10:01:00', '15000.5'), ('01-01-2019 10:00:00', '15000')])
+            prices = PriceIndex.load(path)
+            self.assertEqual(prices.get_rate('01-01-2019 10:00:00'), Rate.parse('15000'))
+            self.assertEqual(prices.get_rate('01-01-2019 10:00:59'), Rate.parse('15000'))
+            self.assertEqual(prices.get_rate('02-01-2019 00:00:00'), Rate.parse('15000.5'))
+            with self.assertRaises(ValueError):
+                prices.get_rate('01-01-2019 09:59:59')
+            prices.close()
+
+            # Rebuilt when the history changes
+            self.write_prices(path, [('01-01-2019 09:00:00', '14000')])
+            prices = PriceIndex.load(path)
+            self.assertEqual(prices.get_rate('02-01-2019 00:00:00'), Rate.parse('14000'))
+            prices.close()
+
+    def set_tz(self, tz):
+        old_tz = os.environ.get('TZ')
+        os.environ['TZ'] = tz
+        time.tzset()
+
+        def restore():
+            if old_tz is None:
+                del os.environ['TZ']
+            else:
+                os.environ['TZ'] = old_tz
+            time.tzset()
+        self.addCleanup(restore)
+
+    @unittest.skipUnless(hasattr(time, 'tzset'), 'needs time.tzset')
+    def test_time_of_exchange(self):
+        # Dates are in the time of the exchange, whatever the machine is set to
+        self.set_tz('America/New_York')
+        # 10:00 in Warsaw: 09:00 UTC in the winter, 08:00 UTC in the summer
+        self.assertEqual(PriceIndex.parse_time('2019-01-01 10:00:00'), 1546333200)
+        self.assertEqual(PriceIndex.parse_time('2019-07-01 10:00:00'), 1561968000)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'btc_pln.csv')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('timestamp,close\n1546333200,15000\n1546333201,16000\n')
+            prices = PriceIndex.load(path)
+            self.assertEqual(prices.get_rate('01-01-2019 10:00:00'), Rate.parse('15000'))
+            with self.assertRaises(ValueError):
+                prices.get_rate('01-01-2019 09:59:59')
+            prices.close()
+
+    def test_crypto_quoted_gains_and_fees(self):
+        data_lol = [
+            ['Rynek', 'Data operacji', 'Rodzaj', 'Typ', 'Kurs', 'Ilość', 'Wartość'],
+            ['ETH - BTC', '01-01-2019 10:00:00', 'Kupno', 'Taker', '0.03', '1', '0.03'],
+            ['ETH - BTC', '02-01-2019 10:00:00', 'Sprzedaż', 'Taker', '0.04', '1', '0.04'],
+        ]
+        fees_lol = [
+            ['Data operacji', 'Rodzaj', 'Wartość', 'Saldo po'],
+            ['01-01-2019 10:00:00', 'Pobranie prowizji za transakcję', '0.001', '0'],
+            ['02-01-2019 10:00:00', 'Pobranie prowizji za transakcję', '0.0001', '0'],
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'btc_pln.csv')
+            self.write_prices(path, [('01-01-2019 00:00:00', '10000'), ('02-01-2019 00:00:00', '20000')])
+            rates = ExchangeRates(prices={'BTC': PriceIndex.load(path)})
+
+            data = Feeer.include_fees(data_lol, fees_lol, rates)
+            # 0.001 ETH x 0.03 BTC x 10000 PLN, 0.0001 BTC x 20000 PLN
+            self.assertEqual([row[-1] for row in data[1:]], ['0.30', '2.00'])
+
+            gains = Taxer.get_gains_for_row(data[2], data, rates)
+            self.assertEqual(gains, {'income': '800.00', 'cost': '300.00', 'gain': '500.00'})
+            rates.prices['BTC'].close()
+
+
+if __name__ == '__main__':
+    unittest.main()
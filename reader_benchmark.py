@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+# Reading a large transactions CSV: csv.reader + Decimal (the usual way) against FastCsv, text and typed rows.
+# The file is generated (random rows in the bitbay dialect) in a temporary directory.
+
+import argparse
+import csv
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+from modules.FastCsv import FastCsv
+from modules.HistoryConverter import HistoryConverter
+from modules.Money import Money, Amount, Rate
+
+HEADERS = HistoryConverter.HEADERS['transactions']
+NUMBER_COLUMNS = ['Kurs', 'Ilość', 'Wartość']
+
+
+def generate(path, rows):
+    r = random.Random(0)
+    with open(path, 'w', newline='', encoding="utf-8") as csvfile:
+        csvfile.write(';'.join(HEADERS) + '\n')
+        for i in range(0, rows):
+            # As in the exports: rates and values in PLN with 2 decimal places, amounts with 8
+            csvfile.write('BTC - PLN;{:02d}-01-2019 10:{:02d}:{:02d};{};Taker;{}.{:02d};0.{:08d};{}.{:02d}\n'.format(
+                1 + i % 28, i // 60 % 60, i % 60, r.choice(['Kupno', 'Sprzedaż']), r.randint(1000, 99999),
+                r.randint(0, 99), r.randint(0, 10 ** 8 - 1), r.randint(0, 99999), r.randint(0, 99)))
+
+
+def read_csv_decimal(path):
+    positions = [HEADERS.index(column) for column in NUMBER_COLUMNS]
+    data = []
+    with open(path, newline='', encoding="utf-8") as csvfile:
+        for row in csv.reader(csvfile, delimiter=';'):
+            data.append(row)
+    for row in data[1:]:
+        for position in positions:
+            row[position] = Decimal(row[position])
+    return data
+
+
+def read_csv_text(path):
+    with open(path, newline='', encoding="utf-8") as csvfile:
+        return list(csv.reader(csvfile, delimiter=';'))
+
+
+def read_fast_typed(path):
+    types = {'Kurs': Rate, 'Ilość': Amount, 'Wartość': Money}
+    return list(FastCsv.iter_rows(path, HEADERS, types))
+
+
+def read_fast_text(path):
+    return list(FastCsv.iter_rows(path, HEADERS))
+
+
+def measure(function, path, runs):
+    """
+    :return: Median wall time in s
+    """
+    times = []
+    for _ in range(0, runs):
+        start = time.perf_counter()
+        function(path)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Reading benchmark of the bitbay CSV dialect')
+    ap.add_argument('--rows', type=int, default=2000000, help='Rows of the generated file')
+    ap.add_argument('--runs', type=int, default=3, help='Runs per reader')
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'transactions_history.csv')
+        generate(path, args.rows)
+        print('{} rows, {:.1f} MB'.format(args.rows, os.path.getsize(path) / 1024 / 1024))
+        print('{:<28} {:>8} {:>12}'.format('reader', 's', 'rows/s'))
+        for name, function in [('csv.reader', read_csv_text), ('FastCsv', read_fast_text),
+                               ('csv.reader + Decimal', read_csv_decimal), ('FastCsv typed', read_fast_typed)]:
+            seconds = measure(function, path, args.runs)
+            print('{:<28} {:>8.2f} {:>12.0f}'.format(name, seconds, args.rows / seconds))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
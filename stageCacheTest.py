@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for the cache of the pipeline stages
+
+import os
+import tempfile
+import time
+import unittest
+from unittest import TestCase
+
+import modules.Taxer
+from modules.StageCache import StageCache
+
+
+class StageCacheTest(TestCase):
+
+    def test_chain_skips_cached_stages(self):
+        calls = []
+
+        def stage(name):
+            return lambda value: calls.append(name) or value + [name]
+
+        stages = [(name, [modules.Taxer], stage(name)) for name in ['a', 'b', 'c']]
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = StageCache(tmp)
+            self.assertEqual(cache.run_chain(stages, 'input', []), ['a', 'b', 'c'])
+            self.assertEqual(calls, ['a', 'b', 'c'])
+
+            # Nothing runs again, not even the chain input is needed
+            self.assertEqual(cache.run_chain(stages, 'input', None), ['a', 'b', 'c'])
+            self.assertEqual(calls, ['a', 'b', 'c'])
+
+            # A changed last stage runs from the output of the one before
+            changed = stages[:2] + [('d', [modules.Taxer], stage('d'))]
+            self.assertEqual(cache.run_chain(changed, 'input', None), ['a', 'b', 'd'])
+            self.assertEqual(calls, ['a', 'b', 'c', 'd'])
+
+            # Another input runs everything
+            self.assertEqual(cache.run_chain(stages, 'other', ['x']), ['x', 'a', 'b', 'c'])
+
+    def test_least_recently_used_evicted(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = StageCache(tmp)
+            cache.put('first', 'x' * 100)
+            entry_size = os.path.getsize(cache.get_path('first'))
+            cache.max_bytes = 2 * entry_size
+
+            cache.put('second', 'y' * 100)
+            os.utime(cache.get_path('first'), (time.time() - 20, time.time() - 20))
+            os.utime(cache.get_path('second'), (time.time() - 10, time.time() - 10))
+            # Used, so the second one is the least recently used now
+            self.assertEqual(cache.get('first'), (True, 'x' * 100))
+
+            cache.put('third', 'z' * 100)
+            self.assertEqual(cache.get('second'), (False, None))
+            self.assertEqual(cache.get('first'), (True, 'x' * 100))
+            self.assertEqual(cache.get('third'), (True, 'z' * 100))
+
+
+if __name__ == '__main__':
+    unittest.main()
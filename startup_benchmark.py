@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# mk (c) 2018
+
+# Start-up time of bitbay_taxer.py subcommands, so that import cost doesn't creep back.
+# Every run is a fresh interpreter: python bitbay_taxer.py <command> --help
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from bitbay_taxer import COMMANDS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Nothing of these should be imported just to start up
+HEAVY_MODULES = ['pandas', 'googleapiclient', 'google_auth_oauthlib', 'google.auth', 'urllib.request']
+
+
+def measure(command, runs):
+    """
+    :return: List of wall times in ms
+    """
+    argv = [sys.executable, os.path.join(HERE, 'bitbay_taxer.py')] + ([command] if command else []) + ['--help']
+    times = []
+    for _ in range(0, runs):
+        start = time.perf_counter()
+        subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False, cwd=HERE)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def get_heavy_imports(command):
+    """
+    :return: Heavy modules imported by parsing the command line of a subcommand
+    """
+    code = ('import sys, bitbay_taxer; bitbay_taxer.get_arg_parser({!r}); '
+            'print(" ".join(m for m in {!r} if m in sys.modules))').format([command] if command else [],
+                                                                           HEAVY_MODULES)
+    output = subprocess.run([sys.executable, '-c', code], cwd=HERE, stdout=subprocess.PIPE, check=True)
+    return output.stdout.decode().split()
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Start-up time benchmark of the bitbay-taxer subcommands')
+    ap.add_argument('--runs', type=int, default=10, help='Runs per subcommand')
+    ap.add_argument('--max-ms', type=float, help='Fail (exit 1) if any median start-up time is above this')
+    args = ap.parse_args()
+
+    failed = False
+    baseline = statistics.median(measure(None, args.runs))
+    print('{:<12} {:>10}'.format('command', 'median ms'))
+    print('{:<12} {:>10.1f}'.format('(none)', baseline))
+    for command in COMMANDS:
+        median = statistics.median(measure(command, args.runs))
+        heavy = get_heavy_imports(command)
+        print('{:<12} {:>10.1f} {}'.format(command, median, ' '.join(heavy)))
+        if args.max_ms is not None and median > args.max_ms:
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
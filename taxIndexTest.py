@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for the prefix sums index
+
+import unittest
+from unittest import TestCase
+
+from modules.TaxIndex import TaxIndex
+from modules.Money import Money
+
+
+class TaxIndexTest(TestCase):
+
+    data_lol = [
+        ['Rynek', 'Data operacji', 'Rodzaj', 'Prowizja', 'Przychód', 'Koszt', 'Dochód', 'PCC'],
+        ['BTC - PLN', '30-06-2019 23:59:59', 'Kupno', '1.00', '', '', '', '10'],
+        ['BTC - PLN', '01-07-2019 00:00:00', 'Sprzedaż', '2.00', '200.00', '100.00', '100.00', ''],
+        ['ETH - PLN', '15-08-2019 12:00:00', 'Sprzedaż', '3.00', '50.00', '80.00', '-30.00', ''],
+        ['BTC - PLN', '01-01-2020 00:00:00', 'Sprzedaż', '4.00', '10.00', '5.00', '5.00', ''],
+    ]
+
+    def test_query_period_all_markets(self):
+        index = TaxIndex.build(self.data_lol)
+        totals = index.query(date_from='2019-07-01', date_to='2019-10-01')
+        self.assertEqual(totals['Przychód'], Money.parse('250.00'))
+        self.assertEqual(totals['Dochód'], Money.parse('70.00'))
+        self.assertEqual(totals['Prowizja'], Money.parse('5.00'))
+        self.assertEqual(totals['PCC'], Money(0))
+
+    def test_query_year_market(self):
+        index = TaxIndex.build(self.data_lol)
+        totals = index.query_year(2019, 'BTC - PLN')
+        self.assertEqual(totals['Koszt'], Money.parse('100.00'))
+        self.assertEqual(totals['PCC'], Money.parse('10'))
+        self.assertEqual(index.get_years(), [2019, 2020])
+
+    def test_unknown_market(self):
+        index = TaxIndex.build(self.data_lol)
+        self.assertEqual(index.query('XRP - PLN')['Przychód'], Money(0))
+
+    def test_added_in_any_order(self):
+        col_idx = {column: i for i, column in enumerate(self.data_lol[0])}
+        index = TaxIndex()
+        for row in reversed(self.data_lol[1:] + [self.data_lol[2]]):
+            index.add(row[0], TaxIndex.date_to_key(row[1]), TaxIndex.get_values(row, col_idx))
+        self.assertEqual(index.markets, TaxIndex.build(self.data_lol + [self.data_lol[2]]).markets)
+        self.assertEqual(index.query_year(2019, 'BTC - PLN')['Przychód'], Money.parse('400.00'))
+
+
+if __name__ == '__main__':
+    unittest.main()
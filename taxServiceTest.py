@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for the warm tax service
+
+import csv
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from modules.TaxService import TaxService
+from modules.TaxIndex import TaxIndex
+from modules.Money import Money
+from modules.HistoryGenerator import HistoryGenerator
+from modules.Oracle import Oracle, reference_engine
+
+
+class TaxServiceTest(TestCase):
+
+    @staticmethod
+    def write_csv(path, data):
+        with open(path, 'w', newline='', encoding="utf-8") as csvfile:
+            csv.writer(csvfile, delimiter=';').writerows(data)
+
+    @staticmethod
+    def get_expected_totals(transactions_data, fees_data):
+        rows = Oracle.run(reference_engine, transactions_data, fees_data)
+        totals = {}
+        for column in TaxIndex.COLUMNS:
+            idx = rows[0].index(column)
+            totals[column] = str(Money(sum(Money.parse(row[idx]).units for row in rows[1:] if row[idx])))
+        return totals
+
+    def test_append_same_as_full_calculation(self):
+        for seed in range(0, 5):
+            case = HistoryGenerator(seed).generate(20)
+            case['reversed'] = False
+            transactions_data, fees_data = HistoryGenerator.render(case)
+            # Split between bursts, so that every fee stays with its trades
+            split = len(transactions_data) // 2
+            while transactions_data[split][1] == transactions_data[split - 1][1]:
+                split += 1
+
+            with tempfile.TemporaryDirectory() as tmp:
+                transactions_path = os.path.join(tmp, 'transactions.csv')
+                fees_path = os.path.join(tmp, 'fees.csv')
+                self.write_csv(transactions_path, transactions_data[:split])
+                self.write_csv(fees_path, fees_data[:split])
+
+                service = TaxService()
+                service.add_account('test', transactions_path, fees_path)
+                service.get_totals('test')
+                self.assertEqual(service.append('test', transactions_data[split:], fees_data[split:]),
+                                 len(transactions_data) - split)
+                self.assertEqual(service.get_totals('test'), self.get_expected_totals(transactions_data, fees_data))
+
+    def test_files_changed_after_append(self):
+        case = HistoryGenerator(1).generate(10)
+        case['reversed'] = False
+        transactions_data, fees_data = HistoryGenerator.render(case)
+        with tempfile.TemporaryDirectory() as tmp:
+            transactions_path = os.path.join(tmp, 'transactions.csv')
+            fees_path = os.path.join(tmp, 'fees.csv')
+            self.write_csv(transactions_path, transactions_data[:2])
+            self.write_csv(fees_path, fees_data[:2])
+
+            service = TaxService()
+            service.add_account('test', transactions_path, fees_path)
+            service.append('test', transactions_data[2:3], fees_data[2:3])
+
+            # The full files replace the warm state with the appended rows
+            self.write_csv(transactions_path, transactions_data)
+            self.write_csv(fees_path, fees_data)
+            self.assertEqual(len(service.get_rows('test')), len(transactions_data))
+            self.assertEqual(service.get_totals('test'), self.get_expected_totals(transactions_data, fees_data))
+
+
+if __name__ == '__main__':
+    unittest.main()
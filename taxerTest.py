@@ -91,6 +91,29 @@ class TaxerTest(TestCase):
         gains = taxer.get_gains_for_row(sell_row, data_lol)
         self.assertEqual(gains, {'income': '2000.00', 'cost': '1000.00', 'gain': '1000.00'})
 
+    def test_get_gains_for_row_match_uses_up_buy(self):
+        data_lol = [
+            ['Rynek', 'Data operacji', 'Rodzaj', 'Typ', 'Kurs', 'Ilość', 'Wartość'],
+            ['BTC-PLN', 'some date', 'Kupno', 'some type', '1000', '1', '1000'],
+            ['BTC-PLN', 'some date', 'Kupno', 'some type', '2000', '1', '2000'],
+            ['BTC-PLN', 'some date', 'Sprzedaż', 'some type', '3000', '1', '3000'],
+            ['BTC-PLN', 'some date', 'Sprzedaż', 'some type', '3000', '1', '3000'],
+        ]
+        taxer = Taxer()
+        taxer.get_gains_for_row(data_lol[3], data_lol)
+        gains = taxer.get_gains_for_row(data_lol[4], data_lol)
+        self.assertEqual(gains, {'income': '3000.00', 'cost': '2000.00', 'gain': '1000.00'})
+
+    def test_calculate_pcc_rounding(self):
+        data_lol = [
+            ['Rynek', 'Data operacji', 'Rodzaj', 'Typ', 'Kurs', 'Ilość', 'Wartość', 'Prowizja'],
+            ['BTC-PLN', 'some date', 'Kupno', 'some type', '1000', '1', '1000.00', '49.99'],
+            ['BTC-PLN', 'some date', 'Kupno', 'some type', '1000', '1', '1000.00', '50.00'],
+            ['BTC-PLN', 'some date', 'Sprzedaż', 'some type', '1000', '1', '1000.00', '1.00'],
+        ]
+        data = Taxer.calculate_pcc(data_lol)
+        self.assertEqual([row[-1] for row in data], ['PCC', '10', '11', ''])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# mk (C) 2018
+# Tests for the year-to-date tracker
+
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from modules.YtdTracker import YtdTracker
+from modules.HistoryGenerator import HistoryGenerator
+from modules.Oracle import Oracle, reference_engine
+
+
+class YtdTrackerTest(TestCase):
+
+    def test_same_as_full_calculation(self):
+        checked = 0
+        for seed in range(0, 10):
+            case = HistoryGenerator(seed).generate(15)
+            expected = Oracle.run(reference_engine, *HistoryGenerator.render(dict(case, reversed=False)))
+            with tempfile.TemporaryDirectory() as tmp:
+                tracker = YtdTracker(os.path.join(tmp, 'ytd.json'), compact_every=4)
+                rows = [tracker.add(tran_row, fees_row) for tran_row, fees_row in case['entries']]
+            # Only the full calculation takes from later BUYs when there are not enough of them
+            if not tracker.ledger.shortfall:
+                # Trades come with their own fees here, the heuristic can pair fees of a burst differently
+                self.assertEqual([row[:7] + row[8:11] for row in rows], [row[:7] + row[8:11] for row in expected[1:]])
+                checked += 1
+        self.assertTrue(checked)
+
+    def test_restart(self):
+        entries = HistoryGenerator(1).generate(10)['entries']
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'ytd.json')
+            tracker = YtdTracker(path, compact_every=3)
+            for tran_row, fees_row in entries[:7]:
+                tracker.add(tran_row, fees_row)
+            # A trade cut in the middle of writing
+            with open(path + '.journal', 'a', encoding='utf-8') as journal_file:
+                journal_file.write('[8, ["BTC')
+
+            # No compaction after the restart, the journal has to stay readable as it is
+            restarted = YtdTracker(path, compact_every=100)
+            self.assertTrue(restarted.load())
+            self.assertEqual(restarted.trades, 7)
+            self.assertEqual(restarted.get_totals(), tracker.get_totals())
+
+            # Trades after the restart go after the last complete one
+            for tran_row, fees_row in entries[7:]:
+                restarted.add(tran_row, fees_row)
+            with self.assertRaises(ValueError):
+                restarted.add(*entries[0])
+
+            reference = YtdTracker(os.path.join(tmp, 'reference.json'))
+            for tran_row, fees_row in entries:
+                reference.add(tran_row, fees_row)
+            loaded = YtdTracker(path, compact_every=100)
+            self.assertTrue(loaded.load())
+            self.assertEqual(loaded.trades, len(entries))
+            self.assertEqual(loaded.get_totals(), reference.get_totals())
+
+    def test_from_rows(self):
+        case = HistoryGenerator(2).generate(10)
+        rows = Oracle.run(reference_engine, *HistoryGenerator.render(case))
+        with tempfile.TemporaryDirectory() as tmp:
+            tracker = YtdTracker.from_rows(os.path.join(tmp, 'ytd.json'), rows)
+            loaded = YtdTracker(os.path.join(tmp, 'ytd.json'))
+            loaded.load()
+        self.assertEqual(loaded.get_totals(), tracker.get_totals())
+        self.assertEqual(loaded.ledger.lots, tracker.ledger.lots)
+
+
+if __name__ == '__main__':
+    unittest.main()